@@ -0,0 +1,171 @@
+# ann_index.py
+import math
+import faiss
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+INDEX_FLAT = "flat"
+INDEX_IVF = "ivf"
+INDEX_HNSW = "hnsw"
+INDEX_KINDS = (INDEX_FLAT, INDEX_IVF, INDEX_HNSW)
+
+
+def default_nlist(num_vectors: int) -> int:
+    """Number of IVF cells for a corpus size (the usual ~4*sqrt(n) rule)"""
+    return max(1, min(65536, int(4 * math.sqrt(max(num_vectors, 1)))))
+
+
+def build_index(kind: str, dim: int, num_vectors: int = 0, hnsw_m: int = 32,
+                ef_construction: int = 200, nlist: Optional[int] = None) -> faiss.Index:
+    """Create an empty index of the given kind that accepts add_with_ids.
+
+    IVF indexes still need ``train`` before vectors can be added.
+    """
+    if kind == INDEX_FLAT:
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    if kind == INDEX_HNSW:
+        hnsw = faiss.IndexHNSWFlat(dim, hnsw_m)
+        hnsw.hnsw.efConstruction = ef_construction
+        return faiss.IndexIDMap2(hnsw)
+    if kind == INDEX_IVF:
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist or default_nlist(num_vectors))
+        # The index must own the quantizer once this function returns
+        index.own_fields = True
+        quantizer.this.disown()
+        return index
+    raise ValueError(f"Unsupported index type: {kind}")
+
+
+def index_kind(index: faiss.Index) -> str:
+    """Work out which of the supported kinds an index is"""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexHNSWFlat):
+        return INDEX_HNSW
+    if isinstance(inner, faiss.IndexIVFFlat):
+        return INDEX_IVF
+    return INDEX_FLAT
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    """HNSW graphs cannot drop vectors; deletions must be tombstoned instead"""
+    return index_kind(index) != INDEX_HNSW
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Apply the recall/latency knobs that make sense for the index kind"""
+    params = faiss.ParameterSpace()
+    kind = index_kind(index)
+    if kind == INDEX_IVF and nprobe:
+        params.set_index_parameter(index, "nprobe", min(nprobe, faiss.extract_index_ivf(index).nlist))
+    elif kind == INDEX_HNSW and ef_search:
+        params.set_index_parameter(index, "efSearch", ef_search)
+
+
+def excluding_params(index: faiss.Index, excluded: np.ndarray) -> faiss.SearchParameters:
+    """Search parameters that skip the given labels inside the index search.
+
+    Carries the index's current nprobe/efSearch, since search parameters
+    override them.
+    """
+    kind = index_kind(index)
+    if kind == INDEX_IVF:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = faiss.extract_index_ivf(index).nprobe
+    elif kind == INDEX_HNSW:
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = faiss.downcast_index(index.index).hnsw.efSearch
+    else:
+        params = faiss.SearchParameters()
+    batch = faiss.IDSelectorBatch(np.asarray(excluded, dtype=np.int64))
+    params.sel = faiss.IDSelectorNot(batch)
+    # The parameters only hold pointers; keep the selectors alive with them
+    params.referenced_objects = [batch, params.sel]
+    return params
+
+
+def labels_of(index: faiss.Index) -> np.ndarray:
+    """Return every label stored in an id-mapped or IVF index"""
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    parts = [faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy()
+             for l in range(ivf.nlist) if invlists.list_size(l)]
+    return np.concatenate(parts).astype(np.int64) if parts else np.zeros(0, dtype=np.int64)
+
+
+def reconstruct_all(index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (labels, vectors) for every vector stored in the index"""
+    dim = index.d
+    if isinstance(index, faiss.IndexIDMap2):
+        labels = labels_of(index)
+        if not len(labels):
+            return labels, np.zeros((0, dim), dtype=np.float32)
+        return labels, index.index.reconstruct_n(0, index.ntotal)
+
+    # IVF-Flat stores raw float32 vectors in its inverted lists
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    labels, vectors = [], []
+    for l in range(ivf.nlist):
+        n = invlists.list_size(l)
+        if not n:
+            continue
+        labels.append(faiss.rev_swig_ptr(invlists.get_ids(l), n).copy())
+        codes = faiss.rev_swig_ptr(invlists.get_codes(l), n * ivf.code_size).copy()
+        vectors.append(codes.view(np.float32).reshape(n, dim))
+    if not labels:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, dim), dtype=np.float32)
+    return np.concatenate(labels).astype(np.int64), np.vstack(vectors)
+
+
+def build_populated(kind: str, labels: np.ndarray, vectors: np.ndarray, **params) -> faiss.Index:
+    """Build an index of the given kind holding the given vectors (training IVF on them)"""
+    index = build_index(kind, vectors.shape[1], num_vectors=len(vectors), **params)
+    if kind == INDEX_IVF:
+        nlist = faiss.extract_index_ivf(index).nlist
+        # Train on a sample: ~256 points per cell is plenty for k-means
+        sample_size = min(len(vectors), nlist * 256)
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), sample_size, replace=False)]
+        index.train(sample)
+    if len(vectors):
+        index.add_with_ids(vectors, labels)
+    return index
+
+
+def exact_neighbors(queries: np.ndarray, labels: np.ndarray, vectors: np.ndarray, k: int) -> np.ndarray:
+    """Brute-force top-k labels for each query (ground truth for recall checks)"""
+    k = min(k, len(vectors))
+    _, positions = faiss.knn(queries, vectors, k)
+    return labels[positions]
+
+
+def recall_at_k(candidate: faiss.Index, queries: np.ndarray, expected: np.ndarray) -> float:
+    """Fraction of the exact top-k neighbours the candidate index also returns"""
+    if not len(queries):
+        return 1.0
+    _, found = candidate.search(queries, expected.shape[1])
+    hits = sum(len(set(exp_row.tolist()) & set(found_row.tolist()))
+               for exp_row, found_row in zip(expected, found))
+    return hits / expected.size
+
+
+def tune_for_recall(candidate: faiss.Index, queries: np.ndarray, expected: np.ndarray,
+                    min_recall: float, nprobe: int = 8, ef_search: int = 64) -> Dict:
+    """Raise nprobe/efSearch until the candidate reaches min_recall on the sample.
+
+    Returns the chosen parameter and the recall measured with it.
+    """
+    kind = index_kind(candidate)
+    if kind == INDEX_FLAT:
+        return {"recall": 1.0}
+    limit = faiss.extract_index_ivf(candidate).nlist if kind == INDEX_IVF else 4096
+    value = min(nprobe if kind == INDEX_IVF else ef_search, limit)
+    while True:
+        set_search_params(candidate, nprobe=value, ef_search=value)
+        recall = recall_at_k(candidate, queries, expected)
+        if recall >= min_recall or value >= limit:
+            break
+        value = min(value * 2, limit)
+    return {"nprobe" if kind == INDEX_IVF else "ef_search": value, "recall": round(recall, 4)}
@@ -0,0 +1,113 @@
+# answer_cache.py
+import os
+import re
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class AnswerCache:
+    """In-memory cache of answers to standalone questions.
+
+    Lookups try an exact match on the normalized question text first, then
+    the cached question whose embedding is most similar (cosine) to the new
+    one, if it is above ``similarity_threshold``. Entries expire after
+    ``ttl`` seconds and the least recently used ones are evicted beyond
+    ``max_entries``. Every entry is tagged with the vector store version it
+    was answered from, and the cache empties itself when that changes.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None,
+                 similarity_threshold: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv("ANSWER_CACHE_SIZE", 1000))
+        self.ttl = ttl or float(os.getenv("ANSWER_CACHE_TTL", 3600))
+        self.similarity_threshold = similarity_threshold or float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # normalized question -> (answer, unit embedding or None, stored at)
+        self._version = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Lower-case, collapse whitespace and drop trailing punctuation"""
+        return re.sub(r'\s+', ' ', question).strip().lower().rstrip('?!. ')
+
+    def _sync_version(self, version):
+        """Drop everything answered from a different vector store version (caller holds the lock)"""
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def _expire(self):
+        """Drop expired entries (caller holds the lock)"""
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, (_, _, stored_at) in self._entries.items() if stored_at < cutoff]:
+            del self._entries[key]
+
+    def get_exact(self, question: str, version=None) -> Optional[Dict]:
+        """Return the cached answer for the same normalized question"""
+        key = self.normalize(question)
+        with self._lock:
+            self._sync_version(version)
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return dict(entry[0])
+
+    def get_similar(self, embedding: List[float], version=None) -> Optional[Dict]:
+        """Return the answer to the most similar cached question above the threshold"""
+        query = self._unit(embedding)
+        with self._lock:
+            self._sync_version(version)
+            self._expire()
+            keys = [key for key, entry in self._entries.items() if entry[1] is not None]
+            if keys:
+                matrix = np.vstack([self._entries[key][1] for key in keys])
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.semantic_hits += 1
+                    return dict(self._entries[keys[best]][0])
+            self.misses += 1
+            return None
+
+    def put(self, question: str, answer: Dict, embedding: Optional[List[float]] = None, version=None):
+        """Cache an answer, with the question embedding for the semantic layer"""
+        key = self.normalize(question)
+        unit = self._unit(embedding) if embedding is not None else None
+        with self._lock:
+            # The store changed while this answer was being generated
+            if version != self._version:
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = (dict(answer), unit, time.monotonic())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters since startup"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+            }
@@ -1,10 +1,8 @@
 # appwrite_client.py
 import os
-from appwrite.client import Client
-from appwrite.services.storage import Storage
 import tempfile
 import mimetypes
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,6 +10,10 @@ load_dotenv()
 class AppwriteClient:
     def __init__(self):
         """Initialize the Appwrite client"""
+        # The SDK is imported here rather than at module load, which is slow
+        from appwrite.client import Client
+        from appwrite.services.storage import Storage
+        
         # Create a client
         self.client = Client()
         
@@ -34,6 +36,28 @@ class AppwriteClient:
             print(f"Error listing documents: {e}")
             return {"files": []}
     
+    def list_all_documents(self, page_size: int = 100) -> Iterator[Dict[str, Any]]:
+        """Iterate over every document in the bucket, following pagination.
+        
+        Errors are raised rather than swallowed so callers can tell a partial
+        listing apart from an empty bucket.
+        """
+        from appwrite.query import Query
+        
+        cursor = None
+        while True:
+            queries = [Query.limit(page_size)]
+            if cursor:
+                queries.append(Query.cursor_after(cursor))
+            result = self.storage.list_files(self.bucket_id, queries=queries)
+            
+            files = result.get("files", [])
+            yield from files
+            
+            if len(files) < page_size:
+                return
+            cursor = files[-1]["$id"]
+    
     def download_document(self, file_id):
         """Download a document from Appwrite storage"""
         try:
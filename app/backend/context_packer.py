@@ -0,0 +1,100 @@
+# context_packer.py
+import os
+from typing import Dict, List, Optional
+from backend.conversation_memory import estimate_tokens
+from backend.lexical_index import tokenize
+
+
+class ContextPacker:
+    """Turn ranked search results into a compact, diverse prompt context.
+
+    1. Chunks of the same file that overlap or touch (by ``start_index``)
+       are merged into one passage, so overlap text is sent once.
+    2. Passages are picked by maximal marginal relevance: rank-based
+       relevance traded off (``mmr_lambda``) against the share of their
+       words already covered by a picked passage, so near-duplicates lose
+       to new information; passages that are almost entirely covered
+       (``duplicate_coverage``) are dropped.
+    3. Picked passages are added until ``token_budget`` is reached; the
+       last one is cut at a word boundary if it does not fit.
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, mmr_lambda: Optional[float] = None,
+                 duplicate_coverage: float = 0.9, min_fragment_tokens: int = 50):
+        self.token_budget = token_budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+        self.mmr_lambda = mmr_lambda if mmr_lambda is not None else float(os.getenv("CONTEXT_MMR_LAMBDA", 0.7))
+        self.duplicate_coverage = duplicate_coverage
+        # Don't bother sending a truncated passage shorter than this
+        self.min_fragment_tokens = min_fragment_tokens
+
+    def pack(self, results: List[Dict]) -> List[Dict]:
+        """Merge, diversify and budget search results (best first)"""
+        passages = self._merge(results)
+        packed = []
+        remaining = self.token_budget
+        for passage in self._mmr(passages):
+            tokens = estimate_tokens(passage["content"])
+            if tokens > remaining:
+                if remaining >= self.min_fragment_tokens:
+                    packed.append({**passage, "content": self._truncate(passage["content"], remaining)})
+                break
+            packed.append(passage)
+            remaining -= tokens
+        return packed
+
+    @staticmethod
+    def _merge(results: List[Dict]) -> List[Dict]:
+        """Merge overlapping or adjacent chunks of the same file; keeps the best rank of each group"""
+        passages = []
+        spans = {}   # file_id -> [[start, end, passage]]
+        for rank, result in enumerate(results):
+            metadata = result.get("metadata") or {}
+            file_id, start = metadata.get("file_id"), metadata.get("start_index")
+            passage = {**result, "rank": rank}
+            if file_id is None or start is None:
+                passages.append(passage)
+                continue
+            end = start + len(result["content"])
+            for span in spans.get(file_id, []):
+                span_start, span_end, merged = span
+                if start > span_end or end < span_start:
+                    continue
+                # Stitch the texts together on their shared offsets
+                if start < span_start:
+                    merged["content"] = result["content"][:span_start - start] + merged["content"]
+                    merged["metadata"] = metadata
+                    span_start = start
+                if end > span_end:
+                    merged["content"] += result["content"][span_end - start:]
+                    span_end = end
+                span[0], span[1] = span_start, span_end
+                break
+            else:
+                spans.setdefault(file_id, []).append([start, end, passage])
+                passages.append(passage)
+        return passages
+
+    def _mmr(self, passages: List[Dict]) -> List[Dict]:
+        """Order passages by maximal marginal relevance"""
+        count = len(passages)
+        relevance = [1.0 - passage["rank"] / count for passage in passages]
+        words = [set(tokenize(passage["content"])) for passage in passages]
+        ordered = []
+        remaining = list(range(count))
+        while remaining:
+            redundancy = {i: max((len(words[i] & words[j]) / (len(words[i]) or 1) for j in ordered), default=0.0)
+                          for i in remaining}
+            remaining = [i for i in remaining if redundancy[i] < self.duplicate_coverage]
+            if not remaining:
+                break
+            best = max(remaining, key=lambda i: self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy[i])
+            ordered.append(best)
+            remaining.remove(best)
+        return [{key: value for key, value in passages[i].items() if key != "rank"} for i in ordered]
+
+    @staticmethod
+    def _truncate(text: str, tokens: int) -> str:
+        """Cut text to about ``tokens`` tokens at a word boundary"""
+        cut = text[:tokens * 4]
+        space = cut.rfind(" ")
+        return (cut[:space] if space > 0 else cut).rstrip() + " ..."
@@ -0,0 +1,117 @@
+# conversation_memory.py
+import logging
+import threading
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Tuple
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) that needs no API call"""
+    return len(text) // 4 + 1
+
+
+class RollingSummaryMemory:
+    """Conversation memory that keeps recent turns verbatim within a token budget.
+
+    When the verbatim turns exceed ``token_budget`` the oldest ones are
+    folded into a running summary by ``summarize(summary, turns)`` on
+    ``executor``, so the request that saved the turn never waits for it.
+    Until the summary catches up, folded turns are still returned verbatim.
+    Without a summarizer every turn is kept, like ConversationBufferMemory.
+
+    Exposes the ``load_memory_variables``/``save_context`` interface of the
+    LangChain memories it replaces.
+    """
+
+    def __init__(self, token_budget: int = 1500,
+                 summarize: Optional[Callable[[str, List[Tuple[str, str]]], str]] = None,
+                 executor: Optional[Executor] = None, memory_key: str = "chat_history"):
+        self.token_budget = token_budget
+        self.memory_key = memory_key
+        self._summarize = summarize
+        self._executor = executor
+        self._lock = threading.Lock()
+        self.summary = ""
+        self._turns = []          # (question, answer) kept verbatim
+        self._turn_tokens = 0
+        self._folding = []        # turns evicted from the window, not yet in the summary
+        self._folding_tokens = 0
+        self._summarizing = False
+
+    @staticmethod
+    def _tokens(turn: Tuple[str, str]) -> int:
+        return estimate_tokens(turn[0]) + estimate_tokens(turn[1])
+
+    def save_context(self, inputs: Dict, outputs: Dict):
+        """Record a turn, scheduling a summary update if the window overflowed"""
+        turn = (inputs["input"], outputs["output"])
+        with self._lock:
+            self._turns.append(turn)
+            self._turn_tokens += self._tokens(turn)
+            if self._summarize is None:
+                return
+            # Always keep the latest turn verbatim
+            while len(self._turns) > 1 and self._turn_tokens > self.token_budget:
+                old = self._turns.pop(0)
+                self._turn_tokens -= self._tokens(old)
+                self._folding.append(old)
+                self._folding_tokens += self._tokens(old)
+            # If the summarizer keeps failing, drop the oldest folded turns
+            # rather than let the prompt grow
+            while len(self._folding) > 1 and self._folding_tokens > self.token_budget:
+                self._folding_tokens -= self._tokens(self._folding.pop(0))
+            if not self._folding or self._summarizing:
+                return
+            self._summarizing = True
+        self._executor.submit(self._fold)
+
+    def _fold(self):
+        """Fold pending turns into the summary until none are left"""
+        while True:
+            with self._lock:
+                batch, summary = list(self._folding), self.summary
+                if not batch:
+                    self._summarizing = False
+                    return
+            try:
+                new_summary = self._summarize(summary, batch)
+            except Exception as e:
+                logger.error(f"Error summarizing conversation: {e}")
+                with self._lock:
+                    # Retried on the next saved turn
+                    self._summarizing = False
+                return
+            with self._lock:
+                self.summary = new_summary.strip() or summary
+                # Turns dropped from the front while summarizing are already gone
+                done = [turn for turn in batch if turn in self._folding]
+                for turn in done:
+                    self._folding.remove(turn)
+                    self._folding_tokens -= self._tokens(turn)
+
+    def messages(self) -> List[BaseMessage]:
+        """The summary (if any) followed by the unsummarized turns"""
+        with self._lock:
+            messages = [SystemMessage(content=SUMMARY_PREFIX + self.summary)] if self.summary else []
+            for question, answer in self._folding + self._turns:
+                messages.extend([HumanMessage(content=question), AIMessage(content=answer)])
+            return messages
+
+    def load_memory_variables(self, inputs: Dict) -> Dict:
+        return {self.memory_key: self.messages()}
+
+    def prompt_tokens(self) -> int:
+        """Estimated size of the history as sent to the model"""
+        with self._lock:
+            return estimate_tokens(self.summary) + self._folding_tokens + self._turn_tokens
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self._turns, self._folding = [], []
+            self._turn_tokens = self._folding_tokens = 0
@@ -0,0 +1,118 @@
+# conversation_store.py
+import os
+import time
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+
+class ConversationStore:
+    """Append-only SQLite log of conversation turns, keyed by session id.
+
+    Saving a turn is a single indexed insert, however long the session is,
+    and the last N turns of a session are read back with one index range
+    scan. Several processes can share the file (WAL mode). A background
+    thread periodically trims each session to its most recent
+    ``keep_turns`` turns, drops sessions idle for ``retention_days`` and
+    truncates the WAL.
+    """
+
+    def __init__(self, path: str = "conversations.sqlite", keep_turns: Optional[int] = None,
+                 retention_days: Optional[float] = None, compact_interval: Optional[float] = None):
+        self.path = path
+        self.keep_turns = keep_turns or int(os.getenv("CONVERSATION_KEEP_TURNS", 200))
+        self.retention_days = retention_days or float(os.getenv("CONVERSATION_RETENTION_DAYS", 30))
+        self.compact_interval = compact_interval or float(os.getenv("CONVERSATION_COMPACT_INTERVAL", 3600))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # SQLite connections are per thread so request threads do not share one
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, "
+            "question TEXT NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id)")
+        conn.commit()
+
+        self._closed = threading.Event()
+        self._compactor = threading.Thread(target=self._compact_loop, name="conversation-compact", daemon=True)
+        self._compactor.start()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, session_id: str, question: str, answer: str):
+        """Record one question/answer turn"""
+        conn = self._connection()
+        conn.execute("INSERT INTO turns (session_id, question, answer, created_at) VALUES (?, ?, ?, ?)",
+                     (session_id, question, answer, time.time()))
+        conn.commit()
+
+    def append_many(self, session_id: str, turns: List[Tuple[str, str]]):
+        """Record several turns in one transaction (e.g. when importing a history)"""
+        now = time.time()
+        conn = self._connection()
+        conn.executemany("INSERT INTO turns (session_id, question, answer, created_at) VALUES (?, ?, ?, ?)",
+                         [(session_id, question, answer, now) for question, answer in turns])
+        conn.commit()
+
+    def tail(self, session_id: str, max_turns: int) -> List[Tuple[str, str]]:
+        """Return the last max_turns (question, answer) pairs of a session, oldest first"""
+        rows = self._connection().execute(
+            "SELECT question, answer FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, max_turns)
+        ).fetchall()
+        return rows[::-1]
+
+    def has_session(self, session_id: str) -> bool:
+        return self._connection().execute(
+            "SELECT 1 FROM turns WHERE session_id = ? LIMIT 1", (session_id,)).fetchone() is not None
+
+    def clear(self, session_id: str):
+        """Delete every turn of a session"""
+        conn = self._connection()
+        conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+        conn.commit()
+
+    def compact(self) -> int:
+        """Trim old turns and idle sessions; returns the number of turns removed"""
+        conn = self._connection()
+        cutoff = time.time() - self.retention_days * 86400
+        removed = conn.execute(
+            "DELETE FROM turns WHERE session_id IN ("
+            "SELECT session_id FROM turns GROUP BY session_id HAVING MAX(created_at) < ?)", (cutoff,)
+        ).rowcount
+        removed += conn.execute(
+            "DELETE FROM turns WHERE id IN ("
+            "SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY id DESC) AS position "
+            "FROM turns) WHERE position > ?)", (self.keep_turns,)
+        ).rowcount
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    def _compact_loop(self):
+        while not self._closed.wait(self.compact_interval):
+            try:
+                removed = self.compact()
+                if removed:
+                    print(f"Compacted conversation log: removed {removed} turns")
+            except Exception as e:
+                print(f"Error compacting conversation log: {e}")
+
+    def close(self):
+        self._closed.set()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
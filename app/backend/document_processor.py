@@ -1,75 +1,188 @@
 #document_processor.py
-from pypdf import PdfReader
-from pdf2image import convert_from_path
-import pytesseract
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional, Tuple
 import os
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import tempfile
 from utils.helpers import clean_text, chunk_text_with_overlap
+from backend.metrics import span, timed_iter
+from backend.ocr import OcrEngine
 
 class DocumentProcessor:
-    def __init__(self, chunk_size=1000, chunk_overlap=200):
+    def __init__(self, chunk_size=1000, chunk_overlap=200, ocr_workers: Optional[int] = None):
         """Initialize the document processor"""
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-        )
+        self.ocr = OcrEngine(workers=ocr_workers)
+        self._text_splitter = None
+        # Cleaned text is split a few chunks at a time while streaming
+        self.stream_buffer_size = chunk_size * 4
+        self.max_stream_buffer_size = chunk_size * 16
+    
+    @property
+    def text_splitter(self):
+        """The LangChain splitter, created (and LangChain imported) on first use"""
+        if self._text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                length_function=len,
+            )
+        return self._text_splitter
+        
     def process_document(self, document_path: str) -> List[str]:
         """Process a document and return chunks of text"""
-        # Extract text based on file type
+        return [chunk for chunk, _ in self.iter_chunks(document_path)]
+    
+    def iter_pages(self, document_path: str) -> Iterator[Tuple[Optional[int], str]]:
+        """Yield (page_number, raw_text) for a document; page_number is None for plain text"""
         if document_path.lower().endswith('.pdf'):
-            text = self.extract_text_from_pdf(document_path)
+            yield from self.iter_pdf_pages(document_path)
         elif document_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-            text = self.extract_text_from_image(document_path)
+            yield 1, self.extract_text_from_image(document_path)
         elif document_path.lower().endswith('.txt'):
-            with open(document_path, 'r', encoding='utf-8') as f:
-                text = f.read()
+            yield from self._iter_text_file(document_path)
         else:
             raise ValueError(f"Unsupported file type: {document_path}")
+    
+    def iter_chunks(self, document_path: str) -> Iterator[Tuple[str, Dict]]:
+        """Stream (chunk, metadata) pairs for a document page by page.
         
-        # Clean the text
-        text = clean_text(text)
+        Pages are cleaned one at a time and only a few chunks' worth of text
+        is buffered, so memory stays proportional to the chunk size rather
+        than the document. Chunks match splitting the whole cleaned text at
+        once: the last (possibly incomplete) chunk of each buffer is carried
+        over and re-split with the following text. Text with no safe place
+        to carry from (e.g. a long run without spaces) is cut at its last
+        chunk once the buffer reaches max_stream_buffer_size, so the buffer
+        stays bounded. Metadata holds the page the chunk starts on and its
+        character offset in the cleaned text.
+        Extraction is timed per page and splitting per buffer.
+        """
+        buffer = ""
+        buffer_start = 0    # offset of buffer[0] in the cleaned document
+        page_starts = []    # (document offset, page number) for pages in the buffer
+        for page, page_text in timed_iter("extract", self.iter_pages(document_path)):
+            page_text = clean_text(page_text)
+            if not page_text:
+                continue
+            if buffer:
+                buffer += " "
+            page_starts.append((buffer_start + len(buffer), page))
+            buffer += page_text
+            if len(buffer) >= self.stream_buffer_size:
+                chunks = self._split_with_offsets(buffer)
+                carry_index = self._carry_index(buffer, chunks)
+                if carry_index is not None:
+                    # Re-split from the space before the carried chunk so its
+                    # first word is split exactly as in the whole text
+                    carry = chunks[carry_index][1] - 1
+                elif len(buffer) >= self.max_stream_buffer_size and len(chunks) > 1:
+                    # Hard split: keep the buffer bounded at the cost of
+                    # re-splitting the last chunk on its own
+                    carry_index = len(chunks) - 1
+                    carry = chunks[carry_index][1]
+                else:
+                    continue
+                for chunk, offset in chunks[:carry_index]:
+                    yield chunk, self._chunk_metadata(buffer_start + offset, page_starts)
+                buffer = buffer[carry:]
+                buffer_start += carry
+                while len(page_starts) > 1 and page_starts[1][0] <= buffer_start:
+                    page_starts.pop(0)
         
-        # Split text into chunks
-        if not text:
-            return []
-            
-        return self.text_splitter.split_text(text)
+        for chunk, offset in self._split_with_offsets(buffer):
+            yield chunk, self._chunk_metadata(buffer_start + offset, page_starts)
     
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract text from a PDF file, including scanned PDFs using OCR"""
-        text = ""
+    def _split_with_offsets(self, text: str) -> List[Tuple[str, int]]:
+        """Split text into chunks, returning each with its offset in text"""
+        chunks = []
+        search_from = 0
+        with span("chunk"):
+            split = self.text_splitter.split_text(text)
+        for chunk in split:
+            offset = text.find(chunk, search_from)
+            chunks.append((chunk, offset))
+            # The next chunk starts after this one, minus at most the overlap
+            search_from = max(offset + 1, offset + len(chunk) - self.chunk_overlap)
+        return chunks
+    
+    def _carry_index(self, text: str, chunks: List[Tuple[str, int]]) -> Optional[int]:
+        """Index of the last chunk it is safe to re-split from, or None.
+        
+        Re-splitting gives the same chunks only from a chunk that starts a
+        word which the splitter did not have to break up character-wise.
+        """
+        for index in range(len(chunks) - 1, 0, -1):
+            offset = chunks[index][1]
+            if text[offset - 1] != " ":
+                continue
+            word_end = text.find(" ", offset)
+            word_length = (word_end if word_end != -1 else len(text)) - offset
+            if word_length < self.chunk_size:
+                return index
+        return None
+    
+    @staticmethod
+    def _chunk_metadata(start_index: int, page_starts: List[Tuple[int, Optional[int]]]) -> Dict:
+        metadata = {"start_index": start_index}
+        page = None
+        for page_offset, page_number in page_starts:
+            if page_offset > start_index:
+                break
+            page = page_number
+        if page is not None:
+            metadata["page"] = page
+        return metadata
+    
+    def _iter_text_file(self, text_path: str, block_size: int = 64 * 1024) -> Iterator[Tuple[None, str]]:
+        """Read a text file in blocks that end on line boundaries"""
+        with open(text_path, 'r', encoding='utf-8') as f:
+            lines = []
+            size = 0
+            for line in f:
+                lines.append(line)
+                size += len(line)
+                if size >= block_size:
+                    yield None, "".join(lines)
+                    lines, size = [], 0
+            if lines:
+                yield None, "".join(lines)
+    
+    def iter_pdf_pages(self, pdf_path: str) -> Iterator[Tuple[int, str]]:
+        """Yield (page_number, text) for a PDF, falling back to OCR for scanned PDFs"""
+        from pypdf import PdfReader
+        yielded = False
         try:
             # First try to extract text directly
             pdf = PdfReader(pdf_path)
-            for page in pdf.pages:
+            for number, page in enumerate(pdf.pages, start=1):
                 page_text = page.extract_text()
                 if page_text.strip():  # If text was extracted successfully
-                    text += page_text
+                    yielded = True
+                    yield number, page_text
             
             # If no text was extracted, try OCR
-            if not text.strip():
+            if not yielded:
                 print("No text extracted directly from PDF, trying OCR...")
-                images = convert_from_path(pdf_path)
-                for i, image in enumerate(images):
-                    # Perform OCR on each image
-                    page_text = pytesseract.image_to_string(image)
-                    text += page_text
-            
-            return text
+                # Pages are rendered and recognised a few at a time in parallel
+                for number, page_text in self.ocr.ocr_pdf(pdf_path, len(pdf.pages)):
+                    yielded = True
+                    yield number, page_text
         except Exception as e:
+            # Failing partway must not pass the earlier pages off as the whole document
+            if yielded:
+                raise
             print(f"Error extracting text from PDF: {e}")
-            return ""
+    
+    def extract_text_from_pdf(self, pdf_path: str) -> str:
+        """Extract text from a PDF file, including scanned PDFs using OCR"""
+        return "".join(page_text for _, page_text in self.iter_pdf_pages(pdf_path))
     
     def extract_text_from_image(self, image_path: str) -> str:
         """Extract text from an image using OCR"""
         try:
             # Perform OCR on the image
-            text = pytesseract.image_to_string(image_path)
+            text = self.ocr.ocr_image(image_path)
             return text
         except Exception as e:
             print(f"Error extracting text from image: {e}")
@@ -0,0 +1,153 @@
+# embedding_cache.py
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from backend.metrics import span
+
+
+class EmbeddingCache:
+    """Persistent SQLite cache of embedding vectors keyed by model + text hash"""
+
+    def __init__(self, path: str = "embedding_cache.sqlite"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, kind: str, text: str) -> str:
+        """Build the cache key for a text embedded by a model as a document or query"""
+        return hashlib.sha256(f"{model}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Look up several keys at once, returning only the hits"""
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """Store several vectors in a single transaction"""
+        if not items:
+            return
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only calls the underlying model for cache misses.
+
+    Misses are sent to the model in batches of ``batch_size`` texts (the
+    maximum the embedding API accepts per request), and duplicate texts
+    within a call are embedded once.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: Optional[EmbeddingCache] = None,
+                 batch_size: int = 100):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.batch_size = batch_size
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+
+    def _count(self, hits: int = 0, misses: int = 0, api_calls: int = 0):
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+            self.api_calls += api_calls
+
+    def stats(self) -> Dict:
+        """Return cache hit/miss counters since startup"""
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "api_calls": self.api_calls,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_many(texts, "document", self.embeddings.embed_documents)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries at once, sending the cache misses in batched API calls"""
+        return self._embed_many(texts, "query", self._embed_query_batch)
+
+    def _embed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        try:
+            # Google's batch endpoint embeds queries when given their task type
+            return self.embeddings.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+        except TypeError:
+            return [self.embeddings.embed_query(text) for text in texts]
+
+    def _embed_many(self, texts: List[str], kind: str, embed_batch) -> List[List[float]]:
+        keys = [self.cache.make_key(self.model_name, kind, text) for text in texts]
+        found = self.cache.get_many(list(set(keys)))
+
+        # Unique texts that still need embedding, in first-seen order
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self._count(hits=sum(1 for key in keys if key in found), misses=len(missing))
+
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), self.batch_size):
+            batch_keys = missing_keys[start:start + self.batch_size]
+            with span(f"embed_{kind}"):
+                vectors = embed_batch([missing[key] for key in batch_keys])
+            self._count(api_calls=1)
+            # Round to float32 so hits and misses return identical vectors
+            new_items = {key: np.asarray(vector, dtype=np.float32).tolist()
+                         for key, vector in zip(batch_keys, vectors)}
+            self.cache.put_many(new_items)
+            found.update(new_items)
+
+        return [list(found[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.cache.make_key(self.model_name, "query", text)
+        found = self.cache.get_many([key])
+        if key in found:
+            self._count(hits=1)
+            return found[key]
+
+        self._count(misses=1, api_calls=1)
+        with span("embed_query"):
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32).tolist()
+        self.cache.put_many({key: vector})
+        return vector
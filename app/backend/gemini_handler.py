@@ -1,15 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
+import re
+import json
+import time
 import pickle
 import logging
-from typing import List, Dict, Optional
-from langchain.chains import ConversationalRetrievalChain
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.memory import ConversationBufferMemory
-from langchain_core.messages import HumanMessage, AIMessage
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Iterator, List, Dict, Optional, Tuple
+from backend.conversation_store import ConversationStore
+from backend.metrics import CONTENT_TYPE, REGISTRY, observe, span
+from backend.warmup import Warmup
 from dotenv import load_dotenv
 
+# LangChain, FAISS and the model clients are imported on first use, so the
+# API answers health checks before they have loaded
+if TYPE_CHECKING:
+    from backend.conversation_memory import RollingSummaryMemory
+    from backend.llm_client import ResilientLLM
+
 load_dotenv()
 
 # Set up logging
@@ -17,177 +28,651 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+CONDENSE_PROMPT = """Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question, in its original language.
+
+Chat History:
+{chat_history}
+Follow Up Input: {question}
+Standalone question:"""
+
+ANSWER_PROMPT = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+SUMMARY_PROMPT = """Progressively summarize the conversation between a student and an assistant, adding onto the previous summary. Keep names, dates, figures and open questions; return only the new summary.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
+# Words that usually point back at earlier turns ("what about its deadline?")
+FOLLOW_UP_WORDS = {
+    "it", "its", "it's", "they", "them", "their", "this", "that", "these", "those",
+    "he", "him", "his", "she", "her", "there", "above", "previous", "earlier", "same", "former", "latter",
+}
+FOLLOW_UP_OPENERS = ("and ", "but ", "also ", "so ", "then ", "what about ", "how about ")
+
 class GeminiHandler:
-    def __init__(self, vector_store=None, memory_file="conversation_memory.pkl"):
-        """Initialize the Gemini handler with LLM and memory"""
+    # Upper bound on in-memory per-session histories kept by a shared handler
+    MAX_SESSIONS = 1000
+    # Candidates fetched from the store; the context packer merges and
+    # trims them to CONTEXT_TOKEN_BUDGET
+    RETRIEVAL_K = 8
+    # Only the latest turns are sent to the condense model
+    CONDENSE_HISTORY_MESSAGES = 6
+    # Session used when callers do not pass a session id
+    DEFAULT_SESSION = "default"
+    # Turns read back from the conversation log when a session is reopened
+    MEMORY_TAIL_TURNS = 20
+    
+    def __init__(self, vector_store=None, memory_file="conversation_memory.pkl",
+                 conversation_store: Optional[ConversationStore] = None):
+        """Initialize the Gemini handler with LLM and memory.
+        
+        Turns are appended to the conversation log; memory_file is only read
+        once, to import a conversation pickled by older versions.
+        """
         logger.info("Initializing Gemini handler")
+        from backend.answer_cache import AnswerCache
+        from backend.context_packer import ContextPacker
+        from backend.model_backends import create_chat_model
         
         self.memory_file = memory_file
-        self.llm = ChatGoogleGenerativeAI(
-            google_api_key=os.getenv("GOOGLE_API_KEY"),
-            model="gemini-1.5-flash",
+        # Every model call goes through ResilientLLM: identical in-flight
+        # prompts are coalesced, calls draw from a per-model token bucket
+        # shared by all worker processes, and quota/overload errors are
+        # retried with jittered backoff (so the client's own retries are off)
+        self._limiters = {}
+        # LLM_BACKEND=stub swaps the Gemini models for a deterministic offline stub
+        self.llm = self._resilient(create_chat_model(
+            "gemini-1.5-flash",
             temperature=0.7,
             top_k=40,
             top_p=0.8,
             max_output_tokens=2048,
-        )
+            max_retries=1,
+        ))
+        # Follow-up questions are rewritten by a smaller, deterministic model
+        self.condense_llm = self._resilient(create_chat_model(
+            os.getenv("CONDENSE_MODEL", "gemini-1.5-flash-8b"),
+            temperature=0,
+            max_output_tokens=128,
+            max_retries=1,
+        ))
         
-        # Initialize or load existing memory
-        self.memory = self.load_memory() or ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        # "summary" keeps recent turns within MEMORY_TOKEN_BUDGET and folds
+        # older ones into a running summary; "buffer" keeps every turn
+        self.memory_mode = os.getenv("MEMORY_MODE", "summary")
+        self.memory_token_budget = int(os.getenv("MEMORY_TOKEN_BUDGET", 1500))
+        self.summary_llm = self._resilient(create_chat_model(
+            os.getenv("CONDENSE_MODEL", "gemini-1.5-flash-8b"),
+            temperature=0,
+            max_output_tokens=512,
+            max_retries=1,
+        ))
+        # Summaries are written off the request path
+        self._summary_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SUMMARY_WORKERS", 2)),
+                                                    thread_name_prefix="summary")
         
-        # Set up the QA chain if we have a vector store
-        self.vector_store = vector_store
-        self.qa_chain = None
+        # Append-only log of every turn; memories are rebuilt from its tail
+        self.conversations = conversation_store or ConversationStore(
+            os.getenv("CONVERSATION_DB", "conversations.sqlite"))
         
-        if vector_store and vector_store.db:
-            logger.info("Vector store found, setting up QA chain")
-            try:
-                self.qa_chain = ConversationalRetrievalChain.from_llm(
-                    llm=self.llm,
-                    retriever=vector_store.db.as_retriever(
-                        search_kwargs={"k": 4}
-                    ),
-                    memory=self.memory,
-                    return_source_documents=True
-                )
-                logger.info("QA chain created successfully")
-            except Exception as e:
-                logger.error(f"Error creating QA chain: {e}")
-                self.qa_chain = None
-        else:
+        # In-memory histories of active sessions, least recently used first;
+        # idle sessions are evicted and reloaded from the log when they return
+        self._sessions = OrderedDict()   # session id -> (memory, last used)
+        self.session_idle_timeout = float(os.getenv("SESSION_IDLE_TIMEOUT", 3600))
+        self._lock = threading.Lock()
+        self.import_memory_file(memory_file)
+        
+        # Answers to standalone questions, reused for repeated or similar questions
+        self.answer_cache = AnswerCache()
+        # Merges overlapping chunks and fits the retrieved context to a token budget
+        self.context_packer = ContextPacker()
+        
+        self.vector_store = vector_store
+        if vector_store is None or vector_store.is_empty():
             logger.info("No vector store provided or empty vector store")
     
-    def load_memory(self):
-        """Load memory from disk if available"""
+    def _resilient(self, llm) -> "ResilientLLM":
+        """Wrap a chat model in the call layer, sharing one rate limiter per model"""
+        from backend.llm_client import ResilientLLM, TokenBucket
+        model = getattr(llm, "model", type(llm).__name__)
+        if model not in self._limiters:
+            # An empty LLM_RATE_LIMIT_PATH keeps the bucket per process
+            self._limiters[model] = TokenBucket(
+                model,
+                rate_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", 1000)),
+                burst=int(os.getenv("LLM_BURST", 50)),
+                path=os.getenv("LLM_RATE_LIMIT_PATH", "llm_rate_limit.sqlite") or None,
+            )
+        return ResilientLLM(llm, limiter=self._limiters[model])
+    
+    def llm_stats(self) -> Dict:
+        """Call, coalescing, retry and throttling counters of the answer model"""
+        return self.llm.stats()
+    
+    def metric_samples(self) -> List[Tuple[str, str, str, float]]:
+        """Cache, LLM and session counters as (name, type, help, value) for /metrics"""
+        samples = []
+        if self.vector_store is not None:
+            embedding_stats = self.vector_store.embeddings.stats()
+            samples += [
+                ("vector_store_documents", "gauge", "Documents in the vector store.", len(self.vector_store)),
+                ("embedding_cache_hits_total", "counter", "Embedding cache hits.", embedding_stats["hits"]),
+                ("embedding_cache_misses_total", "counter", "Embedding cache misses.", embedding_stats["misses"]),
+                ("embedding_api_calls_total", "counter", "Embedding API calls.", embedding_stats["api_calls"]),
+            ]
+        answer_stats = self.answer_cache.stats()
+        llm_stats = self.llm_stats()
+        samples += [
+            ("answer_cache_entries", "gauge", "Answers in the answer cache.", answer_stats["entries"]),
+            ("answer_cache_exact_hits_total", "counter", "Exact answer cache hits.", answer_stats["exact_hits"]),
+            ("answer_cache_similar_hits_total", "counter", "Similar-question answer cache hits.",
+             answer_stats["semantic_hits"]),
+            ("answer_cache_misses_total", "counter", "Answer cache misses.", answer_stats["misses"]),
+            ("llm_calls_total", "counter", "Answer model calls made.", llm_stats["calls"]),
+            ("llm_coalesced_total", "counter", "Answer model calls shared with an identical one.",
+             llm_stats["coalesced"]),
+            ("llm_retries_total", "counter", "Answer model calls retried.", llm_stats["retries"]),
+            ("llm_throttled_seconds_total", "counter", "Seconds spent waiting on the rate limiter.",
+             llm_stats["throttled_seconds"]),
+            ("sessions", "gauge", "Live conversation sessions.", self.session_count()),
+        ]
+        return samples
+    
+    def _new_memory(self) -> "RollingSummaryMemory":
+        from backend.conversation_memory import RollingSummaryMemory
+        if self.memory_mode == "buffer":
+            return RollingSummaryMemory(memory_key="chat_history")
+        return RollingSummaryMemory(token_budget=self.memory_token_budget, summarize=self._summarize_turns,
+                                    executor=self._summary_executor, memory_key="chat_history")
+    
+    def _summarize_turns(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        """Fold turns into the running summary with the small model"""
+        new_lines = "\n".join(f"Human: {question}\nAssistant: {answer}" for question, answer in turns)
+        response = self.summary_llm.invoke(SUMMARY_PROMPT.format(summary=summary or "(none)", new_lines=new_lines))
+        return response.content
+    
+    @staticmethod
+    def _split_summary(chat_history: List) -> Tuple[List, List]:
+        """Split a history into its leading summary message (if any) and the turns"""
+        from langchain_core.messages import SystemMessage
+        if chat_history and isinstance(chat_history[0], SystemMessage):
+            return chat_history[:1], chat_history[1:]
+        return [], chat_history
+    
+    @staticmethod
+    def is_self_contained(question: str) -> bool:
+        """Guess whether a question can be answered without the conversation"""
+        words = re.findall(r"[a-z']+", question.lower())
+        if len(words) < 4 or " ".join(words).startswith(FOLLOW_UP_OPENERS):
+            return False
+        return not any(word in FOLLOW_UP_WORDS for word in words)
+    
+    def _condense_question(self, question: str, chat_history: List) -> str:
+        """Rewrite a follow-up as a standalone question with the small model"""
+        from langchain_core.messages import HumanMessage
+        summary, turns = self._split_summary(chat_history)
+        history = "\n".join(
+            [msg.content for msg in summary] +
+            [f"{'Human' if isinstance(msg, HumanMessage) else 'Assistant'}: {msg.content}"
+             for msg in turns[-self.CONDENSE_HISTORY_MESSAGES:]]
+        )
+        response = self.condense_llm.invoke(CONDENSE_PROMPT.format(chat_history=history, question=question))
+        return response.content.strip() or question
+    
+    def _retrieve(self, question: str, chat_history: List) -> Dict:
+        """Condense the question if needed, then check the answer cache or retrieve chunks.
+        
+        The condense step only runs when there is history and the question
+        does not look self-contained, so most turns need a single LLM call.
+        """
+        timings = {}
+        started = time.perf_counter()
+        
+        standalone = question
+        if chat_history and not self.is_self_contained(question):
+            with span("condense") as condense:
+                standalone = self._condense_question(question, chat_history)
+            timings["condense_ms"] = condense.ms
+            logger.info(f"Condensed question: {standalone}")
+        
+        # The answer depends only on the standalone question, so it can be
+        # cached whatever the history was
+        step = time.perf_counter()
+        version = self.vector_store.version
+        with span("answer_cache"):
+            cached = self.answer_cache.get_exact(standalone, version)
+        embedding = None
+        results = []
+        if cached is None:
+            # A confident keyword hit (course code, room number...) needs no
+            # query embedding, so it also skips the semantic cache lookup
+            results = self.vector_store.lexical_fast_path(standalone, k=self.RETRIEVAL_K) or []
+            if results:
+                timings["lexical_ms"] = round((time.perf_counter() - step) * 1000, 1)
+                logger.info("Confident keyword match, skipping the query embedding")
+        if cached is None and not results:
+            embedding = self.vector_store.embeddings.embed_query(standalone)
+            with span("answer_cache"):
+                cached = self.answer_cache.get_similar(embedding, version)
+        timings["cache_ms"] = round((time.perf_counter() - step) * 1000, 1)
+        
+        if cached is None and not results:
+            logger.info(f"Searching for relevant documents for: {standalone}")
+            with span("retrieve") as retrieve:
+                results = self.vector_store.search(standalone, k=self.RETRIEVAL_K, embedding=embedding)
+            timings["retrieve_ms"] = retrieve.ms
+        if results:
+            with span("pack"):
+                results = self.context_packer.pack(results)
+        
+        return {"standalone": standalone, "cached": cached, "results": results, "embedding": embedding,
+                "version": version, "timings": timings, "started": started}
+
+    def get_memory(self, session_id: Optional[str] = None) -> "RollingSummaryMemory":
+        """Return the conversation memory for a session (default session if None)"""
+        session_id = session_id or self.DEFAULT_SESSION
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle_sessions(now)
+            entry = self._sessions.pop(session_id, None)
+            memory = entry[0] if entry is not None else self._restore_memory(session_id)
+            self._sessions[session_id] = (memory, now)
+            # Evict the least recently used session
+            while len(self._sessions) > self.MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+            return memory
+    
+    def _evict_idle_sessions(self, now: float):
+        """Drop sessions unused for session_idle_timeout (caller holds the lock)"""
+        while self._sessions:
+            _, last_used = next(iter(self._sessions.values()))
+            if now - last_used < self.session_idle_timeout:
+                break
+            self._sessions.popitem(last=False)
+    
+    def session_count(self) -> int:
+        """Number of live per-session memories"""
+        with self._lock:
+            self._evict_idle_sessions(time.monotonic())
+            return len(self._sessions)
+    
+    def clear_memory(self, session_id: Optional[str] = None):
+        """Clear the conversation memory for a session"""
+        session_id = session_id or self.DEFAULT_SESSION
+        with self._lock:
+            self._sessions.pop(session_id, None)
         try:
-            if os.path.exists(self.memory_file):
-                logger.info(f"Loading memory from {self.memory_file}")
-                with open(self.memory_file, 'rb') as f:
-                    memory = pickle.load(f)
-                    logger.info(f"Loaded memory with {len(memory.chat_memory.messages)} messages")
-                    return memory
+            self.conversations.clear(session_id)
         except Exception as e:
-            logger.error(f"Error loading memory: {e}")
-        return None
+            logger.error(f"Error clearing conversation log: {e}")
     
-    def save_memory(self):
-        """Save memory to disk"""
+    def _restore_memory(self, session_id: str) -> "RollingSummaryMemory":
+        """Rebuild a session's memory from the tail of the conversation log"""
+        memory = self._new_memory()
         try:
-            with open(self.memory_file, 'wb') as f:
-                pickle.dump(self.memory, f)
-                logger.info(f"Saved memory with {len(self.memory.chat_memory.messages)} messages")
+            turns = self.conversations.tail(session_id, self.MEMORY_TAIL_TURNS)
         except Exception as e:
-            logger.error(f"Error saving memory: {e}")
+            logger.error(f"Error reading conversation log: {e}")
+            return memory
+        for question, answer in turns:
+            memory.save_context({"input": question}, {"output": answer})
+        if turns:
+            logger.info(f"Restored {len(turns)} turns for session {session_id}")
+        return memory
     
-    def get_relevant_history(self, max_messages=10):
-        """Get the most recent N messages to stay within token limits"""
-        chat_history = self.memory.load_memory_variables({}).get("chat_history", [])
+    def import_memory_file(self, memory_file: Optional[str]) -> int:
+        """Move a conversation pickled by older versions into the default session, once.
+        
+        Returns the number of imported turns.
+        """
+        if not memory_file or not os.path.exists(memory_file):
+            return 0
+        try:
+            with open(memory_file, 'rb') as f:
+                messages = pickle.load(f).chat_memory.messages
+            turns = [(question.content, answer.content)
+                     for question, answer in zip(messages[::2], messages[1::2])]
+            imported = 0
+            if turns and not self.conversations.has_session(self.DEFAULT_SESSION):
+                self.conversations.append_many(self.DEFAULT_SESSION, turns)
+                imported = len(turns)
+                # Reload the session from the log if it is already in memory
+                with self._lock:
+                    self._sessions.pop(self.DEFAULT_SESSION, None)
+                logger.info(f"Imported {imported} turns from {memory_file}")
+            os.replace(memory_file, memory_file + ".bak")
+            return imported
+        except Exception as e:
+            logger.error(f"Error importing memory from {memory_file}: {e}")
+            return 0
+    
+    def get_relevant_history(self, max_messages=10, session_id: Optional[str] = None):
+        """Get the running summary and the most recent N messages to stay within token limits"""
+        chat_history = self.get_memory(session_id).load_memory_variables({}).get("chat_history", [])
+        summary, turns = self._split_summary(chat_history)
         # Filter out any messages with empty content
-        valid_history = [msg for msg in chat_history if hasattr(msg, 'content') and 
+        valid_history = [msg for msg in turns if hasattr(msg, 'content') and 
                          msg.content and isinstance(msg.content, str) and msg.content.strip()]
-        return valid_history[-max_messages:] if valid_history else []
+        return summary + valid_history[-max_messages:] if valid_history else summary
+    
+    def save_turn(self, question: str, answer: str, session_id: Optional[str] = None):
+        """Record a question/answer pair in the session's memory and the conversation log"""
+        with span("save_memory"):
+            self.get_memory(session_id).save_context({"input": question}, {"output": answer})
+            try:
+                self.conversations.append(session_id or self.DEFAULT_SESSION, question, answer)
+            except Exception as e:
+                logger.error(f"Error appending to conversation log: {e}")
+    
+    def answer_question(self, question: str, session_id: Optional[str] = None) -> Dict:
+        """Answer a question from the documents, or directly with the LLM"""
+        response = {"answer": "", "sources": [], "from_kb": False}
+        for event in self.stream_answer(question, session_id):
+            if event["type"] == "sources":
+                response["sources"] = event["sources"]
+                response["from_kb"] = event["from_kb"]
+                if event.get("cached"):
+                    response["cached"] = True
+            elif event["type"] == "done":
+                response["answer"] = event["answer"]
+                if event.get("timings"):
+                    response["timings"] = event["timings"]
+            elif event["type"] == "error":
+                response = {
+                    "answer": f"I'm sorry, I encountered an error: {event['message']}",
+                    "sources": [],
+                    "from_kb": False
+                }
+        return response
+    
+    def answer_many(self, questions: List[str], concurrency: Optional[int] = None) -> Iterator[Tuple[int, Dict]]:
+        """Answer independent questions, yielding (index, response) as each one completes.
+        
+        The questions are answered without conversation history or memory.
+        Cache lookups, query embedding (batched API calls) and retrieval (one
+        index search) run for the whole batch first; the LLM calls then run
+        on up to ``concurrency`` threads (BATCH_CONCURRENCY by default).
+        """
+        concurrency = concurrency or int(os.getenv("BATCH_CONCURRENCY", 8))
+        items = self._retrieve_many(questions)
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+        try:
+            futures = {pool.submit(self._generate, question, item): index
+                       for index, (question, item) in enumerate(zip(questions, items)) if item["response"] is None}
+            for index, item in enumerate(items):
+                if item["response"] is not None:
+                    yield index, item["response"]
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # Stop queued LLM calls if the caller stops consuming
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _retrieve_many(self, questions: List[str]) -> List[Dict]:
+        """Cache lookups and retrieval for a batch of standalone questions"""
+        has_vector_store = self.vector_store is not None and not self.vector_store.is_empty()
+        version = self.vector_store.version if has_vector_store else None
+        items = []
+        to_embed = []
+        for index, question in enumerate(questions):
+            item = {"response": None, "results": [], "embedding": None, "version": version}
+            items.append(item)
+            if not question or not question.strip():
+                item["response"] = {"answer": "I received an empty question. Please provide some text.",
+                                    "sources": [], "from_kb": False}
+            elif has_vector_store:
+                cached = self.answer_cache.get_exact(question, version)
+                if cached is not None:
+                    item["response"] = {**cached, "cached": True}
+                    continue
+                item["results"] = self.vector_store.lexical_fast_path(question, k=self.RETRIEVAL_K) or []
+                if not item["results"]:
+                    to_embed.append(index)
+        
+        if to_embed:
+            try:
+                embeddings = self.vector_store.embeddings.embed_queries([questions[i] for i in to_embed])
+                to_search = []
+                for index, embedding in zip(to_embed, embeddings):
+                    items[index]["embedding"] = embedding
+                    cached = self.answer_cache.get_similar(embedding, version)
+                    if cached is not None:
+                        items[index]["response"] = {**cached, "cached": True}
+                    else:
+                        to_search.append(index)
+                results = self.vector_store.search_many([questions[i] for i in to_search], k=self.RETRIEVAL_K,
+                                                        embeddings=[items[i]["embedding"] for i in to_search])
+                for index, found in zip(to_search, results):
+                    items[index]["results"] = found
+            except Exception as e:
+                # Questions without results are answered by the LLM directly
+                logger.error(f"Error retrieving documents for batch: {e}")
+        
+        for item in items:
+            if item["results"]:
+                item["results"] = self.context_packer.pack(item["results"])
+        return items
+    
+    def _generate(self, question: str, item: Dict) -> Dict:
+        """Answer one batch question from its retrieved passages (or directly)"""
+        from langchain_core.messages import HumanMessage
+        sources = [r["content"] for r in item["results"]]
+        if sources:
+            prompt = ANSWER_PROMPT.format(context="\n\n".join(sources), question=question)
+        else:
+            prompt = [HumanMessage(content=question)]
+        try:
+            with span("generate"):
+                answer = self.llm.invoke(prompt).content
+        except Exception as e:
+            logger.error(f"Error generating answer: {e}")
+            return {"answer": f"I'm sorry, I encountered an error: {e}", "sources": [], "from_kb": False}
+        response = {"answer": answer, "sources": sources, "from_kb": bool(sources)}
+        if sources:
+            self.answer_cache.put(question, response, item["embedding"], item["version"])
+        return response
     
-    def answer_question(self, question: str) -> Dict:
-        """Answer a question using the QA chain or direct LLM"""
+    def stream_answer(self, question: str, session_id: Optional[str] = None) -> Iterator[Dict]:
+        """Answer a question as a stream of events.
+        
+        Yields one "sources" event first, then "token" events as the answer
+        is generated, and finally "done" with the full answer and step
+        timings (or "error"). The turn is saved to memory once the answer is
+        complete.
+        """
+        from langchain_core.messages import HumanMessage
+        
         # Validate input
         if not question or not question.strip():
-            return {
-                "answer": "I received an empty question. Please provide some text.",
-                "sources": [],
-                "from_kb": False
-            }
+            answer = "I received an empty question. Please provide some text."
+            yield {"type": "sources", "sources": [], "from_kb": False}
+            yield {"type": "token", "text": answer}
+            yield {"type": "done", "answer": answer, "timings": {}}
+            return
             
         # Log memory state
-        chat_history = self.memory.load_memory_variables({}).get("chat_history", [])
-        history_length = len(chat_history)
-        logger.info(f"Memory contains {history_length} messages")
+        chat_history = self.get_memory(session_id).load_memory_variables({}).get("chat_history", [])
+        logger.info(f"Memory contains {len(chat_history)} messages")
         
         # Check if vector store is properly initialized
-        has_vector_store = (self.qa_chain is not None and 
-                        self.vector_store is not None and 
-                        self.vector_store.db is not None)
-                        
+        has_vector_store = self.vector_store is not None and not self.vector_store.is_empty()
         logger.info(f"Vector store available: {has_vector_store}")
         
+        retrieved = None
         if has_vector_store:
             try:
-                # Try retrieving relevant documents first
-                logger.info(f"Searching for relevant documents for: {question}")
-                result = self.qa_chain({"question": question})
-                source_docs = [doc.page_content for doc in result.get("source_documents", [])]
-                
-                if source_docs:
-                    logger.info(f"Found {len(source_docs)} relevant document chunks")
-                    
-                    # Explicitly update memory
-                    self.memory.save_context({"input": question}, {"output": result["answer"]})
-                    self.save_memory()
-                    
-                    return {
-                        "answer": result["answer"],
-                        "sources": source_docs,
-                        "from_kb": True
-                    }
-                else:
+                retrieved = self._retrieve(question, chat_history)
+                if retrieved["cached"] is None and not retrieved["results"]:
                     logger.info("No relevant documents found, falling back to direct LLM")
+                    retrieved = None
             except Exception as e:
-                logger.error(f"Error using QA chain: {e}")
+                logger.error(f"Error using retrieval pipeline: {e}")
+                retrieved = None
         
-        # Fallback to direct LLM
-        logger.info("Using direct LLM for response")
+        if retrieved is not None and retrieved["cached"] is not None:
+            logger.info("Answer cache hit")
+            cached, timings = retrieved["cached"], retrieved["timings"]
+            timings["total_ms"] = round((time.perf_counter() - retrieved["started"]) * 1000, 1)
+            observe("answer", timings["total_ms"] / 1000)
+            yield {"type": "sources", "sources": cached["sources"], "from_kb": True, "cached": True}
+            yield {"type": "token", "text": cached["answer"]}
+            self.save_turn(question, cached["answer"], session_id)
+            yield {"type": "done", "answer": cached["answer"], "timings": timings}
+            return
+        
+        if retrieved is not None:
+            sources = [r["content"] for r in retrieved["results"]]
+            logger.info(f"Found {len(sources)} relevant document chunks")
+            prompt = ANSWER_PROMPT.format(context="\n\n".join(sources), question=retrieved["standalone"])
+            timings, started = retrieved["timings"], retrieved["started"]
+        else:
+            # Fallback to direct LLM with the recent conversation as context
+            logger.info("Using direct LLM for response")
+            sources = []
+            prompt = self.get_relevant_history(session_id=session_id) + [HumanMessage(content=question)]
+            logger.info(f"Using {len(prompt) - 1} valid messages as context")
+            timings, started = {}, time.perf_counter()
+        
+        # Sources go out before the first token
+        yield {"type": "sources", "sources": sources, "from_kb": retrieved is not None}
+        
+        step = time.perf_counter()
+        parts = []
         try:
-            # Filter out any invalid messages from history
-            valid_messages = []
-            for msg in self.get_relevant_history():
-                if hasattr(msg, 'content') and msg.content and isinstance(msg.content, str) and msg.content.strip():
-                    valid_messages.append(msg)
-            
-            # Log the filtered conversation context
-            logger.info(f"Using {len(valid_messages)} valid messages as context")
-            
-            # Add the current question
-            valid_messages.append(HumanMessage(content=question))
-            
-            # Ensure we have at least the current question
-            if len(valid_messages) > 0:
-                # Get response from LLM
-                response = self.llm.invoke(valid_messages)
-                
-                logger.info(f"Direct LLM response received")
-                
-                # Explicitly update memory
-                self.memory.save_context({"input": question}, {"output": response.content})
-                self.save_memory()
-                
-                return {
-                    "answer": response.content,
-                    "sources": [],
-                    "from_kb": False
-                }
-            else:
-                raise ValueError("No valid messages to send to the model")
+            for chunk in self.llm.stream(prompt):
+                if not chunk.content:
+                    continue
+                if not parts:
+                    timings["first_token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    observe("first_token", timings["first_token_ms"] / 1000)
+                parts.append(chunk.content)
+                yield {"type": "token", "text": chunk.content}
         except Exception as e:
-            logger.error(f"Error using direct LLM: {e}")
-            return {
-                "answer": f"I'm sorry, I encountered an error: {str(e)}",
-                "sources": [],
-                "from_kb": False
-            }
+            logger.error(f"Error generating answer: {e}")
+            REGISTRY.error("generate")
+            yield {"type": "error", "message": str(e)}
+            return
+        
+        answer = "".join(parts)
+        timings["answer_ms"] = round((time.perf_counter() - step) * 1000, 1)
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        # Generation time includes the consumer's time between tokens, as streamed
+        observe("generate", timings["answer_ms"] / 1000)
+        observe("answer", timings["total_ms"] / 1000)
+        logger.info(f"Answer timings: {timings}")
+        
+        # Explicitly update memory now that the answer is complete
+        self.save_turn(question, answer, session_id)
+        if retrieved is not None:
+            self.answer_cache.put(retrieved["standalone"], {"answer": answer, "sources": sources, "from_kb": True},
+                                  retrieved["embedding"], retrieved["version"])
+        yield {"type": "done", "answer": answer, "timings": timings}
+
 
 # Create Flask application
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Initialize the GeminiHandler (you might want to handle vector_store initialization here)
+# One handler per worker process, shared by every request thread; each
+# session keeps its own memory inside it. It is built by a background
+# warm-up, so the process answers health checks while the index loads
 gemini_handler = None
+_handler_lock = threading.Lock()
+# Seconds a query waits for the warm-up before it is answered with a 503
+READY_WAIT_SECONDS = float(os.getenv("READY_WAIT_SECONDS", 0))
+
+def _open_shared_vector_store():
+    """Open the index read-only and memory-mapped so worker processes share its pages"""
+    from backend.vector_store import VectorStore
+    try:
+        return VectorStore(os.getenv("VECTOR_STORE_PATH", "faiss_index"), read_only=True)
+    except Exception as e:
+        logger.error(f"Error opening vector store: {e}")
+        return None
+
+def _build_handler() -> GeminiHandler:
+    return GeminiHandler(vector_store=_open_shared_vector_store())
+
+warmup = Warmup("gemini-handler", _build_handler)
+
+def get_gemini_handler(timeout: Optional[float] = None) -> GeminiHandler:
+    """Return the process-wide handler, waiting for the warm-up to build it.
+    
+    Raises TimeoutError if it is not ready within ``timeout`` seconds and
+    RuntimeError if the warm-up failed.
+    """
+    global gemini_handler
+    handler = warmup.wait(timeout)
+    with _handler_lock:
+        if gemini_handler is None:
+            gemini_handler = handler
+        return gemini_handler
+
+def _ready_handler() -> Optional[GeminiHandler]:
+    """The handler, or None while the warm-up has not finished (or has failed)"""
+    try:
+        return get_gemini_handler(timeout=READY_WAIT_SECONDS)
+    except (TimeoutError, RuntimeError):
+        return None
+
+def _not_ready():
+    response = jsonify({"status": "starting", "message": "The document index is still loading", **warmup.status()})
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+def _session_id() -> str:
+    """Session id from the JSON body, X-Session-ID header or query string.
+    
+    Clients that send none share the default session, as before sessions
+    existed, so their follow-up questions keep their history.
+    """
+    data = request.get_json(silent=True) or {}
+    return (data.get('session_id') or request.headers.get('X-Session-ID') or
+            request.args.get('session_id') or GeminiHandler.DEFAULT_SESSION)
+
+@app.before_request
+def _start_warmup():
+    # The first request a worker gets (usually a health probe) starts the warm-up
+    warmup.start()
+
+@app.route('/healthz', methods=['GET'])
+def liveness():
+    """Liveness: the process is serving; it only fails if the warm-up failed for good"""
+    status = warmup.status()
+    return jsonify({"status": "alive", **status}), 500 if status["state"] == Warmup.FAILED else 200
+
+@app.route('/readyz', methods=['GET'])
+def readiness():
+    """Readiness: the index and models are loaded and queries can be answered"""
+    status = warmup.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: stage latency histograms plus cache and LLM counters.
+    
+    Every worker process keeps its own counters, so with several workers
+    each scrape reports the process that served it.
+    """
+    samples = warmup.result.metric_samples() if warmup.ready else []
+    samples.append(("ready", "gauge", "1 once the index and models are loaded.", int(warmup.ready)))
+    return Response(REGISTRY.render(samples), content_type=CONTENT_TYPE)
 
 # Root route for basic health check
 @app.route('/', methods=['GET'])
 def home():
-    return jsonify({"status": "Gemini API is running"})
+    return jsonify({"status": "Gemini API is running", "ready": warmup.ready})
 
 # Test route - make sure this is properly defined
 @app.route('/api/test', methods=['GET'])
@@ -197,24 +682,22 @@ def test():
 
 @app.route('/api/init', methods=['POST'])
 def initialize_handler():
-    global gemini_handler
-    
     data = request.json
     memory_file = data.get('memory_file', 'conversation_memory.pkl')
+    handler = _ready_handler()
+    if handler is None:
+        return _not_ready()
     
-    # Note: You'll need to implement vector store initialization if needed
-    # This example assumes vector_store is None for simplicity
-    gemini_handler = GeminiHandler(vector_store=None, memory_file=memory_file)
-    
-    return jsonify({"status": "initialized", "memory_file": memory_file})
+    # Import into the shared handler: replacing it would drop every session
+    imported = handler.import_memory_file(memory_file)
+    return jsonify({"status": "initialized", "memory_file": memory_file, "imported_turns": imported})
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    global gemini_handler
-    
-    # Initialize handler if not already done
-    if gemini_handler is None:
-        gemini_handler = GeminiHandler(vector_store=None)
+    handler = _ready_handler()
+    if handler is None:
+        return _not_ready()
+    session_id = _session_id()
     
     data = request.json
     question = data.get('question', '')
@@ -223,29 +706,91 @@ def chat():
         return jsonify({
             "answer": "Please provide a question.",
             "sources": [],
-            "from_kb": False
+            "from_kb": False,
+            "session_id": session_id
         })
     
     # Get answer from GeminiHandler
-    result = gemini_handler.answer_question(question)
+    result = handler.answer_question(question, session_id=session_id)
     
-    return jsonify(result)
+    response = jsonify({**result, "session_id": session_id})
+    response.headers["X-Session-ID"] = session_id
+    return response
+
+@app.route('/api/chat/stream', methods=['GET', 'POST'])
+def chat_stream():
+    """Server-Sent Events version of /api/chat: sources first, then tokens"""
+    handler = _ready_handler()
+    if handler is None:
+        return _not_ready()
+    session_id = _session_id()
+    
+    # EventSource clients can only send GET requests
+    data = request.get_json(silent=True) or request.args
+    question = data.get('question', '')
+    
+    def events():
+        for event in handler.stream_answer(question, session_id=session_id):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+                             "X-Session-ID": session_id})
+
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    """Answer a list of independent questions; results stream back as NDJSON lines as they complete"""
+    handler = _ready_handler()
+    if handler is None:
+        return _not_ready()
+    data = request.get_json(silent=True) or {}
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not all(isinstance(q, str) for q in questions):
+        return jsonify({"status": "error", "message": "questions must be a list of strings"}), 400
+    
+    # Validated before streaming starts: errors after the 200 cannot be reported
+    concurrency = data.get('concurrency')
+    if concurrency is None:
+        concurrency = int(os.getenv("BATCH_CONCURRENCY", 8))
+    if isinstance(concurrency, bool) or not isinstance(concurrency, int) or concurrency < 1:
+        return jsonify({"status": "error", "message": "concurrency must be a positive integer"}), 400
+    concurrency = min(concurrency, int(os.getenv("BATCH_MAX_CONCURRENCY", 32)))
+    
+    def lines():
+        for index, result in handler.answer_many(questions, concurrency=concurrency):
+            yield json.dumps({"index": index, "question": questions[index], **result}) + "\n"
+    
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route('/api/clear-memory', methods=['POST'])
 def clear_memory():
-    global gemini_handler
+    handler = _ready_handler()
+    if handler is None:
+        return _not_ready()
+    handler.clear_memory(_session_id())
+    return jsonify({"status": "memory cleared"})
+
+def serve(host: str = '0.0.0.0', port: int = 5000, threads: Optional[int] = None):
+    """Serve the API with a multi-threaded production server.
     
-    if gemini_handler is not None:
-        # Create a new memory instance
-        gemini_handler.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
-        gemini_handler.save_memory()
-        
-        return jsonify({"status": "memory cleared"})
-    else:
-        return jsonify({"status": "error", "message": "Handler not initialized"}), 400
+    Uses waitress when installed and falls back to Flask's threaded server.
+    For several worker processes run e.g. ``gunicorn -w 4 --threads 16
+    backend.gemini_handler:app``; each process opens the index read-only
+    and memory-mapped, so they share one copy of it. The index loads in the
+    background: /healthz answers at once and /readyz once queries can be
+    served.
+    """
+    threads = threads or int(os.getenv("SERVER_THREADS", 16))
+    warmup.start()
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        logger.info(f"waitress not installed, using Flask's threaded server on port {port}")
+        app.run(host=host, port=port, threaded=True, debug=False)
+        return
+    logger.info(f"Serving with waitress on port {port} ({threads} threads)")
+    waitress_serve(app, host=host, port=port, threads=threads)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -253,4 +798,7 @@ if __name__ == '__main__':
     logger.info("Registered routes:")
     for rule in app.url_map.iter_rules():
         logger.info(f"Route: {rule.rule}, Methods: {rule.methods}")
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    if os.getenv("FLASK_DEBUG", "").lower() in ("1", "true"):
+        app.run(host='0.0.0.0', port=port, debug=True, threaded=True)
+    else:
+        serve(port=port)
@@ -0,0 +1,273 @@
+# index_persistence.py
+import os
+import json
+import sqlite3
+import tempfile
+import threading
+import faiss
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+from langchain_core.documents import Document
+from backend.ann_index import INDEX_IVF
+from backend.lexical_index import term_counts
+
+
+def atomic_write(path: str, data: bytes):
+    """Write a file via a temp file + fsync + rename so readers never see a partial file"""
+    directory = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    _fsync_directory(directory)
+
+
+def _fsync_directory(directory: str):
+    """Make a rename durable (no-op where directories cannot be opened)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class IndexPersistence:
+    """On-disk layout for the FAISS index and its docstore.
+
+    The index is written as a new generation (``index-<n>.faiss`` plus an
+    ``index-<n>.json`` file with the index type, next label, document count,
+    tombstones, compaction count and search parameters) and then published by atomically replacing
+    ``CURRENT``, so a crash mid-write leaves the previous generation intact.
+    Chunk text and metadata live in ``docstore.sqlite`` keyed by docstore id,
+    FAISS label and file id; only the added/deleted documents are written on each
+    save, and rows are read back lazily for the hits a search returns. The
+    term counts the BM25 index is built from are kept per label in the same
+    database, so a save writes only the changed documents' terms and a
+    replica picks up a new generation by reading just the labels it added
+    (deleted ones are still tombstoned in the meta until a compaction, after
+    which replicas rebuild their lexical index once).
+
+    With ``read_only=True`` the docstore is opened read-only and indexes can
+    be memory-mapped, so several processes share the same pages through the
+    OS page cache.
+    """
+
+    POINTER_FILE = "CURRENT"
+    DOCSTORE_FILE = "docstore.sqlite"
+
+    def __init__(self, persist_directory: str, read_only: bool = False):
+        self.persist_directory = persist_directory
+        self.read_only = read_only
+        self.pointer_path = os.path.join(persist_directory, self.POINTER_FILE)
+        self.docstore_path = os.path.join(persist_directory, self.DOCSTORE_FILE)
+        # SQLite connections are per thread so concurrent searches can read in parallel
+        self._local = threading.local()
+        if read_only:
+            return
+
+        os.makedirs(persist_directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "doc_id TEXT PRIMARY KEY, content TEXT NOT NULL, metadata TEXT NOT NULL, label INTEGER, file_id TEXT)"
+        )
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS documents_label ON documents (label)")
+        conn.execute("CREATE INDEX IF NOT EXISTS documents_file_id ON documents (file_id)")
+        conn.execute("CREATE TABLE IF NOT EXISTS lexical_terms (label INTEGER PRIMARY KEY, counts TEXT NOT NULL)")
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                conn = sqlite3.connect(f"file:{self.docstore_path}?mode=ro", uri=True)
+            else:
+                conn = sqlite3.connect(self.docstore_path)
+            self._local.conn = conn
+        return conn
+
+    def _paths(self, generation: int) -> Tuple[str, str]:
+        base = os.path.join(self.persist_directory, f"index-{generation}")
+        return base + ".faiss", base + ".json"
+
+    def current_generation(self) -> Optional[int]:
+        """Return the published generation, or None if nothing was saved yet"""
+        if not os.path.exists(self.pointer_path):
+            return None
+        with open(self.pointer_path, 'r', encoding='utf-8') as f:
+            return json.load(f)["generation"]
+
+    def has_legacy_index(self) -> bool:
+        """Check for an index written by FAISS.save_local (index.faiss + index.pkl)"""
+        return (self.current_generation() is None and
+                os.path.exists(os.path.join(self.persist_directory, "index.faiss")) and
+                os.path.exists(os.path.join(self.persist_directory, "index.pkl")))
+
+    def load(self, mmap: bool = False) -> Optional[Tuple[faiss.Index, Dict]]:
+        """Load the published index and its metadata.
+
+        With ``mmap`` the index is memory-mapped read-only instead of being
+        read into RAM; it must then never be modified.
+        """
+        for attempt in range(3):
+            generation = self.current_generation()
+            if generation is None:
+                return None
+            index_path, meta_path = self._paths(generation)
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                if mmap:
+                    index = faiss.read_index(index_path, self._mmap_flags(meta.get("kind")))
+                else:
+                    index = faiss.read_index(index_path)
+                break
+            except (RuntimeError, OSError):
+                # A writer may have published a newer generation and removed this one
+                if attempt == 2 or self.current_generation() == generation:
+                    raise
+        meta["generation"] = generation
+
+        if not self.read_only:
+            self._prune(meta)
+        return index, meta
+
+    @staticmethod
+    def _mmap_flags(kind: Optional[str]) -> int:
+        """Read-only mmap flags for an index kind.
+
+        Flat and HNSW indexes are mapped in place (IO_FLAG_MMAP_IFC); IVF
+        inverted lists only support IO_FLAG_MMAP, and fail with both flags.
+        """
+        ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        if kind == INDEX_IVF or not ifc:
+            return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        return ifc | faiss.IO_FLAG_READ_ONLY
+
+    def _prune(self, meta: Dict):
+        """Drop rows the published generation does not reference.
+
+        Rows labelled at or past ``next_label`` were written by a save that
+        crashed before publishing its index; ``deleted`` lists rows whose
+        removal may not have been committed after the generation was published.
+        """
+        conn = self._connection()
+        conn.execute("DELETE FROM lexical_terms WHERE label >= ?", (meta.get("next_label", 0),))
+        conn.execute("DELETE FROM documents WHERE label >= ?", (meta.get("next_label", 0),))
+        self._delete_documents(conn, meta.get("deleted", []))
+        conn.commit()
+
+    def _delete_documents(self, conn: sqlite3.Connection, doc_ids: List[str]):
+        """Delete documents and their term counts (the caller commits)"""
+        params = [(doc_id,) for doc_id in doc_ids]
+        conn.executemany("DELETE FROM lexical_terms WHERE label = (SELECT label FROM documents WHERE doc_id = ?)",
+                         params)
+        conn.executemany("DELETE FROM documents WHERE doc_id = ?", params)
+
+    def iter_term_counts(self, min_label: int, max_label: int) -> Iterable[Tuple[int, Dict[str, int]]]:
+        """Yield (label, term counts) for the stored documents labelled in [min_label, max_label)"""
+        for label, counts in self._connection().execute(
+                "SELECT label, counts FROM lexical_terms WHERE label >= ? AND label < ?", (min_label, max_label)):
+            yield label, json.loads(counts)
+
+    def count(self, max_label: int) -> int:
+        """Number of stored documents labelled below ``max_label``"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM documents WHERE label < ?", (max_label,)).fetchone()[0]
+
+    def get_by_labels(self, labels: List[int]) -> Dict[int, Tuple[str, Document]]:
+        """Read the documents for a handful of labels (e.g. the top-k hits)"""
+        found = {}
+        conn = self._connection()
+        for start in range(0, len(labels), 500):
+            batch = [int(label) for label in labels[start:start + 500]]
+            placeholders = ",".join("?" * len(batch))
+            for doc_id, content, metadata, label in conn.execute(
+                    f"SELECT doc_id, content, metadata, label FROM documents WHERE label IN ({placeholders})", batch):
+                found[label] = (doc_id, Document(page_content=content, metadata=json.loads(metadata)))
+        return found
+
+    def labels_for(self, doc_ids: List[str]) -> Dict[str, int]:
+        """Look up the FAISS labels of stored documents"""
+        found = {}
+        conn = self._connection()
+        for start in range(0, len(doc_ids), 500):
+            batch = doc_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            found.update(conn.execute(
+                f"SELECT doc_id, label FROM documents WHERE doc_id IN ({placeholders})", batch).fetchall())
+        return found
+
+    def ids_for_file(self, file_id: str, max_label: int) -> Dict[str, int]:
+        """Map the ids of the stored documents of one file to their labels"""
+        return dict(self._connection().execute(
+            "SELECT doc_id, label FROM documents WHERE file_id = ? AND label < ?", (file_id, max_label)).fetchall())
+
+    def ids_by_file_id(self, max_label: int) -> Dict[str, List[str]]:
+        """Group stored document ids by the file_id in their metadata"""
+        grouped = {}
+        for doc_id, file_id in self._connection().execute(
+                "SELECT doc_id, file_id FROM documents WHERE file_id IS NOT NULL AND label < ?", (max_label,)):
+            grouped.setdefault(file_id, []).append(doc_id)
+        return grouped
+
+    def save(self, index_bytes: np.ndarray, meta: Dict,
+             added: Iterable[Tuple[int, str, Document]], deleted: Iterable[str]):
+        """Persist a serialized index plus the docstore delta since the last save"""
+        if self.read_only:
+            raise RuntimeError("Vector store was opened read-only")
+        added = list(added)
+        deleted = list(deleted)
+        conn = self._connection()
+
+        # New documents first: extra rows are harmless if we crash before the
+        # index that references them is published
+        conn.executemany(
+            "INSERT OR REPLACE INTO documents (doc_id, content, metadata, label, file_id) VALUES (?, ?, ?, ?, ?)",
+            [(doc_id, doc.page_content, json.dumps(doc.metadata), int(label), doc.metadata.get("file_id"))
+             for label, doc_id, doc in added]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO lexical_terms (label, counts) VALUES (?, ?)",
+            [(int(label), json.dumps(term_counts(doc.page_content), separators=(",", ":")))
+             for label, _, doc in added]
+        )
+        conn.commit()
+
+        previous = self.current_generation()
+        generation = (previous or 0) + 1
+        index_path, meta_path = self._paths(generation)
+        atomic_write(index_path, index_bytes.tobytes())
+        atomic_write(meta_path, json.dumps({**meta, "deleted": deleted}).encode('utf-8'))
+        atomic_write(self.pointer_path, json.dumps({"generation": generation}).encode('utf-8'))
+
+        # Only drop rows once no published index references them
+        self._delete_documents(conn, deleted)
+        conn.commit()
+
+        # Readers that still map the previous generation keep their pages
+        # until they reload; unlinking does not invalidate existing mappings
+        if previous is not None:
+            index_path, meta_path = self._paths(previous)
+            for path in (index_path, meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
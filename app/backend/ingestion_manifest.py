@@ -0,0 +1,110 @@
+# ingestion_manifest.py
+import os
+import json
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional
+
+
+class IngestionManifest:
+    """Persisted record of which Appwrite files are already in the vector store.
+
+    Each entry is keyed by Appwrite file id and stores the content hash,
+    the ``$updatedAt`` / ``signature`` reported by Appwrite, the chunk count
+    and the vector ids the chunks were stored under, so startup can skip
+    unchanged files without downloading them and drop stale vectors for
+    files that changed or were removed.
+
+    Methods are thread-safe. Register ``snapshot`` as a vector store flush
+    hook so the manifest on disk never lists vectors the published index
+    does not hold.
+    """
+
+    FILE_NAME = "ingestion_manifest.json"
+
+    def __init__(self, persist_directory: str = "faiss_index"):
+        self.path = os.path.join(persist_directory, self.FILE_NAME)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        """Load the manifest from disk if available"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("files", {})
+        except Exception as e:
+            print(f"Error loading ingestion manifest: {e}")
+            return {}
+
+    def save(self):
+        """Atomically write the manifest to disk"""
+        self.snapshot()()
+
+    def snapshot(self) -> Callable[[], None]:
+        """Copy the entries now and return a function that writes that copy"""
+        with self._lock:
+            data = json.dumps({"version": 1, "files": self.entries})
+        return lambda: self._write(data)
+
+    def _write(self, data: str):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, file_id: str) -> bool:
+        return file_id in self.entries
+
+    def file_ids(self) -> List[str]:
+        """Return the ids of all files recorded in the manifest"""
+        with self._lock:
+            return list(self.entries)
+
+    def get(self, file_id: str) -> Optional[Dict]:
+        """Return the manifest entry for a file, if any"""
+        return self.entries.get(file_id)
+
+    def is_current(self, file: Dict) -> bool:
+        """Check whether an Appwrite file listing matches what was ingested"""
+        entry = self.entries.get(file["$id"])
+        if entry is None:
+            return False
+        signature = file.get("signature")
+        if signature and entry.get("signature"):
+            return signature == entry["signature"]
+        return entry.get("updated_at") is not None and entry.get("updated_at") == file.get("$updatedAt")
+
+    def record(self, file: Dict, content_hash: str, vector_ids: List[str]):
+        """Record that a file has been ingested under the given vector ids"""
+        entry = {
+            "name": file.get("name"),
+            "content_hash": content_hash,
+            "updated_at": file.get("$updatedAt"),
+            "signature": file.get("signature"),
+            "chunk_count": len(vector_ids),
+            "vector_ids": list(vector_ids),
+        }
+        with self._lock:
+            self.entries[file["$id"]] = entry
+
+    def remove(self, file_id: str) -> Optional[Dict]:
+        """Remove a file from the manifest, returning its old entry"""
+        with self._lock:
+            return self.entries.pop(file_id, None)
+
+    def clear(self):
+        """Forget every recorded file"""
+        with self._lock:
+            self.entries = {}
@@ -0,0 +1,299 @@
+# ingestion_pipeline.py
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from backend.document_processor import DocumentProcessor
+from backend.metrics import REGISTRY, span
+from utils.helpers import get_file_hash
+
+# Per-process DocumentProcessor used by extraction workers
+_worker_processor = None
+
+
+def _init_extract_worker(chunk_size: int, chunk_overlap: int, ocr_workers: Optional[int] = None):
+    """Create the DocumentProcessor once per extraction worker process"""
+    global _worker_processor
+    _worker_processor = DocumentProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                          ocr_workers=ocr_workers)
+
+
+def _extract_chunks(file_path: str) -> Tuple[List[Tuple[str, Dict]], Dict]:
+    """Extract and chunk a downloaded file inside an extraction worker.
+
+    Returns the chunks and the worker's stage timings for this file, which
+    the parent merges into its own metrics registry.
+    """
+    REGISTRY.reset()
+    chunks = list(_worker_processor.iter_chunks(file_path))
+    return chunks, REGISTRY.export()
+
+
+class IngestionResult:
+    """Outcome of pushing one Appwrite file through the pipeline"""
+    INGESTED = "ingested"
+    UNCHANGED = "unchanged"
+    FAILED = "failed"
+
+    def __init__(self, file: Dict, status: str, content_hash: Optional[str] = None,
+                 vector_ids: Optional[List[str]] = None, error: Optional[Exception] = None):
+        self.file = file
+        self.status = status
+        self.content_hash = content_hash
+        self.vector_ids = vector_ids or []
+        self.error = error
+
+
+class IngestionStats:
+    """Thread-safe progress and throughput counters for a pipeline run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counts = {
+            "listed": 0, "downloaded": 0, "bytes": 0, "extracted": 0,
+            "ingested": 0, "unchanged": 0, "failed": 0, "chunks": 0, "embed_batches": 0,
+        }
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def snapshot(self) -> Dict:
+        """Return the counters plus elapsed time and throughput"""
+        with self._lock:
+            counts = dict(self.counts)
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        done = counts["ingested"] + counts["unchanged"] + counts["failed"]
+        counts.update({
+            "elapsed_s": round(elapsed, 2),
+            "files_per_s": round(done / elapsed, 2),
+            "chunks_per_s": round(counts["chunks"] / elapsed, 2),
+            "mb_per_s": round(counts["bytes"] / elapsed / 1e6, 2),
+        })
+        return counts
+
+    def report(self) -> str:
+        s = self.snapshot()
+        return (f"[ingest] {s['ingested'] + s['unchanged'] + s['failed']}/{s['listed']} files "
+                f"(downloaded {s['downloaded']}, extracted {s['extracted']}, "
+                f"ingested {s['ingested']}, unchanged {s['unchanged']}, failed {s['failed']}) "
+                f"{s['chunks']} chunks in {s['embed_batches']} batches, "
+                f"{s['files_per_s']} files/s, {s['chunks_per_s']} chunks/s, "
+                f"{s['mb_per_s']} MB/s, {s['elapsed_s']}s elapsed")
+
+
+class IngestionPipeline:
+    """Staged download -> extract -> embed pipeline for bulk bucket syncs.
+
+    Downloads run on a thread pool (I/O bound), text extraction/OCR on a
+    process pool (CPU bound) and embedding is done by the consuming thread in
+    large batches across files. Each stage has its own concurrency limit and
+    a bounded number of files waiting in front of it, so a slow stage applies
+    backpressure instead of piling up temp files or chunk text in memory.
+    """
+
+    def __init__(self, appwrite_client, vector_store, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 download_workers: Optional[int] = None, extract_workers: Optional[int] = None,
+                 embed_batch_size: Optional[int] = None, queue_size: Optional[int] = None,
+                 report_interval: float = 10.0):
+        self.appwrite_client = appwrite_client
+        self.vector_store = vector_store
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.download_workers = download_workers or int(os.getenv("INGEST_DOWNLOAD_WORKERS", 8))
+        # 0 extraction workers runs extraction on the download threads instead
+        # of a process pool (useful where worker processes are unavailable)
+        if extract_workers is None:
+            extract_workers = int(os.getenv("INGEST_EXTRACT_WORKERS", os.cpu_count() or 1))
+        self.extract_workers = extract_workers
+        self.embed_batch_size = embed_batch_size or int(os.getenv("INGEST_EMBED_BATCH_SIZE", 500))
+        # Files allowed to wait in front of each stage
+        self.queue_size = queue_size or int(os.getenv("INGEST_QUEUE_SIZE", 16))
+        self.report_interval = report_interval
+        self.stats = IngestionStats()
+
+    def run(self, files: Iterable[Dict],
+            previous_hash: Callable[[str], Optional[str]] = lambda file_id: None) -> Iterator[IngestionResult]:
+        """Push files through the pipeline, yielding one result per file.
+
+        ``previous_hash(file_id)`` returns the content hash the file was last
+        ingested with; files whose downloaded bytes still match are reported
+        as unchanged without being extracted or embedded. Results are yielded
+        on the calling thread, so callers can update their own state without
+        locking. Errors raised while iterating ``files`` are re-raised after
+        the files already submitted have been drained.
+        """
+        self.stats = IngestionStats()
+        results = queue.Queue()
+        download_slots = threading.BoundedSemaphore(self.download_workers + self.queue_size)
+        extract_slots = threading.BoundedSemaphore(max(self.extract_workers, 1) + self.queue_size)
+        feeder_state = {"total": None, "error": None}
+
+        downloads = ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix="ingest-download")
+        extractor = None
+        # Split the cores between extraction workers so their OCR pools do
+        # not start cpu_count tesseract processes each
+        ocr_workers = max(1, (os.cpu_count() or 1) // max(self.extract_workers, 1))
+        if self.extract_workers > 0:
+            # Workers are spawned rather than forked: the parent already runs
+            # download threads and gRPC clients, which do not survive fork()
+            extractor = ProcessPoolExecutor(max_workers=self.extract_workers,
+                                            mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_extract_worker,
+                                            initargs=(self.chunk_size, self.chunk_overlap, ocr_workers))
+        else:
+            _init_extract_worker(self.chunk_size, self.chunk_overlap)
+
+        def finish_extract(file, content_hash, file_path, future):
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+            try:
+                chunks, stage_metrics = future.result()
+                if stage_metrics:
+                    REGISTRY.merge(stage_metrics)
+                self.stats.incr("extracted")
+                results.put(("chunks", file, content_hash, chunks))
+            except Exception as e:
+                extract_slots.release()
+                results.put(("result", IngestionResult(file, IngestionResult.FAILED, content_hash, error=e)))
+
+        def download(file):
+            file_path = None
+            try:
+                with span("download"):
+                    file_path = self.appwrite_client.download_document(file["$id"])
+                if not file_path:
+                    raise IOError(f"Download failed for {file.get('name', file['$id'])}")
+                self.stats.incr("downloaded")
+                self.stats.incr("bytes", os.path.getsize(file_path))
+                content_hash = get_file_hash(file_path)
+
+                # Same bytes as last time: nothing to extract or embed
+                if content_hash == previous_hash(file["$id"]):
+                    os.remove(file_path)
+                    results.put(("result", IngestionResult(file, IngestionResult.UNCHANGED, content_hash)))
+                    return
+
+                # Backpressure: wait for room in front of the extraction stage
+                extract_slots.acquire()
+                try:
+                    future = self._submit_extract(extractor, file_path)
+                except Exception:
+                    extract_slots.release()
+                    raise
+                future.add_done_callback(lambda f: finish_extract(file, content_hash, file_path, f))
+            except Exception as e:
+                if file_path and os.path.exists(file_path):
+                    os.remove(file_path)
+                results.put(("result", IngestionResult(file, IngestionResult.FAILED, error=e)))
+            finally:
+                download_slots.release()
+
+        def feed():
+            total = 0
+            try:
+                for file in files:
+                    # Backpressure: bound downloads in flight plus files waiting on extraction
+                    download_slots.acquire()
+                    total += 1
+                    self.stats.incr("listed")
+                    downloads.submit(download, file)
+            except Exception as e:
+                feeder_state["error"] = e
+            finally:
+                feeder_state["total"] = total
+                results.put(("fed",))
+
+        feeder = threading.Thread(target=feed, name="ingest-feeder", daemon=True)
+        feeder.start()
+
+        finished = 0
+        pending = []
+        pending_chunks = 0
+        last_report = time.monotonic()
+        try:
+            while feeder_state["total"] is None or finished < feeder_state["total"]:
+                try:
+                    item = results.get(timeout=1.0)
+                except queue.Empty:
+                    item = None
+
+                if item is not None and item[0] == "chunks":
+                    _, file, content_hash, chunks = item
+                    extract_slots.release()
+                    pending.append((file, content_hash, chunks))
+                    pending_chunks += len(chunks)
+                elif item is not None and item[0] == "result":
+                    finished += 1
+                    self._count(item[1])
+                    yield item[1]
+
+                # Embed once a batch is full, or flush whatever is left when
+                # nothing else is in flight
+                drained = feeder_state["total"] is not None and \
+                    finished + len(pending) >= feeder_state["total"]
+                if pending and (pending_chunks >= self.embed_batch_size or drained):
+                    for result in self._embed_batch(pending):
+                        finished += 1
+                        self._count(result)
+                        yield result
+                    pending, pending_chunks = [], 0
+
+                if time.monotonic() - last_report >= self.report_interval:
+                    print(self.stats.report())
+                    last_report = time.monotonic()
+        finally:
+            downloads.shutdown(wait=True)
+            if extractor is not None:
+                extractor.shutdown(wait=True)
+
+        print(self.stats.report())
+        if feeder_state["error"] is not None:
+            raise feeder_state["error"]
+
+    @staticmethod
+    def _submit_extract(extractor, file_path: str) -> Future:
+        """Run extraction on the process pool, or inline when there is none"""
+        if extractor is not None:
+            return extractor.submit(_extract_chunks, file_path)
+        future = Future()
+        try:
+            # Inline extraction already records into this process's registry
+            future.set_result((list(_worker_processor.iter_chunks(file_path)), None))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _count(self, result: IngestionResult):
+        self.stats.incr(result.status)
+        if result.status == IngestionResult.INGESTED:
+            self.stats.incr("chunks", len(result.vector_ids))
+
+    def _embed_batch(self, pending) -> List[IngestionResult]:
+        """Embed and index the chunks of several files with one add_documents call"""
+        texts, metadatas = [], []
+        for file, _, chunks in pending:
+            for chunk, chunk_metadata in chunks:
+                texts.append(chunk)
+                metadatas.append({**chunk_metadata, "source": file["name"], "file_id": file["$id"]})
+
+        try:
+            vector_ids = self.vector_store.add_documents(texts, metadatas)
+            self.stats.incr("embed_batches")
+        except Exception as e:
+            return [IngestionResult(file, IngestionResult.FAILED, content_hash, error=e)
+                    for file, content_hash, _ in pending]
+
+        # Split the returned ids back per file
+        results, offset = [], 0
+        for file, content_hash, chunks in pending:
+            results.append(IngestionResult(file, IngestionResult.INGESTED, content_hash,
+                                           vector_ids[offset:offset + len(chunks)]))
+            offset += len(chunks)
+        return results
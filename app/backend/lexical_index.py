@@ -0,0 +1,115 @@
+# lexical_index.py
+import heapq
+import math
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Frequent words that carry no keyword signal; dropping them keeps posting
+# lists short and queries fast
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in",
+    "is", "it", "its", "me", "my", "of", "on", "or", "that", "the", "their", "there", "this", "to", "was",
+    "we", "what", "when", "where", "which", "who", "why", "will", "with", "you", "your",
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Codes such as "CS-101", "B.204" or "MA_2010" also index as one joined token,
+# so they match however the query writes them ("cs101", "CS 101", "cs-101")
+_CODE = re.compile(r"\b([a-z]+)[\s\-._/]([0-9]+[a-z]?)\b")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens plus joined course/room codes, without stopwords"""
+    text = text.lower()
+    tokens = [word for word in _WORD.findall(text) if word not in STOPWORDS]
+    tokens.extend(letters + digits for letters, digits in _CODE.findall(text) if letters not in STOPWORDS)
+    return tokens
+
+
+def term_counts(text: str) -> Dict[str, int]:
+    """Term frequencies of a text, as stored per document"""
+    counts = {}
+    for token in tokenize(text):
+        counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+class BM25Index:
+    """In-memory BM25 inverted index over chunk texts, keyed by FAISS label.
+
+    Postings map each term to ``{label: term frequency}``. Removing a
+    document drops it from the length statistics at once and from the
+    posting lists in one batched pass once enough removals accumulate, so
+    deletes stay cheap. The index is not serialized as a whole: the docstore
+    keeps each document's term counts (see IndexPersistence), so it is
+    rebuilt or updated with add_counts().
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}     # term -> {label: term frequency}
+        self.doc_len = {}      # label -> number of tokens
+        self.total_len = 0
+        self._removed = set()  # labels still present in posting lists
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    def add(self, labels: Iterable[int], texts: Iterable[str]):
+        self.add_counts(labels, (term_counts(text) for text in texts))
+
+    def add_counts(self, labels: Iterable[int], counts: Iterable[Dict[str, int]]):
+        """Add documents by their term counts (e.g. as read back from the docstore)"""
+        for label, doc_counts in zip(labels, counts):
+            label = int(label)
+            length = sum(doc_counts.values())
+            self.doc_len[label] = length
+            self.total_len += length
+            self._removed.discard(label)
+            for term, tf in doc_counts.items():
+                self.postings.setdefault(term, {})[label] = tf
+
+    def remove(self, labels: Iterable[int]):
+        for label in labels:
+            length = self.doc_len.pop(int(label), None)
+            if length is not None:
+                self.total_len -= length
+                self._removed.add(int(label))
+        if len(self._removed) > max(1000, len(self.doc_len) // 4):
+            self._purge()
+
+    def _purge(self):
+        """Drop removed labels from every posting list"""
+        removed = self._removed
+        for term in list(self.postings):
+            postings = {label: tf for label, tf in self.postings[term].items() if label not in removed}
+            if postings:
+                self.postings[term] = postings
+            else:
+                del self.postings[term]
+        self._removed = set()
+
+    def search(self, query: str, k: int, exclude: Optional[Set[int]] = None) -> Tuple[List[Tuple[float, int]], float]:
+        """Return the top-k (score, label) pairs and the share of query terms the best hit contains"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.doc_len:
+            return [], 0.0
+        exclude = exclude or set()
+        n = len(self.doc_len)
+        avg_len = self.total_len / n if n else 0.0
+        scores = {}
+        matched = {}
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for label, tf in postings.items():
+                if label in self._removed or label in exclude:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[label] / avg_len) if avg_len else self.k1
+                scores[label] = scores.get(label, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[label] = matched.get(label, 0) + 1
+        hits = heapq.nlargest(k, ((score, label) for label, score in scores.items()))
+        return hits, (matched[hits[0][1]] / len(terms) if hits else 0.0)
@@ -0,0 +1,292 @@
+# llm_client.py
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, Optional
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    RETRYABLE_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable,
+                        google_exceptions.DeadlineExceeded, google_exceptions.InternalServerError)
+except ImportError:
+    RETRYABLE_ERRORS = ()
+
+logger = logging.getLogger(__name__)
+
+# Error texts that mean "try again later" when the exception type is not known
+RETRYABLE_MARKERS = ("429", "resource exhausted", "resource_exhausted", "quota", "rate limit",
+                     "503", "unavailable", "deadline exceeded", "timed out", "500 internal")
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an LLM error is transient (quota, overload, timeout)"""
+    if RETRYABLE_ERRORS and isinstance(error, RETRYABLE_ERRORS):
+        return True
+    text = str(error).lower()
+    return any(marker in text for marker in RETRYABLE_MARKERS)
+
+
+class TokenBucket:
+    """Token-bucket rate limiter whose state lives in SQLite.
+
+    Every thread and every worker process that opens the same ``path``
+    draws from one bucket (updates run in ``BEGIN IMMEDIATE``
+    transactions); with no path the bucket is private to the process.
+    Tokens refill at ``rate_per_minute`` up to ``burst``.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, burst: int, path: Optional[str] = None):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        directory = os.path.dirname(path) if path else ""
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=30,
+                                     isolation_level=None)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+
+    def _take(self) -> float:
+        """Take a token if one is available; otherwise return the seconds until one is"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?",
+                                         (self.name,)).fetchone()
+                now = time.time()
+                tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / self.rate
+                self._conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                                   (self.name, tokens, now))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def acquire(self, deadline: Optional[float] = None) -> float:
+        """Block until a token is taken and return the seconds waited.
+
+        Raises TimeoutError if no token can be had before ``deadline``
+        (a time.monotonic() value).
+        """
+        started = time.monotonic()
+        while True:
+            wait = self._take()
+            if not wait:
+                return time.monotonic() - started
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise TimeoutError(f"Rate limit for {self.name}: no capacity before the deadline")
+            # Jitter so waiters do not all wake for the same token
+            time.sleep(wait * random.uniform(1.0, 1.5))
+
+
+class _SharedStream:
+    """Chunks of one streamed call, replayed to every consumer that joined it"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._items = []
+        self._done = False
+        self._error = None
+
+    def append(self, item):
+        with self._condition:
+            self._items.append(item)
+            self._condition.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._condition:
+            self._done = True
+            self._error = error
+            self._condition.notify_all()
+
+    def iterate(self) -> Iterator:
+        position = 0
+        while True:
+            with self._condition:
+                while position >= len(self._items) and not self._done:
+                    self._condition.wait()
+                if position < len(self._items):
+                    item = self._items[position]
+                    position += 1
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            yield item
+
+
+class SingleFlight:
+    """Coalesce identical in-flight calls: the first caller runs, the rest share its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}     # key -> Future
+        self._streams = {}   # key -> _SharedStream
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(timeout=timeout)
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stream(self, key: str, make_iterator: Callable[[], Iterator]) -> Iterator:
+        """Share one underlying stream between every caller with the same key.
+
+        The stream is consumed on a background thread, so a consumer that
+        stops early (e.g. a disconnected client) does not cut off the others.
+        """
+        with self._lock:
+            shared = self._streams.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._streams[key] = _SharedStream()
+            else:
+                self.coalesced += 1
+        if leader:
+            threading.Thread(target=self._produce, args=(key, shared, make_iterator),
+                             name="llm-stream", daemon=True).start()
+        return shared.iterate()
+
+    def _produce(self, key: str, shared: _SharedStream, make_iterator: Callable[[], Iterator]):
+        try:
+            for item in make_iterator():
+                shared.append(item)
+            shared.finish()
+        except BaseException as e:
+            shared.finish(e)
+        finally:
+            with self._lock:
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+
+
+class ResilientLLM:
+    """Wrap a LangChain chat model with coalescing, rate limiting and retries.
+
+    ``invoke`` and ``stream`` keep the chat model's interface. Identical
+    prompts in flight at the same time share one call; every call takes a
+    token from ``limiter`` first; transient errors (429, 503, timeouts) are
+    retried with full-jitter exponential backoff until ``deadline`` seconds
+    have passed. Streams are only retried before their first chunk.
+    """
+
+    def __init__(self, llm, limiter: Optional[TokenBucket] = None, deadline: Optional[float] = None,
+                 base_delay: float = 0.5, max_delay: float = 20.0, single_flight: Optional[SingleFlight] = None):
+        self.llm = llm
+        self.model = getattr(llm, "model", type(llm).__name__)
+        self.limiter = limiter
+        self.deadline = deadline or float(os.getenv("LLM_CALL_DEADLINE", 60))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.single_flight = single_flight or SingleFlight()
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    def _key(self, prompt) -> str:
+        if isinstance(prompt, str):
+            text = prompt
+        else:
+            text = json.dumps([(type(message).__name__, message.content) for message in prompt])
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _acquire(self, deadline: float):
+        if self.limiter is not None:
+            waited = self.limiter.acquire(deadline)
+            with self._stats_lock:
+                self.calls += 1
+                self.throttled_seconds += waited
+        else:
+            with self._stats_lock:
+                self.calls += 1
+
+    def _backoff(self, error: Exception, attempt: int, deadline: float) -> float:
+        """Delay before the next attempt; re-raises if the error is final or time is up"""
+        if not is_retryable(error):
+            raise error
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if time.monotonic() + delay > deadline:
+            raise error
+        logger.warning(f"{self.model} call failed ({error}); retrying in {delay:.1f}s")
+        with self._stats_lock:
+            self.retries += 1
+        return delay
+
+    def invoke(self, prompt, **kwargs):
+        deadline = time.monotonic() + self.deadline
+        return self.single_flight.do(self._key(prompt), lambda: self._invoke(prompt, deadline, **kwargs),
+                                     timeout=self.deadline)
+
+    def _invoke(self, prompt, deadline: float, **kwargs):
+        attempt = 0
+        while True:
+            self._acquire(deadline)
+            try:
+                return self.llm.invoke(prompt, **kwargs)
+            except Exception as e:
+                time.sleep(self._backoff(e, attempt, deadline))
+                attempt += 1
+
+    def stream(self, prompt, **kwargs) -> Iterator:
+        deadline = time.monotonic() + self.deadline
+        return self.single_flight.stream(self._key(prompt), lambda: self._stream(prompt, deadline, **kwargs))
+
+    def _stream(self, prompt, deadline: float, **kwargs) -> Iterator:
+        attempt = 0
+        while True:
+            self._acquire(deadline)
+            iterator = iter(self.llm.stream(prompt, **kwargs))
+            try:
+                first = next(iterator)
+            except StopIteration:
+                return
+            except Exception as e:
+                time.sleep(self._backoff(e, attempt, deadline))
+                attempt += 1
+                continue
+            # Chunks already sent cannot be taken back, so later errors propagate
+            yield first
+            yield from iterator
+            return
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.single_flight.coalesced,
+                "retries": self.retries,
+                "throttled_seconds": round(self.throttled_seconds, 2),
+            }
@@ -0,0 +1,218 @@
+# metrics.py
+import time
+import bisect
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Histogram bucket upper bounds in seconds, from cache lookups to slow LLM calls
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, as Prometheus exposes them"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def state(self) -> Tuple:
+        return list(self.counts), self.sum, self.count, self.min, self.max
+
+    def merge(self, counts: List[int], total: float, count: int, low: float, high: float):
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket (like histogram_quantile).
+
+        The estimate is kept within the smallest and largest observed values.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        estimate = self.max
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index < len(self.buckets):
+                    lower = self.buckets[index - 1] if index else 0.0
+                    estimate = lower + (self.buckets[index] - lower) * (rank - seen) / count
+                break
+            seen += count
+        return min(max(estimate, self.min), self.max)
+
+
+class Span:
+    """Times a block and records it for a stage; ``ms`` holds the duration afterwards"""
+
+    def __init__(self, registry: "MetricsRegistry", stage: str):
+        self.registry = registry
+        self.stage = stage
+        self.seconds = 0.0
+
+    @property
+    def ms(self) -> float:
+        return round(self.seconds * 1000, 1)
+
+    def __enter__(self) -> "Span":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.seconds = time.perf_counter() - self._started
+        self.registry.observe(self.stage, self.seconds)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.registry.error(self.stage)
+        return False
+
+
+class MetricsRegistry:
+    """Per-process latency histograms and error counters for named stages.
+
+    Stages are ingestion steps (download, extract, ocr, chunk,
+    embed_document, index_write, ...) and query steps (condense,
+    embed_query, vector_search, generate, ...). Spans may nest, e.g. ocr
+    time is also part of the extract time of the same page. Each worker
+    process keeps its own registry; extraction workers send theirs back
+    with each file (see export/merge).
+    """
+
+    def __init__(self, prefix: str = "docqa", buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}   # stage -> Histogram
+        self._errors = {}       # stage -> count
+
+    def span(self, stage: str) -> Span:
+        return Span(self, stage)
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def error(self, stage: str):
+        with self._lock:
+            self._errors[stage] = self._errors.get(stage, 0) + 1
+
+    def timed_iter(self, stage: str, iterable: Iterable) -> Iterator:
+        """Yield from an iterator, recording the time each item took to produce"""
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except Exception:
+                self.error(stage)
+                raise
+            self.observe(stage, time.perf_counter() - started)
+            yield item
+
+    def export(self) -> Dict:
+        """Picklable copy of the registry, to be merged into another process's"""
+        with self._lock:
+            return {
+                "histograms": {stage: h.state() for stage, h in self._histograms.items()},
+                "errors": dict(self._errors),
+            }
+
+    def merge(self, exported: Dict):
+        with self._lock:
+            for stage, state in exported.get("histograms", {}).items():
+                histogram = self._histograms.get(stage)
+                if histogram is None:
+                    histogram = self._histograms[stage] = Histogram(self.buckets)
+                histogram.merge(*state)
+            for stage, count in exported.get("errors", {}).items():
+                self._errors[stage] = self._errors.get(stage, 0) + count
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._errors = {}
+
+    def summary(self) -> Dict[str, Dict]:
+        """Count, mean and estimated p50/p95 (in ms) and errors per stage"""
+        with self._lock:
+            return {
+                stage: {
+                    "count": h.count,
+                    "mean_ms": round(h.sum / h.count * 1000, 2) if h.count else 0.0,
+                    "p50_ms": round(h.quantile(0.5) * 1000, 2),
+                    "p95_ms": round(h.quantile(0.95) * 1000, 2),
+                    "errors": self._errors.get(stage, 0),
+                }
+                for stage, h in sorted(self._histograms.items())
+            }
+
+    def render(self, samples: Optional[List[Tuple[str, str, str, float]]] = None) -> str:
+        """Prometheus text exposition format.
+
+        ``samples`` adds unlabelled (name, type, help, value) metrics, e.g.
+        cache and LLM counters kept elsewhere; names get the registry prefix.
+        """
+        name = f"{self.prefix}_stage_duration_seconds"
+        lines = [f"# HELP {name} Time spent in each ingestion and query stage.", f"# TYPE {name} histogram"]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                label = _label(stage)
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f'{name}_bucket{{stage="{label}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{label}"}} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{{stage="{label}"}} {histogram.count}')
+            errors = sorted(self._errors.items())
+
+        name = f"{self.prefix}_stage_errors_total"
+        lines += [f"# HELP {name} Stage runs that raised an error.", f"# TYPE {name} counter"]
+        lines += [f'{name}{{stage="{_label(stage)}"}} {count}' for stage, count in errors]
+
+        for sample_name, kind, help_text, value in samples or []:
+            sample_name = f"{self.prefix}_{sample_name}"
+            lines += [f"# HELP {sample_name} {help_text}", f"# TYPE {sample_name} {kind}",
+                      f"{sample_name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide registry used by the backend modules
+REGISTRY = MetricsRegistry()
+
+
+def span(stage: str) -> Span:
+    """Time a block as one run of a stage: ``with span("download"): ...``"""
+    return REGISTRY.span(stage)
+
+
+def observe(stage: str, seconds: float):
+    REGISTRY.observe(stage, seconds)
+
+
+def timed_iter(stage: str, iterable: Iterable) -> Iterator:
+    return REGISTRY.timed_iter(stage, iterable)
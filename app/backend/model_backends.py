@@ -0,0 +1,129 @@
+# model_backends.py
+import os
+import re
+import time
+import zlib
+import numpy as np
+from typing import Any, Iterator, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# EMBEDDING_BACKEND / LLM_BACKEND choose between the Google models and
+# in-process stand-ins that need no network or credentials
+EMBEDDING_BACKENDS = ("google", "local")
+LLM_BACKENDS = ("google", "stub")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Local CPU embeddings: signed feature hashing of words and word bigrams.
+
+    Texts are embedded a batch at a time into one NumPy matrix, with
+    log-scaled counts and L2-normalised rows. The vectors are deterministic
+    across processes and runs. They capture lexical rather than semantic
+    similarity, which is enough for offline development, load tests and
+    benchmarks.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[int]:
+        words = _TOKEN.findall(text.lower())
+        grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        return [zlib.crc32(gram.encode("utf-8")) for gram in grams]
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            rows.extend([row] * len(features))
+            hashes.extend(features)
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        # The top bit picks the sign so colliding features tend to cancel out
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.int64), (hashes % self.dim).astype(np.int64)), signs)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        return matrix.tolist()
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        return self._embed(texts) if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+
+class StubChatModel(BaseChatModel):
+    """Deterministic offline chat model for tests and benchmarks.
+
+    The reply is the last line of the prompt that is not a bare label
+    (e.g. "Question: ..." without "Question: "), cut to max_output_tokens
+    words. It arrives after ``latency`` seconds and streams at
+    ``tokens_per_second`` (0 for instantly), so the timing of a real model
+    can be simulated.
+    """
+
+    model: str = "stub"
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    max_output_tokens: int = 2048
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _reply(self, messages: List[BaseMessage]) -> List[str]:
+        text = messages[-1].content if messages else ""
+        lines = [line.strip() for line in text.splitlines() if line.strip() and not line.strip().endswith(":")]
+        reply = re.sub(r"^[\w ]{1,30}:\s+", "", lines[-1]) if lines else "OK"
+        return reply.split()[:self.max_output_tokens]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs) -> ChatResult:
+        words = self._reply(messages)
+        time.sleep(self.latency + (len(words) / self.tokens_per_second if self.tokens_per_second else 0))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        words = self._reply(messages)
+        time.sleep(self.latency)
+        for position, word in enumerate(words):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if position == 0 else " " + word))
+
+
+def create_embeddings(backend: Optional[str] = None) -> Tuple[Embeddings, str]:
+    """Build the configured embedding backend and the model name used for cache keys"""
+    backend = backend or os.getenv("EMBEDDING_BACKEND", "google")
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unsupported embedding backend: {backend}")
+    if backend == "local":
+        dim = int(os.getenv("LOCAL_EMBEDDING_DIM", 384))
+        return HashingEmbeddings(dim=dim), f"local-hashing-{dim}"
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    embeddings = GoogleGenerativeAIEmbeddings(google_api_key=os.getenv("GOOGLE_API_KEY"), model="embedding-001")
+    return embeddings, "embedding-001"
+
+
+def create_chat_model(model: str, backend: Optional[str] = None, **params) -> BaseChatModel:
+    """Build the configured chat model; params are the Gemini generation settings"""
+    backend = backend or os.getenv("LLM_BACKEND", "google")
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unsupported LLM backend: {backend}")
+    if backend == "stub":
+        return StubChatModel(
+            model=f"stub-{model}",
+            latency=float(os.getenv("STUB_LLM_LATENCY", 0)),
+            tokens_per_second=float(os.getenv("STUB_LLM_TOKENS_PER_SECOND", 0)),
+            max_output_tokens=params.get("max_output_tokens", 2048),
+        )
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(google_api_key=os.getenv("GOOGLE_API_KEY"), model=model, **params)
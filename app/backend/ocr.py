@@ -0,0 +1,110 @@
+# ocr.py
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+from backend.metrics import span
+from backend.ocr_cache import OcrCache
+
+# Each tesseract process should use one core; the pool provides the parallelism
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+class OcrEngine:
+    """Parallel, memory-bounded OCR for scanned PDFs and images.
+
+    Rasterisation (pdftoppm) and recognition (tesseract) both run as
+    external processes, so a small thread pool that drives them uses every
+    core without pickling page images between processes. Pages are rendered
+    a few at a time straight to a temp directory and handed to tesseract by
+    path, and only a bounded number of page ranges are in flight, so peak
+    memory does not grow with the page count. Recognised text is cached by
+    page image hash, so re-ingesting a scan skips tesseract entirely.
+    """
+
+    def __init__(self, workers: Optional[int] = None, dpi: Optional[int] = None,
+                 page_timeout: Optional[float] = None, pages_per_task: Optional[int] = None,
+                 lang: Optional[str] = None, config: Optional[str] = None, cache: Optional[OcrCache] = None):
+        self.workers = workers or int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+        self.dpi = dpi or int(os.getenv("OCR_DPI", 200))
+        # Seconds allowed to rasterise or recognise a single page
+        self.page_timeout = page_timeout or float(os.getenv("OCR_PAGE_TIMEOUT", 120))
+        self.pages_per_task = pages_per_task or int(os.getenv("OCR_PAGES_PER_TASK", 2))
+        self.lang = lang or os.getenv("OCR_LANG", "eng")
+        self.config = config if config is not None else os.getenv("OCR_CONFIG", "")
+        # An empty OCR_CACHE_PATH disables the cache
+        if cache is None:
+            cache_path = os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite")
+            cache = OcrCache(cache_path) if cache_path else None
+        self.cache = cache
+
+    def ocr_image(self, image) -> str:
+        """Recognise a single image (a path or a PIL image)"""
+        # OCR libraries load on first use, not when the app starts
+        import pytesseract
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self._image_bytes(image), self.lang, self.config)
+            text = self.cache.get(key)
+            if text is not None:
+                return text
+
+        with span("ocr"):
+            text = pytesseract.image_to_string(image, lang=self.lang, config=self.config,
+                                               timeout=self.page_timeout)
+        if key is not None:
+            self.cache.put(key, text)
+        return text
+
+    @staticmethod
+    def _image_bytes(image) -> bytes:
+        """The bytes that identify an image for caching"""
+        if isinstance(image, (str, os.PathLike)):
+            with open(image, 'rb') as f:
+                return f.read()
+        return f"{image.mode}\0{image.size}\0".encode("utf-8") + image.tobytes()
+
+    def ocr_pdf(self, pdf_path: str, page_count: int) -> Iterator[Tuple[int, str]]:
+        """Yield (page_number, text) for every page of a PDF, in page order.
+
+        Pages that fail or time out yield empty text instead of failing the
+        whole document.
+        """
+        ranges = [(first, min(first + self.pages_per_task - 1, page_count))
+                  for first in range(1, page_count + 1, self.pages_per_task)]
+        # Keep a couple of ranges queued per worker so no core sits idle,
+        # but never render far ahead of the consumer
+        max_in_flight = self.workers * 2
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr") as pool:
+            in_flight = []
+            next_range = 0
+            while next_range < len(ranges) or in_flight:
+                while next_range < len(ranges) and len(in_flight) < max_in_flight:
+                    first, last = ranges[next_range]
+                    in_flight.append(pool.submit(self._ocr_page_range, pdf_path, first, last))
+                    next_range += 1
+                for page in in_flight.pop(0).result():
+                    yield page
+
+    def _ocr_page_range(self, pdf_path: str, first: int, last: int) -> List[Tuple[int, str]]:
+        """Rasterise and recognise pages first..last (1-based, inclusive)"""
+        from pdf2image import convert_from_path
+        with tempfile.TemporaryDirectory(prefix="ocr-") as output_folder:
+            try:
+                with span("ocr_rasterize"):
+                    image_paths = convert_from_path(pdf_path, dpi=self.dpi, first_page=first, last_page=last,
+                                                    output_folder=output_folder, paths_only=True,
+                                                    timeout=self.page_timeout * (last - first + 1))
+            except Exception as e:
+                print(f"Error rasterising pages {first}-{last} of {pdf_path}: {e}")
+                return [(page, "") for page in range(first, last + 1)]
+
+            pages = []
+            # pdftoppm names its output after the page number, so sorted paths are in page order
+            for page, image_path in zip(range(first, last + 1), sorted(image_paths)):
+                try:
+                    pages.append((page, self.ocr_image(image_path)))
+                except Exception as e:
+                    print(f"Error running OCR on page {page} of {pdf_path}: {e}")
+                    pages.append((page, ""))
+            return pages
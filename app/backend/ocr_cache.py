@@ -0,0 +1,92 @@
+# ocr_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+
+class OcrCache:
+    """Persistent SQLite cache of OCR output keyed by page image hash + tesseract settings.
+
+    Entries are evicted least-recently-used first once the stored text
+    exceeds ``max_bytes``. The file can be shared by several processes
+    (e.g. the ingestion extraction workers).
+    """
+
+    def __init__(self, path: str = "ocr_cache.sqlite", max_bytes: Optional[int] = None):
+        self.path = path
+        self.max_bytes = max_bytes or int(float(os.getenv("OCR_CACHE_MAX_MB", 256)) * 1024 * 1024)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_pages ("
+            "key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ocr_pages_last_used ON ocr_pages (last_used)")
+        self._conn.commit()
+        self._size = self._total_size()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, lang: str, config: str) -> str:
+        """Build the cache key for a page image recognised with the given settings"""
+        hasher = hashlib.sha256(f"{lang}\0{config}\0".encode("utf-8"))
+        hasher.update(image_bytes)
+        return hasher.hexdigest()
+
+    def _total_size(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_pages").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached text for a key, marking it recently used"""
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM ocr_pages WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE ocr_pages SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, text: str):
+        """Store the text for a key, evicting old entries if over the size limit"""
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_pages (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time())
+            )
+            self._conn.commit()
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least-recently-used entries until the cache is at 90% of its limit"""
+        # Other processes write to the same file, so recount before evicting
+        self._size = self._total_size()
+        target = int(self.max_bytes * 0.9)
+        while self._size > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM ocr_pages ORDER BY last_used LIMIT 100").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._size <= target:
+                    break
+                self._conn.execute("DELETE FROM ocr_pages WHERE key = ?", (key,))
+                self._size -= size
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ocr_pages").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,58 +1,773 @@
 # vector_store.py
 import os
+import atexit
+import logging
+import math
 import faiss
 import numpy as np
-import pickle
-from typing import List, Dict, Union
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
+import threading
+import time
+import uuid
+from typing import Callable, List, Dict, Optional, Tuple, Union
+from langchain_core.documents import Document
+from backend.ann_index import (INDEX_FLAT, INDEX_IVF, INDEX_KINDS, build_populated, exact_neighbors,
+                               excluding_params, index_kind, reconstruct_all, set_search_params,
+                               supports_remove, tune_for_recall)
+from backend.embedding_cache import CachedEmbeddings, EmbeddingCache
+from backend.index_persistence import IndexPersistence
+from backend.lexical_index import BM25Index, tokenize
+from backend.metrics import span
+from backend.model_backends import create_embeddings
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class VectorStore:
-    def __init__(self, persist_directory="faiss_index"):
+    def __init__(self, persist_directory="faiss_index", flush_every: int = None, flush_interval: float = None,
+                 index_type: str = None, promote_at: int = None, nprobe: int = None, ef_search: int = None,
+                 min_recall: float = None, read_only: bool = None):
         self.persist_directory = persist_directory
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            google_api_key=os.getenv("GOOGLE_API_KEY"),
-            model="embedding-001"
+        # Read-only replicas memory-map the index another process writes and
+        # follow its new generations, so worker processes share its pages
+        if read_only is None:
+            read_only = os.getenv("VECTOR_STORE_READ_ONLY", "").lower() in ("1", "true", "yes")
+        self.read_only = read_only
+        self.reload_interval = float(os.getenv("VECTOR_STORE_RELOAD_INTERVAL", 5))
+        self._generation = None
+        self._checked_at = time.monotonic()
+        self._reload_lock = threading.Lock()
+        # The store is shared by every session in the process; the lock guards
+        # the in-memory index while network calls (embedding) happen outside it
+        self._lock = threading.RLock()
+        # Chunks and queries are only sent to the embedding backend
+        # (EMBEDDING_BACKEND: the Google API or local CPU) on a cache miss
+        embeddings, model_name = create_embeddings()
+        self.embeddings = CachedEmbeddings(
+            embeddings,
+            model_name=model_name,
+            cache=EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")),
         )
-        
-        # Create directory if it doesn't exist
-        if not os.path.exists(persist_directory):
-            os.makedirs(persist_directory)
-            self.db = None
-        else:
-            # Load existing index if it exists
+
+        # The index starts as an exact (flat) index and is migrated to
+        # index_type once it holds promote_at vectors; "flat" never migrates
+        self.index_type = index_type or os.getenv("VECTOR_INDEX_TYPE", INDEX_IVF)
+        if self.index_type not in INDEX_KINDS:
+            raise ValueError(f"Unsupported index type: {self.index_type}")
+        self.promote_at = promote_at or int(os.getenv("VECTOR_INDEX_PROMOTE_AT", 50000))
+        self.search_params = {
+            "nprobe": nprobe or int(os.getenv("VECTOR_INDEX_NPROBE", 16)),
+            "ef_search": ef_search or int(os.getenv("VECTOR_INDEX_EF_SEARCH", 64)),
+        }
+        self.min_recall = min_recall or float(os.getenv("VECTOR_INDEX_MIN_RECALL", 0.95))
+        # IVF cells are retrained once the corpus outgrows what they were trained on
+        self.retrain_factor = 4
+        # Deleted vectors are tombstoned and compacted away in the background
+        # once they exceed compact_min and compact_ratio of the live vectors
+        self.compact_min = int(os.getenv("VECTOR_INDEX_COMPACT_MIN", 500))
+        self.compact_ratio = float(os.getenv("VECTOR_INDEX_COMPACT_RATIO", 0.05))
+        self._compacting = False
+        # BM25 keyword hits are fused with the vector hits (reciprocal rank
+        # fusion); a confident keyword hit answers without embedding the query
+        self.hybrid = os.getenv("VECTOR_SEARCH_HYBRID", "true").lower() in ("1", "true", "yes")
+        self.rrf_k = int(os.getenv("HYBRID_RRF_K", 60))
+        # 0 disables the keyword-only fast path; shorter queries always go
+        # through hybrid search since a single term is trivially fully covered
+        self.lexical_fast_path_margin = float(os.getenv("LEXICAL_FAST_PATH_MARGIN", 1.5))
+        self.lexical_fast_path_min_terms = int(os.getenv("LEXICAL_FAST_PATH_MIN_TERMS", 2))
+
+        self.index = None
+        self.lexical = BM25Index()
+        # Chunk text lives in the on-disk docstore and is read for search
+        # hits only; just the documents not flushed yet are kept in memory
+        self._count = 0
+        # Bumped whenever the searchable content changes (e.g. for answer caches)
+        self.version = 0
+        self._tombstones = set()  # labels deleted from indexes that cannot remove vectors
+        self._compactions = 0     # bumped whenever tombstoned vectors are dropped for good
+        self._exclusion = None    # (key, search parameters that skip the tombstones)
+        self._next_label = 0
+        self._trained_on = 0
+        self._rebuild_log = None
+        self._retry_promotion_at = 0
+
+        # Writes are coalesced: the index is flushed every N changed documents,
+        # every T seconds while dirty, and on shutdown
+        self.flush_every = flush_every or int(os.getenv("INDEX_FLUSH_EVERY", 5000))
+        self.flush_interval = flush_interval or float(os.getenv("INDEX_FLUSH_INTERVAL", 30))
+        self._flush_lock = threading.Lock()
+        self._pending_added = {}    # doc_id -> label
+        self._pending_docs = {}     # label -> (doc_id, Document)
+        self._pending_deleted = set()
+        self._flushing = set()      # doc_ids being written by the running flush
+        self._index_dirty = False
+        self._flush_hooks = []
+
+        self.persistence = IndexPersistence(persist_directory, read_only=read_only)
+        try:
+            self._load()
+        except Exception as e:
+            print(f"Error loading FAISS index: {e}")
+            self.index = None
+
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="vector-store-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _load(self):
+        """Load the persisted index, migrating a legacy save_local() index if found"""
+        if self.persistence.has_legacy_index():
+            if self.read_only:
+                print("Legacy FAISS index found; open the vector store writable once to migrate it")
+                return
+            self._migrate_legacy_index()
+            return
+
+        loaded = self.persistence.load(mmap=self.read_only)
+        if loaded is None:
+            return
+        index, meta = loaded
+        self.index = index
+        self._generation = meta["generation"]
+        self._tombstones = set(meta.get("tombstones", []))
+        self._next_label = meta.get("next_label", 0)
+        self._trained_on = meta.get("trained_on", 0)
+        self._compactions = meta.get("compactions", 0)
+        self._count = meta["count"] if "count" in meta else self.persistence.count(self._next_label)
+        self.search_params.update(meta.get("search_params", {}))
+        set_search_params(self.index, **self.search_params)
+        self.lexical = self._load_lexical(self._next_label)
+
+    def _load_lexical(self, next_label: int) -> BM25Index:
+        """Build the lexical index from the term counts stored in the docstore"""
+        lexical = BM25Index()
+        for label, counts in self.persistence.iter_term_counts(0, next_label):
+            lexical.add_counts([label], [counts])
+        return lexical
+
+    def _maybe_reload(self):
+        """Pick up a generation published by the writer process (read-only mode)"""
+        if not self.read_only or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        # One thread reloads; the others keep searching the current generation
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = time.monotonic()
+            self._reload()
+        finally:
+            self._reload_lock.release()
+
+    def _reload(self):
+        try:
+            if self.persistence.current_generation() == self._generation:
+                return
+            # Map the new generation and read the terms of its new documents
+            # before taking the lock; searches keep using the old ones until the swap
+            loaded = self.persistence.load(mmap=True)
+            if loaded is None:
+                return
+            index, meta = loaded
+            next_label = meta.get("next_label", 0)
+            tombstones = set(meta.get("tombstones", []))
+            compactions = meta.get("compactions", 0)
+            if next_label < self._next_label or compactions != self._compactions:
+                # The writer started over (e.g. its directory was recreated) or
+                # compacted, so labels deleted in generations this replica never
+                # loaded are no longer tombstoned: rebuild from the docstore, as
+                # the writer's compaction did
+                lexical, added, removed = self._load_lexical(next_label), [], tombstones
+            else:
+                # Deleted labels stay tombstoned until the next compaction, and
+                # new documents are labelled from the old next label on
+                lexical = self.lexical
+                added = list(self.persistence.iter_term_counts(self._next_label, next_label))
+                removed = tombstones - self._tombstones
+            count = meta["count"] if "count" in meta else self.persistence.count(next_label)
+        except Exception as e:
+            print(f"Error reloading FAISS index: {e}")
+            return
+        set_search_params(index, **{**self.search_params, **meta.get("search_params", {})})
+        with self._lock:
+            # Only the documents added or removed since the loaded generation
+            # are applied to the lexical index
+            lexical.add_counts([label for label, _ in added], [counts for _, counts in added])
+            lexical.remove(removed)
+            self.index = index
+            self._exclusion = None
+            self.lexical = lexical
+            self._generation = meta["generation"]
+            self._tombstones = tombstones
+            self._compactions = compactions
+            self._next_label = next_label
+            self._count = count
+            self.version += 1
+
+    def _migrate_legacy_index(self):
+        """Convert an index written by LangChain's FAISS.save_local()"""
+        from langchain_community.vectorstores import FAISS
+
+        # The legacy index was written only by this app, so unpickling it is safe
+        db = FAISS.load_local(self.persist_directory, self.embeddings,
+                              allow_dangerous_deserialization=True)
+        print("Migrating legacy FAISS index to the incremental on-disk format")
+        ids = [db.index_to_docstore_id[i] for i in range(db.index.ntotal)]
+        vectors = db.index.reconstruct_n(0, db.index.ntotal)
+        labels = np.arange(len(ids), dtype=np.int64)
+        self.index = build_populated(INDEX_FLAT, labels, vectors)
+        for label, doc_id in zip(labels.tolist(), ids):
+            self._pending_added[doc_id] = label
+            self._pending_docs[label] = (doc_id, db.docstore.search(doc_id))
+            self.lexical.add([label], [self._pending_docs[label][1].page_content])
+        self._next_label = len(ids)
+        self._count = len(ids)
+        self._index_dirty = True
+        self.flush()
+        for name in ("index.faiss", "index.pkl"):
+            os.remove(os.path.join(self.persist_directory, name))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def is_empty(self) -> bool:
+        """True when there is nothing to search"""
+        self._maybe_reload()
+        return self.index is None or not self._count
+
+    @property
+    def dirty(self) -> bool:
+        return self._index_dirty or bool(self._pending_added or self._pending_deleted)
+
+    def add_flush_hook(self, hook: Callable[[], Callable[[], None]]):
+        """Keep state derived from the index (e.g. the ingestion manifest) in step with it.
+
+        ``hook()`` is called under the store lock whenever a flush takes its
+        snapshot, so it sees exactly the changes that snapshot holds; the
+        function it returns runs once that generation is published. Flushes
+        with nothing to write still call it.
+        """
+        self._flush_hooks.append(hook)
+
+    def _run_flush_hooks(self, writers: List[Callable[[], None]]):
+        for writer in writers:
+            try:
+                writer()
+            except Exception:
+                logger.exception("Error in vector store flush hook")
+
+    def flush(self):
+        """Write pending changes to disk (atomically, as a new index generation)"""
+        if self.read_only:
+            return
+        with self._flush_lock:
+            with self._lock:
+                writers = [hook() for hook in self._flush_hooks]
+                if self.index is None or not self.dirty:
+                    snapshot = None
+                else:
+                    snapshot = self._flush_snapshot()
+            if snapshot is None:
+                # Everything in memory is already published
+                self._run_flush_hooks(writers)
+                return
+
+            index_bytes, meta, added, docs, deleted = snapshot
             try:
-                self.db = FAISS.load_local(persist_directory, self.embeddings)
-            except Exception as e:
-                print(f"Error loading FAISS index: {e}")
-                self.db = None
-    
-    def add_documents(self, texts: List[str], metadatas: List[Dict] = None):
-        """Add documents to the vector store"""
+                with span("index_flush"):
+                    self.persistence.save(index_bytes, meta, docs, deleted)
+            except Exception:
+                # The delta is still pending, so the next flush retries it
+                with self._lock:
+                    self._flushing = set()
+                    self._index_dirty = True
+                raise
+
+            with self._lock:
+                for doc_id, label in added.items():
+                    if self._pending_added.get(doc_id) == label:
+                        del self._pending_added[doc_id]
+                        del self._pending_docs[label]
+                self._pending_deleted -= deleted
+                self._flushing = set()
+            self._run_flush_hooks(writers)
+
+    def _flush_snapshot(self) -> Tuple[np.ndarray, Dict, Dict[str, int], List[Tuple[int, str, Document]], set]:
+        """Copy what a flush writes (caller holds the lock)"""
+        # Unflushed documents stay searchable from memory until the
+        # save has committed them
+        added = dict(self._pending_added)
+        deleted = set(self._pending_deleted)
+        self._flushing = set(added)
+        self._index_dirty = False
+        # Serializing is a memory copy; the slow disk write (and the new
+        # documents' term counts) happen outside the lock so searches are
+        # not blocked by it
+        index_bytes = faiss.serialize_index(self.index)
+        meta = {
+            "kind": index_kind(self.index),
+            "next_label": self._next_label,
+            "trained_on": self._trained_on,
+            "tombstones": sorted(self._tombstones),
+            "compactions": self._compactions,
+            "count": self._count,
+            "search_params": self.search_params,
+        }
+        docs = [(label, doc_id, self._pending_docs[label][1]) for doc_id, label in added.items()]
+        return index_bytes, meta, added, docs, deleted
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            if self.dirty:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Error saving FAISS index: {e}")
+
+    def _maybe_flush(self):
+        if len(self._pending_added) + len(self._pending_deleted) >= self.flush_every:
+            self.flush()
+
+    def close(self):
+        """Flush pending changes and stop the background flusher"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error saving FAISS index: {e}")
+
+    def add_documents(self, texts: List[str], metadatas: List[Dict] = None) -> List[str]:
+        """Add documents to the vector store and return their vector ids"""
         if not texts:
+            return []
+        if self.read_only:
+            raise RuntimeError("Vector store is read-only")
+
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        with self._lock, span("index_write"):
+            ids = self._insert(texts, metadatas, vectors)
+
+        self._maybe_promote()
+        self._maybe_flush()
+        return ids
+
+    def _insert(self, texts: List[str], metadatas: List[Dict], vectors: np.ndarray) -> List[str]:
+        """Add embedded documents to the index (caller holds the lock)"""
+        ids = [str(uuid.uuid4()) for _ in texts]
+        if self.index is None:
+            self.index = build_populated(INDEX_FLAT, np.zeros(0, dtype=np.int64),
+                                         np.zeros((0, vectors.shape[1]), dtype=np.float32))
+        labels = np.arange(self._next_label, self._next_label + len(texts), dtype=np.int64)
+        self._next_label += len(texts)
+        self.index.add_with_ids(vectors, labels)
+        self.lexical.add(labels.tolist(), texts)
+        for label, doc_id, text, metadata in zip(labels.tolist(), ids, texts, metadatas):
+            self._pending_added[doc_id] = label
+            self._pending_docs[label] = (doc_id, Document(page_content=text, metadata=metadata))
+        self._count += len(texts)
+        self.version += 1
+        self._index_dirty = True
+        if self._rebuild_log is not None:
+            self._rebuild_log.append(("add", labels, vectors))
+        return ids
+
+    def delete(self, ids: List[str]):
+        """Remove vectors from the vector store by id"""
+        if self.read_only:
+            raise RuntimeError("Vector store is read-only")
+        with self._lock:
+            if self.index is None or not ids:
+                return
+
+            # Ignore ids that are no longer present (e.g. deleted twice)
+            ids = [doc_id for doc_id in dict.fromkeys(ids) if doc_id not in self._pending_deleted]
+            found = {doc_id: self._pending_added[doc_id] for doc_id in ids if doc_id in self._pending_added}
+            stored = [doc_id for doc_id in ids if doc_id not in found]
+            if stored:
+                found.update(self.persistence.labels_for(stored))
+            self._remove(found)
+
+        self._maybe_compact()
+        self._maybe_flush()
+
+    def _file_labels(self, file_id: str) -> Dict[str, int]:
+        """Map the live vector ids of a file to their labels (caller holds the lock)"""
+        found = {doc_id: label for doc_id, label in self.persistence.ids_for_file(file_id, self._next_label).items()
+                 if doc_id not in self._pending_deleted}
+        for label, (doc_id, doc) in self._pending_docs.items():
+            if doc.metadata.get("file_id") == file_id:
+                found[doc_id] = label
+        return found
+
+    def delete_document(self, file_id: str) -> int:
+        """Remove every vector of a file and return how many were removed"""
+        if self.read_only:
+            raise RuntimeError("Vector store is read-only")
+        with self._lock:
+            if self.index is None:
+                return 0
+            found = self._file_labels(file_id)
+            self._remove(found)
+
+        self._maybe_compact()
+        self._maybe_flush()
+        return len(found)
+
+    def replace_document(self, file_id: str, chunks: List[str], metadatas: List[Dict] = None) -> List[str]:
+        """Swap a file's vectors for new chunks and return the new vector ids.
+
+        The new chunks are embedded before the lock is taken, and the old
+        vectors are dropped in the same critical section the new ones are
+        added in, so searches see either the old or the new version.
+        """
+        if self.read_only:
+            raise RuntimeError("Vector store is read-only")
+        if not chunks:
+            self.delete_document(file_id)
+            return []
+
+        metadatas = metadatas or [{} for _ in chunks]
+        metadatas = [{**metadata, "file_id": file_id} for metadata in metadatas]
+        vectors = np.asarray(self.embeddings.embed_documents(chunks), dtype=np.float32)
+        with self._lock:
+            if self.index is not None:
+                self._remove(self._file_labels(file_id))
+            ids = self._insert(chunks, metadatas, vectors)
+
+        self._maybe_compact()
+        self._maybe_promote()
+        self._maybe_flush()
+        return ids
+
+    def _remove(self, found: Dict[str, int]):
+        """Drop documents (doc_id -> label) from the index (caller holds the lock)"""
+        if not found:
             return
-            
-        if self.db is None:
-            self.db = FAISS.from_texts(texts, self.embeddings, metadatas=metadatas)
-        else:
-            self.db.add_texts(texts, metadatas=metadatas)
-        
-        # Save the updated index
-        self.db.save_local(self.persist_directory)
-    
-    def search(self, query: str, k: int = 4) -> List[Dict]:
-        """Search the vector store for relevant documents"""
-        if self.db is None:
+
+        # Deletes only tombstone the labels; compaction drops them from the
+        # index later, so the cost is proportional to what changed
+        labels = list(found.values())
+        self._tombstones.update(labels)
+        if self._rebuild_log is not None:
+            self._rebuild_log.append(("delete", labels, None))
+        for doc_id, label in found.items():
+            if doc_id in self._pending_added:
+                del self._pending_added[doc_id]
+                del self._pending_docs[label]
+                # Never-flushed documents simply drop out of the pending delta
+                if doc_id not in self._flushing:
+                    continue
+            self._pending_deleted.add(doc_id)
+        self._count -= len(found)
+        self.version += 1
+        self._index_dirty = True
+
+    def _maybe_compact(self):
+        """Start a background compaction once tombstones make up enough of the index"""
+        with self._lock:
+            if self.index is None or self._compacting or self._rebuild_log is not None:
+                return
+            if len(self._tombstones) < max(self.compact_min, self.compact_ratio * self._count):
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact, kwargs={"started": True},
+                         name="vector-index-compact", daemon=True).start()
+
+    def compact(self, started: bool = False) -> Dict:
+        """Reclaim the space held by deleted (tombstoned) vectors.
+
+        Flat and IVF indexes drop the tombstoned ids in one batched
+        remove_ids; HNSW graphs cannot remove vectors and are rebuilt in the
+        background without them instead.
+        """
+        if self.read_only:
+            raise RuntimeError("Vector store is read-only")
+        try:
+            with self._lock:
+                if not started:
+                    if self._compacting:
+                        return {"compacted": 0, "reason": "compaction already running"}
+                    self._compacting = True
+                if self.index is None or not self._tombstones:
+                    return {"compacted": 0}
+                if self._rebuild_log is not None:
+                    # The running rebuild leaves the tombstoned vectors out anyway
+                    return {"compacted": 0, "reason": "rebuild already running"}
+                removed = len(self._tombstones)
+                if supports_remove(self.index):
+                    self.index.remove_ids(np.asarray(sorted(self._tombstones), dtype=np.int64))
+                    self.lexical.remove(self._tombstones)
+                    self._tombstones = set()
+                    self._compactions += 1
+                    self._index_dirty = True
+                    report = {"compacted": removed, "kind": index_kind(self.index)}
+                    logger.info(f"Vector index compacted: {report}")
+                    return report
+                kind = index_kind(self.index)
+            report = self.rebuild_index(kind=kind)
+            report["compacted"] = removed if report.get("rebuilt") else 0
+            return report
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def _maybe_promote(self):
+        """Start a background migration to the configured ANN index when due"""
+        with self._lock:
+            if self.index is None or self._rebuild_log is not None:
+                return
+            size = self._count
+            kind = index_kind(self.index)
+            due = (kind == INDEX_FLAT and self.index_type != INDEX_FLAT and
+                   size >= max(self.promote_at, self._retry_promotion_at))
+            # IVF centroids go stale as the corpus grows well past the training set
+            due = due or (kind == INDEX_IVF and self._trained_on > 0 and
+                          size >= self._trained_on * self.retrain_factor)
+            if not due:
+                return
+            self._rebuild_log = []
+        threading.Thread(target=self.rebuild_index, kwargs={"started": True},
+                         name="vector-index-rebuild", daemon=True).start()
+
+    def rebuild_index(self, kind: Optional[str] = None, started: bool = False) -> Dict:
+        """Rebuild the index as ``kind`` (default: the configured type).
+
+        Vectors are copied out under the lock, the new index is trained and
+        filled outside it while searches keep using the old one, and changes
+        made in the meantime are replayed before the swap. A non-flat index
+        is only adopted if its recall@10 against exact search on a sample of
+        stored vectors reaches ``min_recall`` after tuning nprobe/efSearch.
+        """
+        kind = kind or self.index_type
+        if self.read_only:
+            raise RuntimeError("Vector store is read-only")
+        with self._lock:
+            if self.index is None:
+                return {"rebuilt": False}
+            if not started:
+                if self._rebuild_log is not None:
+                    return {"rebuilt": False, "reason": "rebuild already running"}
+                self._rebuild_log = []
+            labels, vectors = reconstruct_all(self.index)
+            dropped = set(self._tombstones)
+            if self._tombstones:
+                keep = ~np.isin(labels, list(self._tombstones))
+                labels, vectors = labels[keep], vectors[keep]
+
+        try:
+            report = self._build_replacement(kind, labels, vectors)
+        except Exception as e:
+            logger.error(f"Error rebuilding vector index: {e}")
+            with self._lock:
+                self._rebuild_log = None
+            raise
+
+        with self._lock:
+            new_index = report.pop("index")
+            if new_index is None:
+                # Keep the current index; try again once the corpus has doubled
+                self._retry_promotion_at = self._count * 2
+                self._rebuild_log = None
+                return report
+
+            # Replay changes made while the new index was being built; old
+            # tombstones were already left out of it
+            self.lexical.remove(dropped)
+            self._tombstones = set()
+            if dropped:
+                self._compactions += 1
+            for op, op_labels, op_vectors in self._rebuild_log:
+                if op == "add":
+                    new_index.add_with_ids(op_vectors, op_labels)
+                else:
+                    self._tombstones.update(op_labels)
+            self.index = new_index
+            self._exclusion = None   # built for the old index and its efSearch/nprobe
+            self._trained_on = len(labels)
+            self._index_dirty = True
+            self._rebuild_log = None
+
+        logger.info(f"Vector index rebuilt: {report}")
+        return report
+
+    def _build_replacement(self, kind: str, labels: np.ndarray, vectors: np.ndarray) -> Dict:
+        """Build and recall-check a replacement index; index is None if rejected"""
+        index = build_populated(kind, labels, vectors)
+        report = {"kind": kind, "vectors": len(labels), "rebuilt": True}
+        if kind == INDEX_FLAT or not len(labels):
+            report["index"] = index
+            return report
+
+        # Perturbed stored vectors stand in for queries
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(200, len(vectors)), replace=False)]
+        queries = sample + rng.normal(0, 0.01, sample.shape).astype(np.float32)
+        expected = exact_neighbors(queries, labels, vectors, k=10)
+        tuned = tune_for_recall(index, queries, expected, self.min_recall,
+                                nprobe=self.search_params["nprobe"], ef_search=self.search_params["ef_search"])
+        report.update(tuned)
+        if tuned["recall"] < self.min_recall:
+            logger.warning(f"Keeping current index: {kind} recall {tuned['recall']} is below {self.min_recall}")
+            report.update({"rebuilt": False, "index": None})
+            return report
+
+        for name in ("nprobe", "ef_search"):
+            if name in tuned:
+                self.search_params[name] = tuned[name]
+        report["index"] = index
+        return report
+
+    def ids_by_file_id(self) -> Dict[str, List[str]]:
+        """Group the stored vector ids by the file_id in their metadata"""
+        with self._lock:
+            grouped = {file_id: [doc_id for doc_id in doc_ids if doc_id not in self._pending_deleted]
+                       for file_id, doc_ids in self.persistence.ids_by_file_id(self._next_label).items()}
+            for doc_id, doc in self._pending_docs.values():
+                file_id = doc.metadata.get("file_id")
+                if file_id and doc_id not in grouped.get(file_id, ()):
+                    grouped.setdefault(file_id, []).append(doc_id)
+        return {file_id: doc_ids for file_id, doc_ids in grouped.items() if doc_ids}
+
+    def search(self, query: str, k: int = 4, embedding: Optional[List[float]] = None) -> List[Dict]:
+        """Search the vector store for relevant documents.
+
+        In hybrid mode the BM25 and vector rankings are fused by reciprocal
+        rank fusion. Without an embedding, a confident keyword hit is
+        returned straight away (see lexical_fast_path) and the query is never
+        embedded. Callers that already embedded the query can pass the
+        embedding.
+
+        Each result has the key of every ranking that scored it:
+        "distance" (L2 distance to the query, lower is closer), "bm25"
+        (keyword score, higher is better) and, in hybrid mode, "rrf" (the
+        fused score results are ordered by, higher is better).
+        """
+        self._maybe_reload()
+        if self.index is None:
             return []
-            
-        results = self.db.similarity_search_with_score(query, k=k)
-        return [{"content": doc.page_content, "score": score, "metadata": doc.metadata} 
-                for doc, score in results]
-    
+        if self.hybrid and embedding is None:
+            results = self.lexical_fast_path(query, k)
+            if results is not None:
+                return results
+        return self._rank(query, self._vector_hits(query, self._fetch_depth(k), embedding), k)
+
     def search_with_threshold(self, query: str, k: int = 4, score_threshold: float = 0.7) -> List[Dict]:
-        """Search with a relevance threshold"""
-        results = self.search(query, k=k)
-        return [r for r in results if r["score"] > score_threshold]
+        """Search with a relevance threshold on the vector distance.
+
+        Relevance is 1 - distance / sqrt(2), as LangChain scores unit-length
+        embeddings, so 1 is an exact match; results below score_threshold are
+        dropped and the rest carry it under "relevance".
+        """
+        self._maybe_reload()
+        if self.index is None:
+            return []
+        results = self._results([(label, {"distance": distance}) for distance, label in self._vector_hits(query, k)])
+        for result in results:
+            result["relevance"] = 1.0 - result["distance"] / math.sqrt(2)
+        return [r for r in results if r["relevance"] >= score_threshold]
+
+    def search_many(self, queries: List[str], k: int = 4,
+                    embeddings: Optional[List[List[float]]] = None) -> List[List[Dict]]:
+        """Search for several queries with one batched embedding call and one index search"""
+        self._maybe_reload()
+        if self.index is None or not queries:
+            return [[] for _ in queries]
+        if embeddings is None:
+            embeddings = self.embeddings.embed_queries(queries)
+        hits = self._vector_hits_many(embeddings, self._fetch_depth(k))
+        return [self._rank(query, query_hits, k) for query, query_hits in zip(queries, hits)]
+
+    def _fetch_depth(self, k: int) -> int:
+        # In hybrid mode both rankings are fetched deeper than k so fusion can reorder them
+        return max(k * 4, 20) if self.hybrid else k
+
+    def _rank(self, query: str, vector_hits: List[Tuple[float, int]], k: int) -> List[Dict]:
+        """Fuse vector hits with the BM25 ranking (hybrid mode) and read the top k"""
+        if not self.hybrid:
+            return self._results([(label, {"distance": distance}) for distance, label in vector_hits[:k]])
+        with self._lock, span("lexical_search"):
+            lexical_hits, _ = self.lexical.search(query, self._fetch_depth(k), exclude=self._tombstones)
+        fused = {}
+        for name, hits in (("distance", vector_hits), ("bm25", lexical_hits)):
+            for rank, (score, label) in enumerate(hits):
+                entry = fused.setdefault(label, {"rrf": 0.0})
+                entry["rrf"] += 1.0 / (self.rrf_k + rank + 1)
+                entry[name] = score
+        ranked = sorted(fused.items(), key=lambda item: item[1]["rrf"], reverse=True)[:k]
+        return self._results(ranked)
+
+    def lexical_fast_path(self, query: str, k: int = 4) -> Optional[List[Dict]]:
+        """Return the best BM25 hit alone if it is a confident match, else None.
+
+        Confident means the query has at least lexical_fast_path_min_terms
+        terms, the hit contains all of them and it outscores the runner-up by
+        lexical_fast_path_margin (e.g. a course code plus a topic that appear
+        together in one chunk). The runner-ups are not returned: they failed
+        that test, and the hybrid search ranks them better.
+        """
+        if not self.hybrid or not self.lexical_fast_path_margin:
+            return None
+        if len(set(tokenize(query))) < self.lexical_fast_path_min_terms:
+            return None
+        self._maybe_reload()
+        if self.index is None:
+            return None
+        with self._lock, span("lexical_search"):
+            hits, coverage = self.lexical.search(query, 2, exclude=self._tombstones)
+        if not hits or coverage < 1.0:
+            return None
+        if len(hits) > 1 and hits[0][0] < self.lexical_fast_path_margin * hits[1][0]:
+            return None
+        score, label = hits[0]
+        return self._results([(label, {"bm25": score})])
+
+    def _vector_hits(self, query: str, k: int, embedding: Optional[List[float]] = None) -> List[Tuple[float, int]]:
+        """Return the (distance, label) pairs of the k nearest live vectors"""
+        # Embed the query outside the lock so concurrent sessions only
+        # serialize on the (fast) in-memory index lookup
+        if embedding is None:
+            embedding = self.embeddings.embed_query(query)
+        return self._vector_hits_many([embedding], k)[0]
+
+    def _vector_hits_many(self, embeddings: List[List[float]], k: int) -> List[List[Tuple[float, int]]]:
+        """Nearest live vectors for a batch of query embeddings, in one index search"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock, span("vector_search"):
+            fetch = min(k, self.index.ntotal)
+            if fetch <= 0:
+                return [[] for _ in embeddings]
+            # Tombstoned vectors are skipped inside the index search
+            scores, labels = self.index.search(embeddings, fetch, params=self._search_excluding_tombstones())
+            return [[(float(score), int(label)) for score, label in zip(row_scores, row_labels) if label != -1]
+                    for row_scores, row_labels in zip(scores, labels)]
+
+    def _search_excluding_tombstones(self) -> Optional[faiss.SearchParameters]:
+        """Search parameters that filter out the tombstones (caller holds the lock)"""
+        if not self._tombstones:
+            return None
+        # Deletes bump the version; compaction and index swaps only shrink the
+        # tombstones, and labels compacted away are not in the index anyway
+        if self._exclusion is None or self._exclusion[0] != self.version:
+            self._exclusion = (self.version,
+                               excluding_params(self.index, np.fromiter(self._tombstones, dtype=np.int64)))
+        return self._exclusion[1]
+
+    def _results(self, hits: List[Tuple[int, Dict]]) -> List[Dict]:
+        """Turn (label, scores) hits into result dicts with the chunk text"""
+        with self._lock:
+            docs = {label: self._pending_docs[label] for label, _ in hits if label in self._pending_docs}
+
+        # Only the top-k hits are read from the docstore
+        missing = [label for label, _ in hits if label not in docs]
+        if missing:
+            docs.update(self.persistence.get_by_labels(missing))
+        results = []
+        for label, scores in hits:
+            if label in docs:
+                doc = docs[label][1]
+                results.append({"content": doc.page_content, "metadata": doc.metadata, **scores})
+        return results
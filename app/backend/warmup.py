@@ -0,0 +1,117 @@
+# warmup.py
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Run slow start-up work on a background thread and report liveness/readiness.
+
+    ``load()`` builds what requests need (e.g. opens the index); once it
+    returns the process is ready and its result is handed to ``wait()``
+    callers. ``after_ready(result)`` then runs on the same thread for work
+    that may continue while requests are served (e.g. a bucket sync). The
+    process is live as soon as it can answer; it is ready only after load
+    succeeded.
+    """
+
+    STARTING = "starting"
+    LOADING = "loading"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self, name: str, load: Callable[[], Any], after_ready: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self.load = load
+        self.after_ready = after_ready
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._thread = None
+        self._ready = threading.Event()
+        self._finished = threading.Event()
+        self.state = self.STARTING
+        self.result = None
+        self.error = None
+        self.created = time.monotonic()
+        self.ready_after = None
+        self.background_done = False
+
+    def start(self) -> "Warmup":
+        """Start the warm-up thread unless it is already running (cheap to call per request)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return self
+        with self._lock:
+            # A forked worker inherits the state but not the thread, so it starts over
+            if self._pid != os.getpid():
+                self._reset()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"warmup-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        self.state = self.LOADING
+        started = time.monotonic()
+        try:
+            self.result = self.load()
+        except Exception as e:
+            logger.error(f"Warm-up of {self.name} failed: {e}")
+            self.error = e
+            self.state = self.FAILED
+            self._finished.set()
+            return
+        self.ready_after = time.monotonic() - self.created
+        self.state = self.READY
+        self._ready.set()
+        logger.info(f"{self.name} ready after {time.monotonic() - started:.2f}s")
+        try:
+            if self.after_ready is not None:
+                self.after_ready(self.result)
+        except Exception as e:
+            logger.error(f"Background start-up work of {self.name} failed: {e}")
+        finally:
+            self.background_done = True
+            self._finished.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self._pid == os.getpid()
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """Start if needed, block until ready and return load()'s result.
+
+        Raises RuntimeError if the warm-up failed and TimeoutError if it is
+        not ready within ``timeout`` seconds.
+        """
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._ready.is_set():
+            if self.state == self.FAILED:
+                raise RuntimeError(f"{self.name} failed to start: {self.error}")
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(f"{self.name} is not ready yet")
+            # Wake up on failure as well as on readiness
+            self._finished.wait(0.1 if remaining is None else min(remaining, 0.1))
+        return self.result
+
+    def status(self) -> Dict:
+        """Readiness details for health endpoints and the debug view"""
+        status = {
+            "state": self.state,
+            "ready": self.ready,
+            "uptime_s": round(time.monotonic() - self.created, 2),
+            "background_done": self.background_done,
+        }
+        if self.ready_after is not None:
+            status["ready_after_s"] = round(self.ready_after, 2)
+        if self.error is not None:
+            status["error"] = str(self.error)
+        return status
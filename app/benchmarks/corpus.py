@@ -0,0 +1,135 @@
+# corpus.py
+import os
+import random
+from typing import List
+
+# Syllables for pseudo-words; a fixed seed makes every corpus reproducible
+SYLLABLES = ["ka", "lo", "mi", "ter", "al", "gor", "ith", "data", "struc", "net", "work", "sys", "tem",
+             "lec", "ture", "exam", "lab", "pro", "gram", "func", "tion", "ana", "lys", "is", "ver", "sion"]
+COURSE_PREFIXES = ["CS", "MA", "PH", "EE", "BI", "CH"]
+KINDS = ("text", "pdf", "scanned")
+
+
+class SyntheticCorpus:
+    """Deterministic generator of course-material-like documents.
+
+    Text is drawn from a fixed vocabulary of pseudo-words plus course codes
+    and room numbers, so keyword and semantic queries both have answers.
+    """
+
+    def __init__(self, seed: int = 0, vocabulary_size: int = 2000):
+        self.rng = random.Random(seed)
+        self.vocabulary = ["".join(self.rng.choice(SYLLABLES) for _ in range(self.rng.randint(1, 3)))
+                           for _ in range(vocabulary_size)]
+        self.codes = [f"{prefix}-{number}" for prefix in COURSE_PREFIXES for number in range(100, 500, 7)]
+
+    def sentence(self) -> str:
+        words = [self.rng.choice(self.vocabulary) for _ in range(self.rng.randint(8, 16))]
+        if self.rng.random() < 0.2:
+            words.insert(self.rng.randrange(len(words)), self.rng.choice(self.codes))
+        if self.rng.random() < 0.1:
+            words.append(f"in room B-{self.rng.randint(100, 450)}")
+        return " ".join(words).capitalize() + "."
+
+    def paragraph(self, words: int) -> str:
+        sentences = []
+        count = 0
+        while count < words:
+            sentences.append(self.sentence())
+            count += len(sentences[-1].split())
+        return " ".join(sentences)
+
+    def queries(self, count: int) -> List[str]:
+        """Mix of keyword (course code) and free-text questions"""
+        queries = []
+        for index in range(count):
+            if index % 3 == 0:
+                queries.append(f"When is the {self.rng.choice(self.codes)} exam?")
+            else:
+                words = " ".join(self.rng.choice(self.vocabulary) for _ in range(self.rng.randint(3, 7)))
+                queries.append(f"What does the course say about {words}?")
+        return queries
+
+    def write(self, kind: str, directory: str, count: int, pages: int = 3, words_per_page: int = 350) -> List[str]:
+        """Write ``count`` documents of one kind and return their paths"""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown corpus kind: {kind}")
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for index in range(count):
+            if kind == "text":
+                path = os.path.join(directory, f"doc-{index}.txt")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write("\n\n".join(self.paragraph(words_per_page) for _ in range(pages)))
+            elif kind == "pdf":
+                path = os.path.join(directory, f"doc-{index}.pdf")
+                write_text_pdf(path, [self.paragraph(words_per_page) for _ in range(pages)])
+            else:
+                # One page per image, as a phone scan would be uploaded
+                path = os.path.join(directory, f"doc-{index}.png")
+                write_text_image(path, self.paragraph(words_per_page // 3))
+            paths.append(path)
+        return paths
+
+
+def _wrap(text: str, width: int) -> List[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def write_text_pdf(path: str, pages: List[str]):
+    """Write a minimal PDF with one page of Helvetica text per string (no PDF library needed)"""
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")
+    page_tree = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for text in pages:
+        lines = _wrap(text, 90)[:60]
+        escaped = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({line}) Tj T*" for line in escaped) + " ET"
+        stream = stream.encode("latin-1", "replace")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+                            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+                            % (page_tree, font, content)))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % page_tree
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode("ascii")
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def write_text_image(path: str, text: str, width: int = 1240):
+    """Render text black on white, like a scanned page"""
+    from PIL import Image, ImageDraw
+
+    lines = _wrap(text, 100)
+    image = Image.new("L", (width, 40 + 22 * len(lines)), color=255)
+    draw = ImageDraw.Draw(image)
+    for number, line in enumerate(lines):
+        draw.text((30, 20 + 22 * number), line, fill=0)
+    image.save(path)
@@ -0,0 +1,47 @@
+# fakes.py
+import os
+import time
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+
+class LatencyEmbeddings(Embeddings):
+    """Add simulated API latency to an embedding backend.
+
+    Each call waits ``call_latency`` seconds plus ``text_latency`` per text,
+    roughly how a remote batch embedding endpoint behaves.
+    """
+
+    def __init__(self, embeddings: Embeddings, call_latency: float = 0.0, text_latency: float = 0.0):
+        self.embeddings = embeddings
+        self.call_latency = call_latency
+        self.text_latency = text_latency
+
+    def _wait(self, texts: int):
+        delay = self.call_latency + self.text_latency * texts
+        if delay:
+            time.sleep(delay)
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        self._wait(len(texts))
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self._wait(1)
+        return self.embeddings.embed_query(text)
+
+
+def configure_offline(embedding_dim: int, llm_latency: float, llm_tokens_per_second: float):
+    """Point the backends at the local embedding model and the stub LLM, with no shared state on disk"""
+    os.environ.update({
+        "EMBEDDING_BACKEND": "local",
+        "LOCAL_EMBEDDING_DIM": str(embedding_dim),
+        "LLM_BACKEND": "stub",
+        "STUB_LLM_LATENCY": str(llm_latency),
+        "STUB_LLM_TOKENS_PER_SECOND": str(llm_tokens_per_second),
+        # Measure real OCR and rate-limit work, not hits on a previous run's state
+        "OCR_CACHE_PATH": "",
+        "LLM_RATE_LIMIT_PATH": "",
+        "LLM_REQUESTS_PER_MINUTE": "1000000",
+        "LLM_BURST": "1000000",
+    })
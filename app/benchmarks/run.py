@@ -0,0 +1,285 @@
+# run.py
+"""Offline benchmarks for ingestion, retrieval and answer latency.
+
+Run from the app directory:
+
+    python -m benchmarks.run --scale small,medium --output bench.json
+    python -m benchmarks.run --output new.json --baseline bench.json
+
+Embeddings come from the local hashing backend and answers from the stub
+LLM, with optional simulated latency, so results are repeatable and need
+no credentials. With ``--baseline`` every metric is compared against a
+previous run and the exit status is 1 if any regressed by more than
+``--tolerance``.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from benchmarks.corpus import KINDS, SyntheticCorpus
+from benchmarks.fakes import LatencyEmbeddings, configure_offline
+
+SCALES = {"small": 10, "medium": 1000, "large": 100000}
+EMBED_BATCH_SIZE = 100
+
+
+def percentiles(samples_ms: List[float]) -> Dict:
+    if not samples_ms:
+        return {}
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3),
+            "mean": round(float(np.mean(samples_ms)), 3)}
+
+
+def rss_mb() -> float:
+    """Current resident set size"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def timed(fn, *args, **kwargs) -> Tuple[float, object]:
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return (time.perf_counter() - started) * 1000, result
+
+
+def bench_helpers(corpus: SyntheticCorpus, words: int = 200000) -> Dict:
+    """Throughput of the text helpers on one large text"""
+    from utils.helpers import chunk_text_with_overlap, clean_text
+
+    text = "\n\n".join(corpus.paragraph(words // 20) for _ in range(20))
+    megabytes = len(text.encode("utf-8")) / (1024 * 1024)
+    clean_ms, cleaned = timed(clean_text, text)
+    chunk_ms, chunks = timed(chunk_text_with_overlap, cleaned, 1000, 200)
+    return {
+        "megabytes": round(megabytes, 2),
+        "clean_text_mb_per_second": round(megabytes / (clean_ms / 1000), 2),
+        "chunk_text_mb_per_second": round(megabytes / (chunk_ms / 1000), 2),
+        "chunks": len(chunks),
+    }
+
+
+def bench_corpus(kind: str, count: int, corpus: SyntheticCorpus, workdir: str, args) -> Dict:
+    """Ingest one synthetic corpus, then measure search and answer latency on it"""
+    from backend.document_processor import DocumentProcessor
+    from backend.gemini_handler import GeminiHandler
+    from backend.metrics import REGISTRY
+    from backend.vector_store import VectorStore
+
+    if kind == "scanned" and shutil.which("tesseract") is None:
+        return {"skipped": "tesseract is not installed"}
+
+    directory = os.path.join(workdir, f"{kind}-{count}")
+    paths = corpus.write(kind, os.path.join(directory, "docs"), count)
+    rss_before = rss_mb()
+    REGISTRY.reset()
+
+    # Extraction + cleaning + chunking
+    processor = DocumentProcessor(chunk_size=1000, chunk_overlap=200)
+    chunks, pages = [], 0
+    started = time.perf_counter()
+    for number, path in enumerate(paths):
+        seen_pages = set()
+        for chunk, metadata in processor.iter_chunks(path):
+            seen_pages.add(metadata.get("page"))
+            chunks.append((chunk, {**metadata, "source": os.path.basename(path), "file_id": str(number)}))
+        pages += len(seen_pages)
+    extract_seconds = time.perf_counter() - started
+
+    # Embedding + indexing, in the batch size uploads use
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(directory, "embedding_cache.sqlite")
+    store = VectorStore(os.path.join(directory, "index"), index_type=args.index_type)
+    store.embeddings.embeddings = LatencyEmbeddings(store.embeddings.embeddings, args.embed_latency,
+                                                    args.embed_text_latency)
+    started = time.perf_counter()
+    for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+        batch = chunks[start:start + EMBED_BATCH_SIZE]
+        store.add_documents([chunk for chunk, _ in batch], [metadata for _, metadata in batch])
+    store.flush()
+    index_seconds = time.perf_counter() - started
+    index_bytes = directory_bytes(os.path.join(directory, "index"))
+
+    queries = corpus.queries(args.queries)
+    for query in queries[:5]:
+        store.search(query, k=8)
+    hybrid_ms = [timed(store.search, query, k=8)[0] for query in queries]
+    store.hybrid = False
+    vector_ms = [timed(store.search, query + " (vector)", k=8)[0] for query in queries]
+    store.hybrid = True
+
+    handler = GeminiHandler(vector_store=store, memory_file=None)
+    # Fresh sessions, so every answer takes the same path
+    answer_ms = [timed(handler.answer_question, query, session_id=f"bench-{number}")[0]
+                 for number, query in enumerate(queries[:args.answers])]
+
+    result = {
+        "documents": count,
+        "pages": pages,
+        "chunks": len(chunks),
+        "pages_per_second": round(pages / extract_seconds, 2) if extract_seconds else None,
+        "chunks_per_second": round(len(chunks) / extract_seconds, 2) if extract_seconds else None,
+        "index_chunks_per_second": round(len(chunks) / index_seconds, 2) if index_seconds else None,
+        "index_bytes": index_bytes,
+        "search_ms": percentiles(hybrid_ms),
+        "search_vector_ms": percentiles(vector_ms),
+        "answer_ms": percentiles(answer_ms),
+        "rss_mb": rss_mb(),
+        "rss_growth_mb": round(rss_mb() - rss_before, 1),
+        # Where the time went, from the app's own stage timers
+        "stages": REGISTRY.summary(),
+    }
+    store.close()
+    return result
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def direction(metric: str) -> Optional[str]:
+    """Whether higher or lower is better for a metric; None for plain counts"""
+    leaf = metric.rsplit(".", 1)[-1]
+    if leaf.endswith("_per_second"):
+        return "higher"
+    if leaf in ("p50", "p95", "p99", "mean") or leaf.endswith(("_ms", "_bytes", "_mb")):
+        return "lower"
+    return None
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> Dict:
+    """Relative change of every comparable metric and the ones that regressed"""
+    now, before = flatten(current), flatten(baseline)
+    changes, regressions = {}, []
+    for metric in sorted(set(now) & set(before)):
+        better = direction(metric)
+        if better is None or not before[metric]:
+            continue
+        change = (now[metric] - before[metric]) / abs(before[metric])
+        changes[metric] = round(change, 4)
+        if (change < -tolerance) if better == "higher" else (change > tolerance):
+            regressions.append(metric)
+    return {"tolerance": tolerance, "changes": changes, "regressions": regressions}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Offline ingestion / retrieval / answer benchmarks")
+    parser.add_argument("--scale", default="small,medium",
+                        help=f"comma-separated corpus sizes: {', '.join(f'{k}={v}' for k, v in SCALES.items())} "
+                             "or document counts")
+    parser.add_argument("--kinds", default=",".join(KINDS), help="comma-separated corpus kinds")
+    parser.add_argument("--queries", type=int, default=200, help="search queries per corpus")
+    parser.add_argument("--answers", type=int, default=50, help="answered questions per corpus")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per embedding call")
+    parser.add_argument("--embed-text-latency", type=float, default=0.0, help="extra seconds per embedded text")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds before the first LLM token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0.0, help="LLM streaming rate (0: instant)")
+    parser.add_argument("--embedding-dim", type=int, default=384)
+    parser.add_argument("--index-type", default=None, help="flat, ivf or hnsw (default: VECTOR_INDEX_TYPE)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression")
+    parser.add_argument("--keep", action="store_true", help="keep the generated corpora and indexes")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    configure_offline(args.embedding_dim, args.llm_latency, args.llm_tokens_per_second)
+    sizes = [SCALES[size] if size in SCALES else int(size) for size in args.scale.split(",")]
+    kinds = [kind for kind in args.kinds.split(",") if kind]
+
+    # Every store, cache and log the app creates lands in the scratch directory
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    results = {}
+    try:
+        results["helpers"] = bench_helpers(SyntheticCorpus(seed=args.seed))
+        for kind in kinds:
+            for size in sizes:
+                print(f"Benchmarking {kind} x {size}...", file=sys.stderr)
+                results[f"{kind}-{size}"] = bench_corpus(kind, size, SyntheticCorpus(seed=args.seed), workdir, args)
+        results["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        os.chdir(previous_cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if baseline is not None:
+        report["comparison"] = compare(results, baseline.get("results", {}), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if baseline is not None and report["comparison"]["regressions"]:
+        print(f"Regressed beyond {args.tolerance:.0%}: {', '.join(report['comparison']['regressions'])}",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
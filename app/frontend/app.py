@@ -6,6 +6,7 @@ import sys
 import logging
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from main import DocumentQA
+from backend.metrics import REGISTRY
 
 # Set up logging
 logging.basicConfig(level=logging.INFO,
@@ -25,10 +26,15 @@ if 'session_id' not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
     logger.info(f"New session started: {st.session_state.session_id}")
 
-# Initialize the DocumentQA class (only once per session)
-if 'document_qa' not in st.session_state:
-    logger.info("Initializing DocumentQA instance")
-    st.session_state.document_qa = DocumentQA()
+# Initialize the DocumentQA engine once per process and share it between
+# sessions; only chat history is kept per session (keyed by session_id).
+# It returns at once and loads the index in the background
+@st.cache_resource(show_spinner=False)
+def get_document_qa():
+    logger.info("Initializing shared DocumentQA instance")
+    return DocumentQA()
+
+document_qa = get_document_qa()
 
 # Initialize chat history
 if 'messages' not in st.session_state:
@@ -51,7 +57,7 @@ with st.sidebar:
         
         # Process the document
         with st.spinner("Processing document..."):
-            if st.session_state.document_qa.process_uploaded_document(temp_path, uploaded_file.name):
+            if document_qa.process_uploaded_document(temp_path, uploaded_file.name):
                 st.success(f"Document '{uploaded_file.name}' processed successfully!")
             else:
                 st.error(f"Failed to process document '{uploaded_file.name}'")
@@ -62,10 +68,9 @@ with st.sidebar:
     # Add a clear conversation button
     if st.button("Clear Conversation"):
         st.session_state.messages = []
-        # Also clear the memory in the gemini_handler
-        if hasattr(st.session_state.document_qa, 'gemini_handler'):
-            st.session_state.document_qa.gemini_handler.memory.clear()
-            logger.info("Conversation and memory cleared")
+        # Also clear this session's memory in the shared engine
+        document_qa.clear_memory(st.session_state.session_id)
+        logger.info("Conversation and memory cleared")
         st.rerun()
 
 # Main content
@@ -75,15 +80,43 @@ Ask questions about your uploaded documents. The system will search for relevant
 and provide answers based on the document content.
 """)
 
+# The page is up while the index loads; wait for it before chatting
+if not document_qa.ready:
+    with st.spinner("Loading the document index..."):
+        try:
+            document_qa.wait_until_ready()
+        except RuntimeError as e:
+            st.error(f"Could not load the document index: {e}")
+            st.stop()
+
 # Display debug info in an expander
 with st.expander("Debug Information", expanded=False):
-    if hasattr(st.session_state.document_qa, 'gemini_handler'):
-        chat_history = st.session_state.document_qa.gemini_handler.memory.load_memory_variables({}).get("chat_history", [])
-        st.write(f"Current memory contains {len(chat_history)} messages")
+    startup = document_qa.status()
+    st.write(f"Startup: {startup['state']}, ready after {startup.get('ready_after_s')}s, "
+             f"initial sync {'done' if startup['background_done'] else 'running'}")
+    if document_qa.gemini_handler is not None:
+        memory = document_qa.gemini_handler.get_memory(st.session_state.session_id)
+        chat_history = memory.load_memory_variables({}).get("chat_history", [])
+        st.write(f"Current memory contains {len(chat_history)} messages (~{memory.prompt_tokens()} tokens)")
+        if memory.summary:
+            st.write(f"Running summary: {memory.summary[:300]}")
         if chat_history:
             st.write("Last 3 messages in memory:")
             for i, msg in enumerate(chat_history[-3:]):
                 st.write(f"{i+1}. {type(msg).__name__}: {msg.content[:100]}...")
+    cache_stats = document_qa.vector_store.embeddings.stats()
+    st.write(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+             f"{cache_stats['api_calls']} API calls")
+    answer_stats = document_qa.gemini_handler.answer_cache.stats()
+    st.write(f"Answer cache: {answer_stats['entries']} entries, {answer_stats['exact_hits']} exact hits, "
+             f"{answer_stats['semantic_hits']} similar hits, {answer_stats['misses']} misses")
+    llm_stats = document_qa.gemini_handler.llm_stats()
+    st.write(f"LLM calls: {llm_stats['calls']} made, {llm_stats['coalesced']} coalesced, "
+             f"{llm_stats['retries']} retried, {llm_stats['throttled_seconds']}s throttled")
+    stage_stats = REGISTRY.summary()
+    if stage_stats:
+        st.write("Stage timings since startup (ms):")
+        st.table([{"stage": stage, **stats} for stage, stats in stage_stats.items()])
     st.write(f"Session ID: {st.session_state.session_id}")
     st.write(f"UI message history: {len(st.session_state.messages)} messages")
 
@@ -105,29 +138,37 @@ if prompt := st.chat_input("Ask a question about your documents"):
     with st.chat_message("user"):
         st.markdown(prompt)
     
-    # Generate response
+    # Generate response, rendering tokens as they stream in
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            logger.info(f"Processing question: {prompt}")
-            
-            # Get the response from DocumentQA
-            response = st.session_state.document_qa.ask(prompt)
-            answer = response["answer"]
-            sources = response.get("sources", [])
-            from_kb = response.get("from_kb", False)
-            
-            # Display answer
-            st.markdown(answer)
-            
-            # Display sources if available
-            if sources:
-                with st.expander("Sources"):
-                    for i, source in enumerate(sources, 1):
-                        st.markdown(f"**Source {i}:** {source}")
-            elif not from_kb:
-                st.info("No specific information found in your documents. This answer is based on general knowledge.")
-            
-            logger.info(f"Response generated. Sources: {len(sources)}, From KB: {from_kb}")
+        logger.info(f"Processing question: {prompt}")
+        answer_placeholder = st.empty()
+        answer_placeholder.markdown("Thinking...")
+        answer = ""
+        sources = []
+        from_kb = False
+        
+        for event in document_qa.ask_stream(prompt, session_id=st.session_state.session_id):
+            if event["type"] == "sources":
+                sources = event["sources"]
+                from_kb = event["from_kb"]
+                # Display sources if available
+                if sources:
+                    with st.expander("Sources"):
+                        for i, source in enumerate(sources, 1):
+                            st.markdown(f"**Source {i}:** {source}")
+                elif not from_kb:
+                    st.info("No specific information found in your documents. This answer is based on general knowledge.")
+            elif event["type"] == "token":
+                answer += event["text"]
+                answer_placeholder.markdown(answer + "▌")
+            elif event["type"] == "done":
+                answer = event["answer"]
+            elif event["type"] == "error":
+                answer = f"I'm sorry, I encountered an error: {event['message']}"
+        
+        # Display the final answer without the cursor
+        answer_placeholder.markdown(answer)
+        logger.info(f"Response generated. Sources: {len(sources)}, From KB: {from_kb}")
     
     # Add assistant response to chat history
     st.session_state.messages.append({
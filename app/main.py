@@ -1,74 +1,257 @@
 #main.py
 import os
+import itertools
+import logging
+import threading
 from dotenv import load_dotenv
 from backend.appwrite_client import AppwriteClient
 from backend.document_processor import DocumentProcessor
-from backend.vector_store import VectorStore
 from backend.gemini_handler import GeminiHandler
-from typing import Dict, List
+from backend.ingestion_manifest import IngestionManifest
+from backend.ingestion_pipeline import IngestionPipeline, IngestionResult
+from backend.metrics import span
+from backend.warmup import Warmup
+from utils.helpers import get_file_hash
+from typing import Dict, Iterator, List, Optional, Tuple
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class DocumentQA:
+    # Uploaded documents are embedded this many chunks at a time while they are extracted
+    UPLOAD_EMBED_BATCH_SIZE = 100
+    
     def __init__(self):
-        """Initialize the Document QA system"""
-        self.appwrite_client = AppwriteClient()
+        """Initialize the Document QA system.
+        
+        Returns at once: the index and models load on a background thread,
+        then documents are synced from Appwrite while questions are already
+        being answered. Methods that need the index wait until it is loaded.
+        """
         self.document_processor = DocumentProcessor()
+        self.appwrite_client = None
+        self.vector_store = None
+        self.manifest = None
+        self.gemini_handler = None
+        self.sync_stats = None
+        
+        # One instance is shared by every session in the process; this lock
+        # only keeps two syncs from running at once; uploads never wait on it
+        self._sync_lock = threading.Lock()
+        
+        self.warmup = Warmup("document-qa", self._load, after_ready=self._sync_after_load).start()
+    
+    def _load(self):
+        """Open the index and build the QA handler: everything questions need"""
+        from backend.vector_store import VectorStore
+        self.appwrite_client = AppwriteClient()
         self.vector_store = VectorStore()
+        self.manifest = IngestionManifest(self.vector_store.persist_directory)
+        # The manifest is saved with each index generation, so it never lists
+        # vectors a crash would lose
+        self.vector_store.add_flush_hook(self.manifest.snapshot)
         self.gemini_handler = GeminiHandler(self.vector_store)
-        
-        # Initialize the system by loading documents from Appwrite
-        self.initialize()
+        return self
+    
+    def _sync_after_load(self, _):
+        # Sync documents from Appwrite once the existing index is serving
+        self.sync_stats = self.initialize()
+    
+    @property
+    def ready(self) -> bool:
+        return self.warmup.ready
+    
+    def wait_until_ready(self, timeout: Optional[float] = None):
+        """Block until the index is loaded (RuntimeError if loading failed)"""
+        self.warmup.wait(timeout)
+    
+    def status(self) -> Dict:
+        """Start-up state: loading/ready/failed, and whether the initial sync is done"""
+        return {**self.warmup.status(), "sync_stats": self.sync_stats}
         
     def initialize(self):
-        """Initialize the system by loading documents from Appwrite"""
-        print("Initializing system...")
-        
-        # List documents from Appwrite
-        result = self.appwrite_client.list_documents()
-        files = result.get("files", [])
-        
-        # Process each document if not already in vector store
-        for file in files:
-            # Download and process the document
-            file_path = self.appwrite_client.download_document(file["$id"])
-            if file_path:
+        """Initialize the system by syncing new or changed documents from Appwrite"""
+        self.wait_until_ready()
+        if not self._sync_lock.acquire(blocking=False):
+            logger.info("A bucket sync is already running, skipping this one")
+            return None
+        try:
+            return self._sync_bucket()
+        finally:
+            self._sync_lock.release()
+    
+    def _sync_bucket(self):
+        logger.info("Initializing system...")
+        
+        # Read-only replicas serve the index another process keeps in sync
+        if self.vector_store.read_only:
+            logger.info("Vector store is read-only, skipping bucket sync")
+            return {"skipped": 0, "ingested": 0, "removed": 0, "failed": 0}
+        
+        # A manifest without an index (e.g. faiss_index/ was wiped) is meaningless
+        if self.vector_store.is_empty() and len(self.manifest):
+            logger.info("Vector store is empty, discarding stale ingestion manifest")
+            self.manifest.clear()
+        elif not self.vector_store.is_empty() and not os.path.exists(self.manifest.path):
+            self._adopt_existing_index()
+        
+        # Files uploaded while the sync runs are missing from the listing but
+        # are not stale, so only files known before listing can be removed
+        known = set(self.manifest.file_ids())
+        seen = set()
+        stats = {"skipped": 0, "ingested": 0, "removed": 0, "failed": 0}
+        listing = {"complete": False}
+        
+        def changed_files():
+            try:
+                for file in self.appwrite_client.list_all_documents():
+                    seen.add(file["$id"])
+                    # Unchanged files are skipped without being downloaded
+                    if self.manifest.is_current(file):
+                        stats["skipped"] += 1
+                        continue
+                    yield file
+                listing["complete"] = True
+            except Exception:
+                # Files listed so far are still ingested
+                logger.exception("Error listing documents")
+        
+        def previous_hash(file_id):
+            entry = self.manifest.get(file_id)
+            return entry.get("content_hash") if entry else None
+        
+        pipeline = IngestionPipeline(self.appwrite_client, self.vector_store,
+                                     chunk_size=self.document_processor.chunk_size,
+                                     chunk_overlap=self.document_processor.chunk_overlap)
+        try:
+            for result in pipeline.run(changed_files(), previous_hash):
                 try:
-                    # Process the document
-                    chunks = self.document_processor.process_document(file_path)
-                    
-                    # Add document chunks to vector store
-                    metadatas = [{"source": file["name"], "file_id": file["$id"]} for _ in chunks]
-                    self.vector_store.add_documents(chunks, metadatas)
-                    
-                    print(f"Processed document: {file['name']}")
-                except Exception as e:
-                    print(f"Error processing document {file['name']}: {e}")
-                finally:
-                    # Clean up the temporary file
-                    os.remove(file_path)
+                    self._record_sync_result(result)
+                except Exception:
+                    logger.exception(f"Error recording document {result.file.get('name', result.file['$id'])}")
+                    stats["failed"] += 1
+                    continue
+                if result.status == IngestionResult.FAILED:
+                    stats["failed"] += 1
+                    continue
+                stats["ingested" if result.status == IngestionResult.INGESTED else "skipped"] += 1
+        except Exception:
+            logger.exception("Ingestion pipeline failed")
+            self._save_manifest()
+            return stats
+        
+        if not listing["complete"]:
+            # A partial listing must not be mistaken for deleted files
+            self._save_manifest()
+            return stats
+        
+        # Drop vectors for files that no longer exist in the bucket
+        for file_id in known - seen:
+            # Vectors go first: a manifest saved in between still lists the file
+            self.vector_store.delete_document(file_id)
+            entry = self.manifest.remove(file_id) or {}
+            stats["removed"] += 1
+            logger.info(f"Removed document: {entry.get('name', file_id)}")
+        
+        self._save_manifest()
+        logger.info(f"Sync complete: {stats['ingested']} ingested, {stats['skipped']} unchanged, "
+                    f"{stats['removed']} removed, {stats['failed']} failed")
+        return stats
     
+    def _save_manifest(self):
+        """Flush the index now; its flush hook then writes the manifest"""
+        self.vector_store.flush()
+    
+    def _adopt_existing_index(self):
+        """Seed the manifest from an index built before manifests existed.
+        
+        The adopted entries have no content hash, so each file is re-ingested
+        once and its old (possibly duplicated) vectors are replaced.
+        """
+        for file_id, vector_ids in self.vector_store.ids_by_file_id().items():
+            self.manifest.record({"$id": file_id}, None, vector_ids)
+        logger.info(f"Adopted {len(self.manifest)} files from existing vector store")
+    
+    def _record_sync_result(self, result: IngestionResult):
+        """Apply one pipeline result to the vector store and manifest"""
+        file = result.file
+        entry = self.manifest.get(file["$id"])
+        
+        if result.status == IngestionResult.FAILED:
+            logger.error(f"Error processing document {file.get('name', file['$id'])}: {result.error}",
+                         exc_info=result.error)
+            return
+        
+        # Metadata changed but the bytes did not: just refresh the manifest
+        if result.status == IngestionResult.UNCHANGED:
+            self.manifest.record(file, result.content_hash, entry.get("vector_ids", []) if entry else [])
+            return
+        
+        # Replace any stale vectors from a previous version of the file
+        if entry:
+            self.vector_store.delete(entry.get("vector_ids", []))
+        self.manifest.record(file, result.content_hash, result.vector_ids)
+        logger.info(f"Processed document: {file['name']}")
     
     def process_uploaded_document(self, file_path: str, file_name: str) -> bool:
         """Process an uploaded document and store it in Appwrite"""
         try:
-            # Process the document to extract text chunks
-            chunks = self.document_processor.process_document(file_path)
+            self.wait_until_ready()
+            # Stream text chunks page by page; pulling the first one before
+            # uploading makes unsupported files fail early
+            chunks = self.document_processor.iter_chunks(file_path)
+            first = next(chunks, None)
+            content_hash = get_file_hash(file_path)
             
             # Upload the document to Appwrite
-            file_id = self.appwrite_client.upload_document(file_path, file_name)
+            with span("upload"):
+                file_id = self.appwrite_client.upload_document(file_path, file_name)
             if not file_id:
                 return False
                 
-            # Add document chunks to vector store
-            metadatas = [{"source": file_name, "file_id": file_id} for _ in chunks]
-            self.vector_store.add_documents(chunks, metadatas)
+            # Embed chunks in batches as they are extracted
+            vector_ids = []
+            try:
+                chunks = itertools.chain([first], chunks) if first else chunks
+                while True:
+                    batch = list(itertools.islice(chunks, self.UPLOAD_EMBED_BATCH_SIZE))
+                    if not batch:
+                        break
+                    texts = [chunk for chunk, _ in batch]
+                    metadatas = [{**metadata, "source": file_name, "file_id": file_id} for _, metadata in batch]
+                    vector_ids.extend(self.vector_store.add_documents(texts, metadatas))
+            except Exception:
+                # Do not leave a partially indexed document behind
+                self.vector_store.delete(vector_ids)
+                raise
+            
+            # Record it so the next startup does not ingest it again; the
+            # missing $updatedAt is reconciled via the content hash
+            self.manifest.record({"$id": file_id, "name": file_name}, content_hash, vector_ids)
+            self._save_manifest()
             
             return True
-        except Exception as e:
-            print(f"Error processing uploaded document: {e}")
+        except Exception:
+            logger.exception(f"Error processing uploaded document {file_name}")
             return False
     
-    def ask(self, question: str) -> Dict:
+    def ask(self, question: str, session_id: Optional[str] = None) -> Dict:
         """Ask a question about the documents"""
-        return self.gemini_handler.answer_question(question)
+        self.wait_until_ready()
+        return self.gemini_handler.answer_question(question, session_id=session_id)
+    
+    def ask_stream(self, question: str, session_id: Optional[str] = None) -> Iterator[Dict]:
+        """Ask a question, yielding the sources and then the answer tokens as they arrive"""
+        self.wait_until_ready()
+        return self.gemini_handler.stream_answer(question, session_id=session_id)
+    
+    def ask_many(self, questions: List[str], concurrency: Optional[int] = None) -> Iterator[Tuple[int, Dict]]:
+        """Ask independent questions, yielding (index, response) as each answer completes"""
+        self.wait_until_ready()
+        return self.gemini_handler.answer_many(questions, concurrency=concurrency)
+    
+    def clear_memory(self, session_id: Optional[str] = None):
+        """Clear the conversation memory for a session"""
+        self.wait_until_ready()
+        self.gemini_handler.clear_memory(session_id)
@@ -0,0 +1,14 @@
+# conftest.py
+import os
+import sys
+
+# Tests run offline: local hashing embeddings, the stub LLM and no on-disk caches
+os.environ.update({
+    "EMBEDDING_BACKEND": "local",
+    "LLM_BACKEND": "stub",
+    "EMBEDDING_CACHE_PATH": "",
+    "OCR_CACHE_PATH": "",
+    "LLM_RATE_LIMIT_PATH": "",
+})
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
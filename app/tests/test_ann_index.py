@@ -0,0 +1,67 @@
+# test_ann_index.py
+import numpy as np
+import pytest
+from backend.ann_index import (INDEX_FLAT, INDEX_HNSW, INDEX_IVF, INDEX_KINDS, build_populated,
+                               excluding_params, index_kind, reconstruct_all)
+from backend.vector_store import VectorStore
+
+TEXTS = [f"chunk {i} about topic{i % 7} in course CS-{100 + i % 5}" for i in range(150)]
+
+
+def random_vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize("kind", INDEX_KINDS)
+def test_built_indexes_round_trip_their_vectors(kind):
+    labels = np.arange(100, 400, dtype=np.int64)
+    vectors = random_vectors(300)
+    index = build_populated(kind, labels, vectors)
+    assert index_kind(index) == kind
+    found_labels, found_vectors = reconstruct_all(index)
+    order = np.argsort(found_labels)
+    assert found_labels[order].tolist() == labels.tolist()
+    np.testing.assert_allclose(found_vectors[order], vectors, rtol=1e-6)
+
+
+@pytest.mark.parametrize("kind", INDEX_KINDS)
+def test_excluded_labels_are_skipped_inside_the_search(kind):
+    labels = np.arange(300, dtype=np.int64)
+    vectors = random_vectors(300)
+    index = build_populated(kind, labels, vectors)
+    if kind == INDEX_IVF:
+        index.nprobe = index.nlist
+    _, found = index.search(vectors[:1], 1)
+    assert found[0][0] == 0
+    _, found = index.search(vectors[:1], 5, params=excluding_params(index, np.array([0])))
+    assert 0 not in found[0].tolist()
+
+
+@pytest.mark.parametrize("kind", [INDEX_IVF, INDEX_HNSW])
+def test_a_flat_store_is_promoted_once_it_reaches_promote_at(tmp_path, kind):
+    store = VectorStore(str(tmp_path / "index"), index_type=kind, promote_at=100, min_recall=0.01)
+    try:
+        store.add_documents(TEXTS[:99], [{"file_id": "a"}] * 99)
+        assert index_kind(store.index) == INDEX_FLAT
+        store.add_documents(TEXTS[99:], [{"file_id": "b"}] * 51)
+        for _ in range(100):
+            if store._rebuild_log is None and index_kind(store.index) == kind:
+                break
+            store._closed.wait(0.05)
+        assert index_kind(store.index) == kind
+        assert store.index.ntotal == 150
+        assert store.search(TEXTS[120], k=1)[0]["content"] == TEXTS[120]
+    finally:
+        store.close()
+
+
+def test_an_index_below_the_recall_floor_is_not_adopted(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), index_type=INDEX_FLAT, min_recall=1.01)
+    try:
+        store.add_documents(TEXTS, [{"file_id": "a"}] * len(TEXTS))
+        report = store.rebuild_index(kind=INDEX_HNSW)
+        assert not report["rebuilt"]
+        assert index_kind(store.index) == INDEX_FLAT
+        assert store._retry_promotion_at == 2 * len(TEXTS)
+    finally:
+        store.close()
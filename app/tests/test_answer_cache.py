@@ -0,0 +1,79 @@
+# test_answer_cache.py
+import pytest
+from backend.answer_cache import AnswerCache
+from backend.ann_index import INDEX_FLAT
+from backend.conversation_store import ConversationStore
+from backend.gemini_handler import GeminiHandler
+from backend.vector_store import VectorStore
+
+ANSWER = {"answer": "Room B.204", "sources": ["CS-101 meets in room B.204"], "from_kb": True}
+
+
+def test_exact_hits_ignore_case_spacing_and_trailing_punctuation():
+    cache = AnswerCache()
+    cache.put("Where does CS-101 meet?", ANSWER)
+    assert cache.get_exact("  where does  cs-101 meet ") == ANSWER
+    assert cache.get_exact("where does CS-102 meet") is None
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_similar_questions_hit_above_the_threshold_only():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put("where does CS-101 meet", ANSWER, embedding=[1.0, 0.0])
+    assert cache.get_similar([0.99, 0.05]) == ANSWER
+    assert cache.get_similar([0.5, 0.5]) is None
+    assert cache.stats() == {"entries": 1, "exact_hits": 0, "semantic_hits": 1, "misses": 1}
+
+
+def test_a_new_store_version_empties_the_cache():
+    cache = AnswerCache()
+    # Lookups come first and tag the cache with the version they saw
+    assert cache.get_exact("question", version=1) is None
+    cache.put("question", ANSWER, version=1)
+    assert cache.get_exact("question", version=1) == ANSWER
+    assert cache.get_exact("question", version=2) is None
+    # An answer generated from the old version is not stored
+    cache.put("question", ANSWER, version=1)
+    assert cache.get_exact("question", version=2) is None
+
+
+def test_entries_expire_and_the_least_recently_used_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("backend.answer_cache.time.monotonic", lambda: now[0])
+    cache = AnswerCache(max_entries=2, ttl=60)
+    cache.put("one", ANSWER)
+    cache.put("two", ANSWER)
+    cache.get_exact("one")
+    cache.put("three", ANSWER)
+    assert cache.get_exact("two") is None
+    assert cache.get_exact("one") == ANSWER
+    now[0] += 61
+    assert cache.get_exact("three") is None
+
+
+@pytest.fixture
+def handler(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), index_type=INDEX_FLAT)
+    store.add_documents(["CS-101 lectures meet in room B.204 on Mondays",
+                         "The biology lab schedule is posted every semester"],
+                        [{"file_id": "a", "source": "a.txt"}, {"file_id": "b", "source": "b.txt"}])
+    handler = GeminiHandler(store, memory_file=None,
+                            conversation_store=ConversationStore(str(tmp_path / "conversations.sqlite")))
+    yield handler
+    store.close()
+
+
+def test_repeated_questions_are_answered_from_the_cache(handler):
+    first = handler.answer_question("Where do the CS-101 lectures meet?")
+    assert first["from_kb"] and "cached" not in first
+    calls = handler.llm.stats()["calls"]
+    again = handler.answer_question("where do the CS-101 lectures meet")
+    assert again["cached"]
+    assert again["answer"] == first["answer"]
+    assert handler.llm.stats()["calls"] == calls
+
+
+def test_adding_documents_invalidates_cached_answers(handler):
+    handler.answer_question("Where do the CS-101 lectures meet?")
+    handler.vector_store.add_documents(["CS-101 moved to room C.310"], [{"file_id": "c"}])
+    assert "cached" not in handler.answer_question("Where do the CS-101 lectures meet?")
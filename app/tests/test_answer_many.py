@@ -0,0 +1,73 @@
+# test_answer_many.py
+import threading
+import time
+import pytest
+from backend.ann_index import INDEX_FLAT
+from backend.conversation_store import ConversationStore
+from backend.gemini_handler import GeminiHandler
+from backend.vector_store import VectorStore
+
+QUESTIONS = [f"What is taught in week {n} of the CS-101 course?" for n in range(12)]
+
+
+@pytest.fixture
+def handler(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), index_type=INDEX_FLAT)
+    store.add_documents([f"Week {n} of CS-101 covers topic{n}" for n in range(12)],
+                        [{"file_id": "syllabus", "source": "syllabus.txt"}] * 12)
+    handler = GeminiHandler(store, memory_file=None,
+                            conversation_store=ConversationStore(str(tmp_path / "conversations.sqlite")))
+    yield handler
+    store.close()
+
+
+def test_every_question_is_answered_once(handler):
+    answers = dict(handler.answer_many(QUESTIONS + ["  "], concurrency=4))
+    assert sorted(answers) == list(range(len(QUESTIONS) + 1))
+    assert all(answers[i]["from_kb"] and answers[i]["sources"] for i in range(len(QUESTIONS)))
+    assert answers[len(QUESTIONS)]["answer"].startswith("I received an empty question")
+
+
+def test_llm_calls_never_exceed_the_concurrency(handler, monkeypatch):
+    invoke = handler.llm.invoke
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def counting_invoke(prompt, **kwargs):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        try:
+            time.sleep(0.02)
+            return invoke(prompt, **kwargs)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    monkeypatch.setattr(handler.llm, "invoke", counting_invoke)
+    assert len(list(handler.answer_many(QUESTIONS, concurrency=3))) == len(QUESTIONS)
+    assert 1 < peak[0] <= 3
+
+
+def test_the_batch_is_embedded_and_searched_together(handler, monkeypatch):
+    calls = {"embed": 0, "search": 0}
+    embed_queries, search_many = handler.vector_store.embeddings.embed_queries, handler.vector_store.search_many
+
+    def counted(name, fn):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return fn(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(handler.vector_store.embeddings, "embed_queries", counted("embed", embed_queries))
+    monkeypatch.setattr(handler.vector_store, "search_many", counted("search", search_many))
+    list(handler.answer_many(QUESTIONS, concurrency=2))
+    assert calls == {"embed": 1, "search": 1}
+
+
+def test_cached_answers_are_yielded_without_an_llm_call(handler):
+    first = dict(handler.answer_many(QUESTIONS[:2]))
+    calls = handler.llm.stats()["calls"]
+    again = dict(handler.answer_many(QUESTIONS[:2]))
+    assert all(again[i]["cached"] and again[i]["answer"] == first[i]["answer"] for i in range(2))
+    assert handler.llm.stats()["calls"] == calls
@@ -0,0 +1,58 @@
+# test_context_packer.py
+from backend.context_packer import ContextPacker
+from backend.conversation_memory import estimate_tokens
+
+DOCUMENT = " ".join(f"word{n}" for n in range(200))
+
+
+def chunk(start, end, file_id="a", text=DOCUMENT):
+    return {"content": text[start:end], "metadata": {"file_id": file_id, "start_index": start}}
+
+
+def test_overlapping_and_adjacent_chunks_of_a_file_are_merged():
+    other = "lab safety rules for the chemistry building"
+    results = [chunk(100, 300), chunk(0, 150), chunk(300, 400), chunk(0, 40, file_id="b", text=other)]
+    packed = ContextPacker(token_budget=1000).pack(results)
+    assert [p["content"] for p in packed] == [DOCUMENT[0:400], other[0:40]]
+    assert packed[0]["metadata"]["start_index"] == 0
+
+
+def test_chunks_far_apart_stay_separate_in_rank_order():
+    results = [chunk(600, 700), chunk(0, 100)]
+    packed = ContextPacker(token_budget=1000).pack(results)
+    assert [p["content"] for p in packed] == [DOCUMENT[600:700], DOCUMENT[0:100]]
+
+
+def test_near_duplicates_from_other_files_are_dropped():
+    text = "CS-101 lectures meet in room B.204 on Mondays and Wednesdays at nine"
+    results = [
+        {"content": text, "metadata": {"file_id": "a"}},
+        {"content": text + " sharp", "metadata": {"file_id": "b"}},
+        {"content": "The biology lab schedule is posted each semester", "metadata": {"file_id": "c"}},
+    ]
+    packed = ContextPacker(token_budget=1000).pack(results)
+    assert [p["metadata"]["file_id"] for p in packed] == ["a", "c"]
+
+
+def test_passages_are_cut_to_the_token_budget():
+    results = [{"content": DOCUMENT, "metadata": {}}, {"content": "another passage", "metadata": {}}]
+    packer = ContextPacker(token_budget=100, min_fragment_tokens=10)
+    packed = packer.pack(results)
+    assert len(packed) == 1
+    assert packed[0]["content"].endswith(" ...")
+    assert DOCUMENT.startswith(packed[0]["content"][:-4])
+    assert estimate_tokens(packed[0]["content"]) <= 100 + 2
+
+
+def test_a_fragment_below_the_minimum_is_not_sent():
+    short = "a short first passage about exams"
+    results = [{"content": short, "metadata": {}}, {"content": DOCUMENT, "metadata": {}}]
+    budget = estimate_tokens(short) + 20
+    packed = ContextPacker(token_budget=budget, min_fragment_tokens=50).pack(results)
+    assert [p["content"] for p in packed] == [short]
+
+
+def test_scores_and_other_keys_are_passed_through():
+    packed = ContextPacker(token_budget=1000).pack([{**chunk(0, 50), "rrf": 0.03, "distance": 0.4}])
+    assert packed[0]["rrf"] == 0.03 and packed[0]["distance"] == 0.4
+    assert "rank" not in packed[0]
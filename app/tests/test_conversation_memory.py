@@ -0,0 +1,83 @@
+# test_conversation_memory.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import HumanMessage, SystemMessage
+from backend.conversation_memory import SUMMARY_PREFIX, RollingSummaryMemory, estimate_tokens
+
+TURN = ("q" * 40, "a" * 40)   # 22 estimated tokens
+
+
+class InlineExecutor:
+    """Runs submitted work on the calling thread"""
+
+    def submit(self, fn):
+        fn()
+
+
+def save(memory, turns):
+    for question, answer in turns:
+        memory.save_context({"input": question}, {"output": answer})
+
+
+def test_without_a_summarizer_every_turn_is_kept():
+    memory = RollingSummaryMemory(token_budget=10)
+    save(memory, [TURN] * 5)
+    assert len(memory.load_memory_variables({})["chat_history"]) == 10
+
+
+def test_turns_over_the_budget_are_folded_into_the_summary():
+    folded = []
+
+    def summarize(summary, turns):
+        folded.extend(turns)
+        return f"{summary} +{len(turns)}".strip()
+
+    memory = RollingSummaryMemory(token_budget=50, summarize=summarize, executor=InlineExecutor())
+    save(memory, [(f"question {n} " + "x" * 60, f"answer {n}") for n in range(6)])
+    messages = memory.messages()
+    assert isinstance(messages[0], SystemMessage)
+    assert messages[0].content.startswith(SUMMARY_PREFIX)
+    assert [m.content for m in messages[1:] if isinstance(m, HumanMessage)][-1].startswith("question 5")
+    assert [question for question, _ in folded][0].startswith("question 0")
+    assert memory.prompt_tokens() <= 50 + estimate_tokens(memory.summary)
+
+
+def test_the_latest_turn_is_kept_even_if_it_alone_exceeds_the_budget():
+    memory = RollingSummaryMemory(token_budget=5, summarize=lambda summary, turns: "short",
+                                  executor=InlineExecutor())
+    save(memory, [TURN, TURN])
+    assert [m.content for m in memory.messages()] == [SUMMARY_PREFIX + "short", *TURN]
+
+
+def test_folded_turns_stay_verbatim_until_the_summary_is_written():
+    release = threading.Event()
+
+    def summarize(summary, turns):
+        release.wait(5)
+        return "summary"
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        memory = RollingSummaryMemory(token_budget=30, summarize=summarize, executor=executor)
+        save(memory, [TURN, TURN])
+        # Saving did not wait for the summarizer, and nothing is lost meanwhile
+        assert len(memory.messages()) == 4
+        release.set()
+    assert [m.content for m in memory.messages()] == [SUMMARY_PREFIX + "summary", *TURN]
+
+
+def test_a_failing_summarizer_bounds_the_folded_turns():
+    def summarize(summary, turns):
+        raise RuntimeError("503 unavailable")
+
+    memory = RollingSummaryMemory(token_budget=30, summarize=summarize, executor=InlineExecutor())
+    save(memory, [TURN] * 10)
+    assert memory.summary == ""
+    assert memory.prompt_tokens() <= 2 * 30 + estimate_tokens("")
+
+
+def test_clear_forgets_turns_and_summary():
+    memory = RollingSummaryMemory(token_budget=5, summarize=lambda summary, turns: "s", executor=InlineExecutor())
+    save(memory, [TURN, TURN])
+    memory.clear()
+    assert memory.messages() == []
+    assert memory.prompt_tokens() == estimate_tokens("")
@@ -0,0 +1,76 @@
+# test_conversation_store.py
+import pickle
+import threading
+import pytest
+from backend.conversation_store import ConversationStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ConversationStore(str(tmp_path / "logs" / "conversations.sqlite"))
+    yield store
+    store.close()
+
+
+def test_tail_returns_the_latest_turns_oldest_first(store):
+    for number in range(5):
+        store.append("s1", f"question {number}", f"answer {number}")
+    store.append("s2", "other question", "other answer")
+    assert store.tail("s1", 2) == [("question 3", "answer 3"), ("question 4", "answer 4")]
+    assert store.tail("s2", 10) == [("other question", "other answer")]
+    assert store.tail("missing", 10) == []
+
+
+def test_clear_drops_only_that_session(store):
+    store.append_many("s1", [("q1", "a1"), ("q2", "a2")])
+    store.append("s2", "q", "a")
+    store.clear("s1")
+    assert not store.has_session("s1")
+    assert store.has_session("s2")
+
+
+def test_compact_trims_long_and_idle_sessions(store, monkeypatch):
+    store.keep_turns = 3
+    store.append_many("long", [(f"q{n}", f"a{n}") for n in range(10)])
+    monkeypatch.setattr("backend.conversation_store.time.time", lambda: 0.0)
+    store.append("idle", "q", "a")
+    monkeypatch.undo()
+    assert store.compact() == 8
+    assert store.tail("long", 10) == [("q7", "a7"), ("q8", "a8"), ("q9", "a9")]
+    assert not store.has_session("idle")
+
+
+def test_threads_append_through_their_own_connections(store):
+    def chat(session):
+        for number in range(20):
+            store.append(session, f"q{number}", f"a{number}")
+
+    threads = [threading.Thread(target=chat, args=(f"s{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(len(store.tail(f"s{n}", 100)) == 20 for n in range(4))
+
+
+def test_a_pickled_memory_is_imported_into_the_default_session_once(tmp_path):
+    from langchain.memory import ConversationBufferMemory
+    from backend.gemini_handler import GeminiHandler
+
+    # What older versions pickled on every turn
+    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    memory.save_context({"input": "hi"}, {"output": "hello"})
+    memory.save_context({"input": "where is B.204"}, {"output": "second floor"})
+    memory_file = tmp_path / "conversation_memory.pkl"
+    memory_file.write_bytes(pickle.dumps(memory))
+    conversations = ConversationStore(str(tmp_path / "conversations.sqlite"))
+    try:
+        handler = GeminiHandler(memory_file=str(memory_file), conversation_store=conversations)
+        assert conversations.tail(GeminiHandler.DEFAULT_SESSION, 10) == [("hi", "hello"),
+                                                                          ("where is B.204", "second floor")]
+        assert not memory_file.exists()
+        assert handler.import_memory_file(str(memory_file)) == 0
+        handler.save_turn("and B.205?", "next door", session_id="s1")
+        assert handler.get_relevant_history(session_id="s1")[-1].content == "next door"
+    finally:
+        conversations.close()
@@ -0,0 +1,83 @@
+# test_delete_documents.py
+import pytest
+from backend.ann_index import INDEX_FLAT, INDEX_HNSW, index_kind
+from backend.vector_store import VectorStore
+
+TEXTS = [f"chunk {i} about topic{i % 7} in course CS-{100 + i % 5}" for i in range(60)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), index_type=INDEX_FLAT)
+    yield store
+    store.close()
+
+
+def add(store, texts=TEXTS, files=10):
+    return store.add_documents(texts, [{"file_id": f"file-{i % files}", "source": f"{i}.txt"}
+                                       for i in range(len(texts))])
+
+
+def file_ids(results):
+    return {result["metadata"]["file_id"] for result in results}
+
+
+def test_deleted_chunks_are_tombstoned_and_never_returned(store):
+    add(store)
+    assert store.delete_document("file-3") == 6
+    assert len(store) == 54
+    assert len(store._tombstones) == 6
+    store.hybrid = False
+    results = store.search("chunk 3 about topic3", k=20)
+    assert len(results) == 20
+    assert "file-3" not in file_ids(results)
+
+
+@pytest.mark.parametrize("kind", [INDEX_FLAT, INDEX_HNSW])
+def test_compaction_drops_tombstoned_vectors(tmp_path, kind):
+    store = VectorStore(str(tmp_path / "index"), index_type=INDEX_FLAT, min_recall=0.01)
+    try:
+        ids = add(store)
+        if kind != INDEX_FLAT:
+            assert store.rebuild_index(kind=kind)["rebuilt"]
+        assert index_kind(store.index) == kind
+        store.delete(ids[:20])
+        report = store.compact()
+        assert report["compacted"] == 20
+        assert not store._tombstones
+        assert store.index.ntotal == 40
+        assert len(store.lexical) == 40
+        assert {r["content"] for r in store.search("chunk", k=60)} == set(TEXTS[20:])
+    finally:
+        store.close()
+
+
+def test_deletes_past_the_threshold_start_a_background_compaction(store):
+    store.compact_min = 5
+    store.compact_ratio = 0.0
+    add(store)
+    store.delete_document("file-1")
+    for _ in range(100):
+        if not store._compacting and not store._tombstones:
+            break
+        store._closed.wait(0.05)
+    assert not store._tombstones
+    assert store.index.ntotal == 54
+
+
+def test_replace_document_swaps_a_files_chunks(store):
+    add(store)
+    ids = store.replace_document("file-4", ["new text about zebras", "more about zebras"])
+    assert len(ids) == 2
+    assert len(store) == 56
+    assert sorted(store.ids_by_file_id()["file-4"]) == sorted(ids)
+    store.hybrid = False
+    assert {r["content"] for r in store.search("chunk", k=60) if r["metadata"]["file_id"] == "file-4"} == \
+        {"new text about zebras", "more about zebras"}
+
+
+def test_replacing_with_no_chunks_deletes_the_file(store):
+    add(store)
+    assert store.replace_document("file-4", []) == []
+    assert "file-4" not in store.ids_by_file_id()
+    assert len(store) == 54
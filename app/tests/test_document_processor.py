@@ -0,0 +1,106 @@
+# test_document_processor.py
+import random
+import pytest
+from backend.document_processor import DocumentProcessor
+from utils.helpers import clean_text
+
+WORDS = ["the", "course", "CS-101", "room", "B.204", "exam", "schedule", "lecture", "notes", "a",
+         "semester", "credits", "prerequisite", "laboratory", "assignment", "1 of 3", "\n", "\n\n", "  "]
+
+
+class PagedProcessor(DocumentProcessor):
+    """Serves fixed pages instead of reading a file"""
+
+    def __init__(self, pages, **kwargs):
+        super().__init__(**kwargs)
+        self.pages = pages
+
+    def iter_pages(self, document_path):
+        yield from enumerate(self.pages, 1)
+
+
+def random_pages(rng: random.Random, chunk_size: int):
+    pages = []
+    for _ in range(rng.randint(1, 12)):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(0, 120))]
+        if rng.random() < 0.2:
+            # Words longer than a chunk are split character-wise
+            words.insert(rng.randint(0, len(words)), "x" * rng.randint(chunk_size // 2, chunk_size * 2))
+        pages.append(" ".join(words))
+    return pages
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_iter_chunks_matches_splitting_the_whole_text(seed):
+    rng = random.Random(seed)
+    chunk_size = rng.choice([40, 80, 150])
+    pages = random_pages(rng, chunk_size)
+    processor = PagedProcessor(pages, chunk_size=chunk_size, chunk_overlap=chunk_size // 5)
+    processor.stream_buffer_size = rng.choice([chunk_size, chunk_size * 2, chunk_size * 4])
+
+    whole = " ".join(text for text in (clean_text(page) for page in pages) if text)
+    expected = processor._split_with_offsets(whole)
+    streamed = list(processor.iter_chunks("pages"))
+
+    assert [chunk for chunk, _ in streamed] == processor.text_splitter.split_text(whole)
+    assert [(chunk, metadata["start_index"]) for chunk, metadata in streamed] == expected
+
+
+def test_iter_chunks_reports_the_page_a_chunk_starts_on():
+    pages = ["alpha " * 30, "", "beta " * 30]
+    processor = PagedProcessor(pages, chunk_size=50, chunk_overlap=0)
+    chunks = list(processor.iter_chunks("pages"))
+    assert chunks[0][1]["page"] == 1
+    assert chunks[-1][1]["page"] == 3
+    assert all(("alpha" in chunk) == (metadata["page"] == 1) for chunk, metadata in chunks)
+
+
+def test_iter_chunks_hard_splits_text_without_spaces(monkeypatch):
+    pages = ["x" * 1000 for _ in range(20)]
+    processor = PagedProcessor(pages, chunk_size=50, chunk_overlap=10)
+    split = processor._split_with_offsets
+    longest = []
+
+    def recording_split(text):
+        longest.append(len(text))
+        return split(text)
+
+    monkeypatch.setattr(processor, "_split_with_offsets", recording_split)
+    chunks = list(processor.iter_chunks("pages"))
+    assert max(longest) < processor.max_stream_buffer_size + 1001
+    assert all(len(chunk) <= 50 for chunk, _ in chunks)
+    assert sum(len(chunk) for chunk, _ in chunks) >= 20000
+    assert chunks[-1][1]["page"] == 20
+
+
+class FakePage:
+    def __init__(self, text):
+        self.text = text
+
+    def extract_text(self):
+        if isinstance(self.text, Exception):
+            raise self.text
+        return self.text
+
+
+def fake_pdf(monkeypatch, texts):
+    import pypdf
+
+    class FakeReader:
+        def __init__(self, path):
+            self.pages = [FakePage(text) for text in texts]
+
+    monkeypatch.setattr(pypdf, "PdfReader", FakeReader)
+
+
+def test_iter_pdf_pages_raises_when_a_later_page_fails(monkeypatch):
+    fake_pdf(monkeypatch, ["first page", ValueError("corrupt page")])
+    pages = DocumentProcessor().iter_pdf_pages("broken.pdf")
+    assert next(pages) == (1, "first page")
+    with pytest.raises(ValueError):
+        next(pages)
+
+
+def test_iter_pdf_pages_yields_nothing_for_an_unreadable_pdf(monkeypatch):
+    fake_pdf(monkeypatch, [ValueError("corrupt page")])
+    assert list(DocumentProcessor().iter_pdf_pages("broken.pdf")) == []
@@ -0,0 +1,79 @@
+# test_embedding_cache.py
+import pytest
+from langchain_core.embeddings import Embeddings
+from backend.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(Embeddings):
+    """Embeds a text as (length, vowels) and records every batch it is sent"""
+
+    def __init__(self):
+        self.batches = []
+        self.queries = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text)), float(sum(text.count(v) for v in "aeiou"))] for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 0.5]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache" / "embeddings.sqlite"))
+    yield cache
+    cache.close()
+
+
+def test_only_misses_reach_the_model(cache):
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, "model-a", cache)
+    first = embeddings.embed_documents(["alpha", "beta"])
+    second = embeddings.embed_documents(["beta", "gamma", "alpha"])
+    assert model.batches == [["alpha", "beta"], ["gamma"]]
+    assert second[0] == first[1] and second[2] == first[0]
+    assert embeddings.stats() == {"hits": 2, "misses": 3, "api_calls": 2, "hit_rate": 0.4}
+
+
+def test_duplicates_are_embedded_once_and_misses_are_batched(cache):
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, "model-a", cache, batch_size=2)
+    vectors = embeddings.embed_documents(["a", "b", "a", "c", "d", "b"])
+    assert model.batches == [["a", "b"], ["c", "d"]]
+    assert vectors[0] == vectors[2] and vectors[1] == vectors[5]
+
+
+def test_keys_separate_models_and_query_from_document_embeddings(cache):
+    model = CountingEmbeddings()
+    CachedEmbeddings(model, "model-a", cache).embed_documents(["alpha"])
+    CachedEmbeddings(model, "model-b", cache).embed_documents(["alpha"])
+    embeddings = CachedEmbeddings(model, "model-a", cache)
+    assert embeddings.embed_query("alpha") == [5.0, 0.5]
+    assert embeddings.embed_query("alpha") == [5.0, 0.5]
+    assert model.batches == [["alpha"], ["alpha"]]
+    assert model.queries == ["alpha"]
+    assert len(cache) == 3
+
+
+def test_vectors_persist_across_instances(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path)
+    CachedEmbeddings(CountingEmbeddings(), "model-a", cache).embed_documents(["alpha"])
+    cache.close()
+
+    model = CountingEmbeddings()
+    reopened = EmbeddingCache(path)
+    try:
+        assert CachedEmbeddings(model, "model-a", reopened).embed_documents(["alpha"]) == [[5.0, 2.0]]
+        assert model.batches == []
+    finally:
+        reopened.close()
+
+
+def test_batched_queries_fall_back_to_one_call_per_query(cache):
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, "model-a", cache)
+    assert embeddings.embed_queries(["x", "yy", "x"]) == [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]]
+    assert model.queries == ["x", "yy"]
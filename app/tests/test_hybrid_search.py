@@ -0,0 +1,45 @@
+# test_hybrid_search.py
+import pytest
+from backend.ann_index import INDEX_FLAT
+from backend.vector_store import VectorStore
+
+TEXTS = [f"chunk {i} about topic{i % 7} in course CS-{100 + i % 5}" for i in range(60)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), index_type=INDEX_FLAT)
+    store.add_documents(TEXTS, [{"file_id": f"file-{i % 10}"} for i in range(len(TEXTS))])
+    yield store
+    store.close()
+
+
+def test_dense_results_carry_only_the_distance(store):
+    store.hybrid = False
+    results = store.search("chunk about a topic", k=5)
+    assert len(results) == 5
+    assert all(set(r) == {"content", "metadata", "distance"} for r in results)
+    distances = [r["distance"] for r in results]
+    assert distances == sorted(distances)
+
+
+def test_hybrid_results_are_ordered_by_the_fused_score(store):
+    store.lexical_fast_path_margin = 0
+    results = store.search("topic3 course", k=10)
+    assert len(results) == 10
+    assert all("rrf" in r and ("distance" in r or "bm25" in r) for r in results)
+    fused = [r["rrf"] for r in results]
+    assert fused == sorted(fused, reverse=True)
+
+
+def test_a_confident_keyword_hit_skips_the_embedding(store, monkeypatch):
+    store.add_documents(["zebras graze in course ZOO-101"], [{"file_id": "zoo"}])
+    monkeypatch.setattr(store.embeddings, "embed_query", lambda query: pytest.fail("embedded"))
+    results = store.search("zebras ZOO-101", k=4)
+    assert [r["content"] for r in results] == ["zebras graze in course ZOO-101"]
+    assert set(results[0]) == {"content", "metadata", "bm25"}
+
+
+def test_an_ambiguous_keyword_query_falls_back_to_hybrid_search(store):
+    assert store.lexical_fast_path("topic3 course", k=4) is None
+    assert store.lexical_fast_path("topic3", k=4) is None
@@ -0,0 +1,95 @@
+# test_index_generations.py
+import json
+import os
+import pytest
+from backend.ann_index import INDEX_FLAT
+from backend.ingestion_manifest import IngestionManifest
+from backend.vector_store import VectorStore
+
+TEXTS = [f"chunk {i} about topic{i % 7} in course CS-{100 + i % 5}" for i in range(60)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), index_type=INDEX_FLAT)
+    yield store
+    store.close()
+
+
+def add(store, texts=TEXTS, files=10):
+    return store.add_documents(texts, [{"file_id": f"file-{i % files}", "source": f"{i}.txt"}
+                                       for i in range(len(texts))])
+
+
+def test_flush_publishes_a_generation_that_reloads(tmp_path, store):
+    ids = add(store)
+    store.delete(ids[:5])
+    store.flush()
+    first = store.persistence.current_generation()
+    store.add_documents(["a late addition about zebras"], [{"file_id": "late"}])
+    store.flush()
+    assert store.persistence.current_generation() == first + 1
+    # Only the published generation is kept on disk
+    assert not os.path.exists(tmp_path / "index" / f"index-{first}.faiss")
+    store.close()
+
+    reopened = VectorStore(str(tmp_path / "index"))
+    try:
+        assert len(reopened) == 56
+        assert reopened._tombstones == store._tombstones
+        assert reopened._next_label == 61
+        assert len(reopened.lexical) == 56
+        assert reopened.search("zebras", k=1)[0]["content"] == "a late addition about zebras"
+        assert not {r["content"] for r in reopened.search("chunk", k=60)} & set(TEXTS[:5])
+    finally:
+        reopened.close()
+
+
+def test_unflushed_changes_are_not_published(tmp_path, store):
+    add(store)
+    store.flush()
+    store.add_documents(["never flushed"], [{"file_id": "late"}])
+    reader = VectorStore(str(tmp_path / "index"), read_only=True)
+    try:
+        assert len(reader) == 60
+        assert all(r["content"] != "never flushed" for r in reader.search("never flushed", k=5))
+    finally:
+        reader.close()
+
+
+def saved_files(manifest):
+    if not os.path.exists(manifest.path):
+        return set()
+    with open(manifest.path, encoding="utf-8") as f:
+        return set(json.load(f)["files"])
+
+
+def test_manifest_is_saved_only_with_the_generation_it_describes(store):
+    manifest = IngestionManifest(store.persist_directory)
+    store.add_flush_hook(manifest.snapshot)
+    ids = store.add_documents(["first file"], [{"file_id": "a"}])
+    manifest.record({"$id": "a"}, "hash-a", ids)
+    assert saved_files(manifest) == set()
+
+    store.flush()
+    assert saved_files(manifest) == {"a"}
+    # A clean flush still writes entries recorded since the last one
+    manifest.record({"$id": "a", "name": "renamed"}, "hash-a", ids)
+    store.flush()
+    with open(manifest.path, encoding="utf-8") as f:
+        assert json.load(f)["files"]["a"]["name"] == "renamed"
+
+
+def test_manifest_entries_recorded_after_the_snapshot_wait_for_the_next_flush(store):
+    manifest = IngestionManifest(store.persist_directory)
+    store.add_documents(["first file"], [{"file_id": "a"}])
+    manifest.record({"$id": "a"}, "hash-a", [])
+
+    def late_record():
+        writer = manifest.snapshot()
+        manifest.record({"$id": "b"}, "hash-b", [])
+        return writer
+
+    store.add_flush_hook(late_record)
+    store.flush()
+    assert saved_files(manifest) == {"a"}
@@ -0,0 +1,114 @@
+# test_ingestion_manifest.py
+import os
+import tempfile
+import time
+import pytest
+from backend.ingestion_manifest import IngestionManifest
+
+FILE = {"$id": "f1", "name": "syllabus.txt", "$updatedAt": "2024-01-01T00:00:00"}
+
+
+def test_recorded_entries_survive_a_reload(tmp_path):
+    manifest = IngestionManifest(str(tmp_path))
+    manifest.record(FILE, "hash-1", ["v1", "v2"])
+    manifest.save()
+    reloaded = IngestionManifest(str(tmp_path))
+    assert reloaded.file_ids() == ["f1"]
+    assert reloaded.get("f1")["vector_ids"] == ["v1", "v2"]
+    assert reloaded.get("f1")["chunk_count"] == 2
+
+
+def test_is_current_compares_signature_then_updated_at(tmp_path):
+    manifest = IngestionManifest(str(tmp_path))
+    assert not manifest.is_current(FILE)
+    manifest.record(FILE, "hash-1", [])
+    assert manifest.is_current(FILE)
+    assert not manifest.is_current({**FILE, "$updatedAt": "2024-02-01T00:00:00"})
+
+    manifest.record({**FILE, "signature": "abc"}, "hash-1", [])
+    assert manifest.is_current({**FILE, "$updatedAt": "later", "signature": "abc"})
+    assert not manifest.is_current({**FILE, "signature": "def"})
+
+
+def test_entries_without_updated_at_are_never_current(tmp_path):
+    manifest = IngestionManifest(str(tmp_path))
+    manifest.record({"$id": "uploaded", "name": "notes.txt"}, "hash-1", [])
+    assert not manifest.is_current({"$id": "uploaded", "$updatedAt": None})
+
+
+def test_a_corrupt_manifest_loads_as_empty(tmp_path):
+    (tmp_path / IngestionManifest.FILE_NAME).write_text("{not json", encoding="utf-8")
+    assert len(IngestionManifest(str(tmp_path))) == 0
+
+
+def test_snapshot_writes_the_entries_as_they_were(tmp_path):
+    manifest = IngestionManifest(str(tmp_path))
+    manifest.record(FILE, "hash-1", [])
+    write = manifest.snapshot()
+    manifest.remove("f1")
+    write()
+    assert IngestionManifest(str(tmp_path)).file_ids() == ["f1"]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+class FakeAppwrite:
+    """Serves an in-memory bucket of text files"""
+
+    def __init__(self):
+        self.files = {}
+        self.downloads = []
+
+    def put(self, file_id, text, updated_at):
+        self.files[file_id] = {"$id": file_id, "name": f"{file_id}.txt", "$updatedAt": updated_at, "text": text}
+
+    def list_all_documents(self):
+        for file in self.files.values():
+            yield {key: value for key, value in file.items() if key != "text"}
+
+    def download_document(self, file_id):
+        self.downloads.append(file_id)
+        fd, path = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.files[file_id]["text"])
+        return path
+
+
+@pytest.fixture
+def qa(tmp_path, monkeypatch):
+    import main
+
+    bucket = FakeAppwrite()
+    bucket.put("a", "algorithms course notes " * 20, "1")
+    bucket.put("b", "biology lab schedule " * 20, "1")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("INGEST_EXTRACT_WORKERS", "0")
+    monkeypatch.setattr(main, "AppwriteClient", lambda: bucket)
+    qa = main.DocumentQA()
+    deadline = time.monotonic() + 30
+    while qa.sync_stats is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    yield qa, bucket
+    qa.vector_store.close()
+
+
+def test_startup_sync_ingests_each_file_once(qa):
+    qa, bucket = qa
+    assert qa.sync_stats == {"skipped": 0, "ingested": 2, "removed": 0, "failed": 0}
+    assert sorted(qa.manifest.file_ids()) == ["a", "b"]
+
+    bucket.downloads.clear()
+    assert qa.initialize() == {"skipped": 2, "ingested": 0, "removed": 0, "failed": 0}
+    assert bucket.downloads == []
+
+
+def test_sync_replaces_changed_files_and_drops_removed_ones(qa):
+    qa, bucket = qa
+    old_ids = qa.manifest.get("a")["vector_ids"]
+    bucket.put("a", "advanced algebra revision " * 20, "2")
+    del bucket.files["b"]
+    assert qa.initialize() == {"skipped": 0, "ingested": 1, "removed": 1, "failed": 0}
+    assert qa.manifest.file_ids() == ["a"]
+    assert set(qa.vector_store.ids_by_file_id()) == {"a"}
+    assert not set(old_ids) & set(qa.vector_store.ids_by_file_id()["a"])
+    # The manifest on disk was written with the flushed index
+    assert IngestionManifest(qa.vector_store.persist_directory).file_ids() == ["a"]
@@ -0,0 +1,223 @@
+# test_llm_client.py
+import threading
+import time
+import pytest
+from backend.llm_client import ResilientLLM, SingleFlight, TokenBucket, is_retryable
+
+
+class FlakyLLM:
+    """Chat model double that fails with the given errors before answering"""
+
+    model = "flaky"
+
+    def __init__(self, errors=(), chunks=("hello", " world"), fail_after_first_chunk=False):
+        self.errors = list(errors)
+        self.chunks = chunks
+        self.fail_after_first_chunk = fail_after_first_chunk
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "".join(self.chunks)
+
+    def stream(self, prompt):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        for number, chunk in enumerate(self.chunks):
+            if number == 1 and self.fail_after_first_chunk:
+                raise RuntimeError("503 unavailable")
+            yield chunk
+
+
+def test_token_bucket_allows_a_burst_then_waits():
+    bucket = TokenBucket("test", rate_per_minute=600, burst=2)
+    assert bucket.acquire() < 0.05
+    assert bucket.acquire() < 0.05
+    # 10 tokens a second: the next one takes about 0.1s
+    assert 0.05 < bucket.acquire() < 1.0
+
+
+def test_token_bucket_raises_when_no_token_before_the_deadline():
+    bucket = TokenBucket("test", rate_per_minute=1, burst=1)
+    bucket.acquire()
+    with pytest.raises(TimeoutError):
+        bucket.acquire(deadline=time.monotonic() + 0.1)
+
+
+def test_token_buckets_on_the_same_path_share_their_tokens(tmp_path):
+    path = str(tmp_path / "limits.sqlite")
+    first = TokenBucket("model", rate_per_minute=1, burst=1, path=path)
+    second = TokenBucket("model", rate_per_minute=1, burst=1, path=path)
+    other = TokenBucket("other-model", rate_per_minute=1, burst=1, path=path)
+    first.acquire()
+    with pytest.raises(TimeoutError):
+        second.acquire(deadline=time.monotonic() + 0.1)
+    assert other.acquire() < 0.05
+
+
+def run_concurrently(target, count):
+    results = [None] * count
+    errors = [None] * count
+
+    def run(number):
+        try:
+            results[number] = target()
+        except Exception as e:
+            errors[number] = e
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_single_flight_runs_identical_calls_once():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    leader, leader_results, _ = run_concurrently(lambda: flight.do("key", slow_call), 1)
+    started.wait(5)
+    followers, results, _ = run_concurrently(lambda: flight.do("key", slow_call, timeout=5), 4)
+    while flight.coalesced < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in leader + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert leader_results + results == ["answer"] * 5
+    # Once the call has finished the next one runs again
+    assert flight.do("key", lambda: "fresh") == "fresh"
+
+
+def test_single_flight_shares_errors_with_waiting_callers():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing_call():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    leader, _, leader_errors = run_concurrently(lambda: flight.do("key", failing_call), 1)
+    started.wait(5)
+    followers, _, errors = run_concurrently(lambda: flight.do("key", failing_call, timeout=5), 2)
+    while flight.coalesced < 2:
+        time.sleep(0.01)
+    release.set()
+    for thread in leader + followers:
+        thread.join(5)
+    assert all(isinstance(error, ValueError) for error in leader_errors + errors)
+
+
+def test_single_flight_stream_replays_chunks_to_late_joiners():
+    flight = SingleFlight()
+    first_sent, release = threading.Event(), threading.Event()
+
+    def chunks():
+        yield "a"
+        first_sent.set()
+        release.wait(5)
+        yield "b"
+        yield "c"
+
+    leader = flight.stream("key", chunks)
+    assert next(leader) == "a"
+    first_sent.wait(5)
+    follower = flight.stream("key", chunks)
+    release.set()
+    assert list(leader) == ["b", "c"]
+    assert list(follower) == ["a", "b", "c"]
+    assert flight.coalesced == 1
+
+
+def test_is_retryable_recognises_quota_and_overload_errors():
+    assert is_retryable(RuntimeError("429 Resource exhausted"))
+    assert is_retryable(RuntimeError("503 Service Unavailable"))
+    assert not is_retryable(ValueError("400 invalid argument"))
+
+
+def test_resilient_llm_retries_transient_errors():
+    llm = FlakyLLM(errors=[RuntimeError("429 quota exceeded"), RuntimeError("503 unavailable")])
+    client = ResilientLLM(llm, base_delay=0.001, max_delay=0.01)
+    assert client.invoke("question") == "hello world"
+    assert llm.calls == 3
+    assert client.stats()["retries"] == 2
+    assert client.stats()["calls"] == 3
+
+
+def test_resilient_llm_does_not_retry_permanent_errors():
+    llm = FlakyLLM(errors=[ValueError("400 invalid argument")])
+    client = ResilientLLM(llm, base_delay=0.001)
+    with pytest.raises(ValueError):
+        client.invoke("question")
+    assert llm.calls == 1
+
+
+def test_resilient_llm_gives_up_at_the_deadline():
+    llm = FlakyLLM(errors=[RuntimeError("429 quota exceeded")] * 1000)
+    client = ResilientLLM(llm, deadline=0.2, base_delay=0.05, max_delay=0.05)
+    started = time.monotonic()
+    with pytest.raises(RuntimeError):
+        client.invoke("question")
+    assert time.monotonic() - started < 1.0
+
+
+def test_resilient_llm_draws_from_the_rate_limiter():
+    bucket = TokenBucket("flaky", rate_per_minute=1, burst=1)
+    client = ResilientLLM(FlakyLLM(), limiter=bucket, deadline=0.2)
+    client.invoke("first")
+    with pytest.raises(TimeoutError):
+        client.invoke("second")
+
+
+def test_resilient_llm_retries_a_stream_only_before_its_first_chunk():
+    llm = FlakyLLM(errors=[RuntimeError("429 quota exceeded")])
+    client = ResilientLLM(llm, base_delay=0.001)
+    assert list(client.stream("question")) == ["hello", " world"]
+    assert llm.calls == 2
+
+    llm = FlakyLLM(fail_after_first_chunk=True)
+    client = ResilientLLM(llm, base_delay=0.001)
+    received = []
+    with pytest.raises(RuntimeError):
+        for chunk in client.stream("question"):
+            received.append(chunk)
+    assert received == ["hello"]
+    assert llm.calls == 1
+
+
+def test_resilient_llm_coalesces_identical_prompts_only():
+    release = threading.Event()
+
+    class SlowLLM(FlakyLLM):
+        def invoke(self, prompt):
+            release.wait(5)
+            return super().invoke(prompt)
+
+    llm = SlowLLM()
+    client = ResilientLLM(llm)
+    answers = []
+    threads = [threading.Thread(target=lambda prompt=prompt: answers.append(client.invoke(prompt)))
+               for prompt in ("same", "same", "same", "other")]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while (client.stats()["calls"] < 2 or client.single_flight.coalesced < 2) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert answers == ["hello world"] * 4
+    assert llm.calls == 2
+    assert client.stats()["coalesced"] == 2
@@ -0,0 +1,119 @@
+# test_read_only_replica.py
+import pytest
+from backend.ann_index import INDEX_FLAT, INDEX_HNSW, INDEX_IVF, index_kind
+from backend.vector_store import VectorStore
+
+TEXTS = [f"chunk {i} about topic{i % 7} in course CS-{100 + i % 5}" for i in range(300)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), index_type=INDEX_FLAT, min_recall=0.01)
+    yield store
+    store.close()
+
+
+def add(store, texts=TEXTS, files=10):
+    return store.add_documents(texts, [{"file_id": f"file-{i % files}", "source": f"{i}.txt"}
+                                       for i in range(len(texts))])
+
+
+def file_ids(results):
+    return {result["metadata"]["file_id"] for result in results}
+
+
+@pytest.mark.parametrize("kind", [INDEX_FLAT, INDEX_IVF, INDEX_HNSW])
+def test_replica_memory_maps_every_index_kind(tmp_path, store, kind):
+    add(store)
+    if kind != INDEX_FLAT:
+        assert store.rebuild_index(kind=kind)["rebuilt"]
+    store.flush()
+
+    replica = VectorStore(str(tmp_path / "index"), read_only=True)
+    try:
+        assert replica.index is not None
+        assert index_kind(replica.index) == kind
+        assert len(replica) == 300
+        replica.hybrid = False
+        assert replica.search(TEXTS[42], k=1)[0]["content"] == TEXTS[42]
+    finally:
+        replica.close()
+
+
+@pytest.mark.parametrize("kind", [INDEX_IVF, INDEX_HNSW])
+def test_replica_reloads_a_generation_of_another_kind(tmp_path, store, kind):
+    add(store)
+    store.flush()
+    replica = VectorStore(str(tmp_path / "index"), read_only=True)
+    replica.reload_interval = 0
+    try:
+        assert index_kind(replica.index) == INDEX_FLAT
+        assert store.rebuild_index(kind=kind)["rebuilt"]
+        store.flush()
+        replica.hybrid = False
+        assert replica.search(TEXTS[7], k=1)[0]["content"] == TEXTS[7]
+        assert index_kind(replica.index) == kind
+        assert replica._generation == store.persistence.current_generation()
+    finally:
+        replica.close()
+
+
+def test_read_only_replica_follows_new_generations(tmp_path, store):
+    add(store)
+    store.flush()
+    replica = VectorStore(str(tmp_path / "index"), read_only=True)
+    replica.reload_interval = 0
+    try:
+        assert len(replica) == 300
+        store.delete_document("file-0")
+        store.add_documents(["a late addition about zebras"], [{"file_id": "late"}])
+        store.flush()
+
+        assert replica.search("zebras", k=1)[0]["content"] == "a late addition about zebras"
+        assert len(replica) == 271
+        assert len(replica.lexical) == 271
+        assert "file-0" not in file_ids(replica.search("chunk 0 about topic0", k=20))
+
+        store.compact()
+        store.flush()
+        replica.search("zebras", k=1)
+        assert replica._generation == store.persistence.current_generation()
+        assert not replica._tombstones
+        assert len(replica.lexical) == 271
+    finally:
+        replica.close()
+
+
+def test_replica_reload_reads_only_the_changed_labels(tmp_path, store, monkeypatch):
+    add(store)
+    store.flush()
+    replica = VectorStore(str(tmp_path / "index"), read_only=True)
+    replica.reload_interval = 0
+    try:
+        monkeypatch.setattr(replica, "_load_lexical", lambda next_label: pytest.fail("full rebuild"))
+        store.delete_document("file-1")
+        store.add_documents(["a late addition about zebras"], [{"file_id": "late"}])
+        store.flush()
+        replica.search("zebras", k=1)
+        assert replica._generation == store.persistence.current_generation()
+        assert set(replica.lexical.doc_len) == set(store.lexical.doc_len) - store._tombstones
+    finally:
+        replica.close()
+
+
+def test_replica_skipping_a_compacted_generation_drops_its_deletes(tmp_path, store):
+    add(store)
+    store.flush()
+    replica = VectorStore(str(tmp_path / "index"), read_only=True)
+    try:
+        store.delete_document("file-2")
+        store.flush()
+        store.compact()
+        store.flush()
+        replica.reload_interval = 0
+        replica.search("chunk", k=1)
+        assert len(replica) == 270
+        assert set(replica.lexical.doc_len) == set(store.lexical.doc_len)
+        assert "file-2" not in file_ids(replica.search("chunk 2 about topic2", k=20))
+    finally:
+        replica.close()
@@ -0,0 +1,27 @@
+# test_vector_store.py
+import pytest
+from backend.ann_index import INDEX_FLAT
+from backend.vector_store import VectorStore
+
+TEXTS = [f"chunk {i} about topic{i % 7} in course CS-{100 + i % 5}" for i in range(60)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VectorStore(str(tmp_path / "index"), index_type=INDEX_FLAT)
+    yield store
+    store.close()
+
+
+def add(store, texts=TEXTS, files=10):
+    return store.add_documents(texts, [{"file_id": f"file-{i % files}", "source": f"{i}.txt"}
+                                       for i in range(len(texts))])
+
+
+def test_search_with_threshold_keeps_only_relevant_hits(store):
+    add(store)
+    results = store.search_with_threshold(TEXTS[4], k=10, score_threshold=0.0)
+    assert results[0]["content"] == TEXTS[4]
+    assert results[0]["relevance"] == pytest.approx(1.0, abs=1e-4)
+    assert all(r["relevance"] >= 0.0 for r in results)
+    assert [r["content"] for r in store.search_with_threshold(TEXTS[4], k=10, score_threshold=0.999)] == [TEXTS[4]]
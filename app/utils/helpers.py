@@ -44,6 +44,15 @@
     
 #     return chunks
 import re
+import hashlib
+
+def get_file_hash(file_path: str) -> str:
+    """Generate a SHA-256 hash of a file's contents"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
 
 def clean_text(text: str) -> str:
     """Clean and normalize text"""
@@ -94,7 +103,10 @@ def chunk_text_with_overlap(text: str, chunk_size: int, overlap: int) -> list:
                 end = natural_break + 1  # Include the break character
         
         chunks.append(text[start:end].strip())
-        start = end - overlap
+        if end >= len(text):
+            break
+        # Always move forward, even if a natural break falls inside the overlap
+        start = max(end - overlap, start + 1)
     
     return chunks
 